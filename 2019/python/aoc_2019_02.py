@@ -1,8 +1,13 @@
 """Day 2: 1202 Program Alarm"""
+
 from typing import List, Optional
 
+import numpy as np
+
 import aoc
 from intcode import IntCode, parse_program
+from intcode_batch import BatchIntCode
+from intcode_symbolic import run_symbolic, solve, symbol
 
 DAY = 2
 
@@ -21,13 +26,29 @@ def solve_part_one(input_data: List[int]) -> int:
 
 
 def solve_part_two(input_data: List[int]) -> Optional[int]:
-    for noun in range(100):
-        for verb in range(100):
-            data = patch_input(input_data, noun, verb)
-            executed_data = IntCode.execute_program(data)
-            if executed_data[0] == 19690720:
-                return 100 * noun + verb
-    return None
+    # Position 0 ends up as an expression in the noun and verb, to solve.
+    result = run_symbolic(input_data, {1: symbol("noun"), 2: symbol("verb")})
+    ranges = {"noun": range(100), "verb": range(100)}
+    for solution in solve(result.memory_at(0), 19690720, ranges, result.assumptions):
+        return 100 * solution["noun"] + solution["verb"]
+    if not result.assumptions:
+        return None
+    # The expression only holds under its assumptions, so other nouns and
+    # verbs could still work.
+    return solve_part_two_by_search(input_data)
+
+
+def solve_part_two_by_search(input_data: List[int]) -> Optional[int]:
+    # Try every noun and verb at once, as one row of a batch each.
+    nouns, verbs = np.divmod(np.arange(100 * 100), 100)
+    batch = BatchIntCode(input_data, count=len(nouns))
+    batch.memory[:, 1] = nouns
+    batch.memory[:, 2] = verbs
+    batch.run()
+    (found,) = np.nonzero(batch.halted & (batch.memory[:, 0] == 19690720))
+    if not found.size:
+        return None
+    return int(100 * nouns[found[0]] + verbs[found[0]])
 
 
 if __name__ == "__main__":
@@ -1,13 +1,15 @@
 """Day 5: Sunny with a Chance of Asteroids"""
-from typing import List, Tuple
+
+from typing import Tuple
 
 import aoc
-from intcode import IntCode, parse_program
+from intcode import IntCode, PagedMemory
+from intcode_image import load_program
 
 DAY = 5
 
 
-def main(program: List[int]) -> Tuple[int, int]:
+def main(program: PagedMemory) -> Tuple[int, int]:
     # Part one: provide 1 as input
     computer = IntCode(program)
     computer.pass_input(1)
@@ -27,7 +29,7 @@ def main(program: List[int]) -> Tuple[int, int]:
 
 
 if __name__ == "__main__":
-    program = parse_program(aoc.load_puzzle_input(2019, DAY))
+    program = load_program(aoc.load_puzzle_input(2019, DAY))
     part_one_solution, part_two_solution = main(program)
     assert (
         part_one_solution == 7566643
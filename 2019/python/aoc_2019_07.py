@@ -1,84 +1,131 @@
 """Day 7: Amplification Circuit"""
-from itertools import permutations
-from typing import List, Tuple
+
+from itertools import permutations, starmap
+from multiprocessing import Pool
+from typing import Callable, Dict, List, Sequence, Tuple
 
 import pytest
 
 import aoc
-from intcode import HaltExecution, IntCode, parse_program
+from intcode import IntCode, PagedMemory, parse_program
 
 DAY = 7
 
 
-def max_of_single_amp_run(program: List[int], phase_range: range = range(5)) -> int:
-    possible_phases = permutations(phase_range)
-    max_output = 0
-
-    for phases in possible_phases:
-        amps = [IntCode(program) for _ in phase_range]
-        for amp, phase in zip(amps, phases):
-            amp.pass_input(phase)
-
-        amps[0].pass_input(0)
-        amps[0].run_until_halt()
-
-        for idx, amp_b in enumerate(amps[1:], start=1):
-            amp_b.pass_input(amps[idx - 1].read_output())
-            amp_b.run_until_halt()
-
-        last_amp_output = amps[-1].read_output()
-        if last_amp_output > max_output:
-            max_output = last_amp_output
-
-    return max_output
-
-
-class OutputSignal(Exception):
-    pass
-
-
-def max_of_feedback_loop(program: List[int], phase_range: range = range(5, 10)) -> int:
-    possible_phases = permutations(phase_range)
-    max_output = 0
-
-    for phases in possible_phases:
-        result = perform_feedback_loop(program, phases)
-        if result > max_output:
-            max_output = result
-
-    return max_output
+def max_of_single_amp_run(
+    program: List[int], phase_range: range = range(5), processes: int = 1
+) -> int:
+    return _search(_best_single_run, program, phase_range, processes)
+
+
+def max_of_feedback_loop(
+    program: List[int], phase_range: range = range(5, 10), processes: int = 1
+) -> int:
+    return _search(_best_feedback_loop, program, phase_range, processes)
+
+
+def _search(
+    subtree_search: Callable[[List[int], int, Tuple[int, ...]], int],
+    program: List[int],
+    phase_range: range,
+    processes: int,
+) -> int:
+    """Search the permutations of phases depth-first, by first phase.
+
+    Permutations sharing a prefix of phases share the amplifier runs for it,
+    so the search runs an amplifier for each node of the permutation tree,
+    rather than every amplifier for each permutation. The subtrees for each
+    first phase can be searched in a pool of processes.
+    """
+    subtrees = [
+        (program, first, tuple(phase for phase in phase_range if phase != first))
+        for first in phase_range
+    ]
+    if processes > 1:
+        with Pool(processes) as pool:
+            return max(pool.starmap(subtree_search, subtrees), default=0)
+    return max(starmap(subtree_search, subtrees), default=0)
+
+
+def _best_single_run(program: List[int], first: int, rest: Tuple[int, ...]) -> int:
+    image = PagedMemory(program)
+    # Amps that have read their phase, to be cloned for each input signal.
+    phased: Dict[int, IntCode] = {}
+    # An amp's output depends only on its phase and input signal.
+    outputs: Dict[Tuple[int, int], int] = {}
+
+    def amplify(phase: int, signal: int) -> int:
+        if (phase, signal) not in outputs:
+            if phase not in phased:
+                phased[phase] = IntCode(image)
+                phased[phase].pass_input(phase)
+                phased[phase].run()
+            amp = phased[phase].clone()
+            amp.pass_input(signal)
+            amp.run_until_halt()
+            outputs[phase, signal] = amp.read_output()
+        return outputs[phase, signal]
+
+    def best(signal: int, remaining: Tuple[int, ...]) -> int:
+        if not remaining:
+            return signal
+        return max(
+            best(amplify(phase, signal), remaining[:i] + remaining[i + 1 :])
+            for i, phase in enumerate(remaining)
+        )
 
+    return best(amplify(first, 0), rest)
 
-def perform_feedback_loop(program: List[int], phases: Tuple[int, ...]) -> int:
-    def make_bufferer_and_signaller(amp: IntCode):
-        def inner(value: int):
-            amp.output_queue.append(value)
-            raise OutputSignal(value)
 
-        return inner
+def _best_feedback_loop(program: List[int], first: int, rest: Tuple[int, ...]) -> int:
+    image = PagedMemory(program)
 
-    amps = [IntCode(program, description=f"Amp {i}") for i in phases]
-    for amp, phase in zip(amps, phases):
+    def start_amp(phase: int, signals: Sequence[int]) -> Tuple[IntCode, List[int]]:
+        """Run an amp until it's passed its first signals on."""
+        amp = IntCode(image, description=f"Amp {phase}")
         amp.pass_input(phase)
-        amp.output_action = make_bufferer_and_signaller(amp)  # type: ignore
-
-    amps[0].pass_input(0)
-    current_index = 0
-    current_amp = amps[current_index]
-    still_running = len(amps)
-    while still_running > 0:
-        try:
-            while True:
-                current_amp.step()
-        except OutputSignal as exc:
-            value = exc.args[0]
-        except HaltExecution:
-            still_running -= 1
-            value = current_amp.output_queue.pop()  # Last output value from the amp
-        current_index = (current_index + 1) % len(phases)
-        current_amp = amps[current_index]
-        current_amp.pass_input(value)
-    return value
+        amp.feed(signals)
+        amp.run()
+        return amp, list(amp.drain())
+
+    def best(
+        amps: List[IntCode], signals: List[int], remaining: Tuple[int, ...]
+    ) -> int:
+        if not remaining:
+            # Other permutations share these amps, so close the loop on clones.
+            return close_loop([amp.clone() for amp in amps[:-1]] + amps[-1:], signals)
+        results = []
+        for i, phase in enumerate(remaining):
+            amp, outputs = start_amp(phase, signals)
+            results.append(
+                best(amps + [amp], outputs, remaining[:i] + remaining[i + 1 :])
+            )
+        return max(results)
+
+    amp, outputs = start_amp(first, [0])
+    return best([amp], outputs, rest)
+
+
+def close_loop(amps: List[IntCode], signals: List[int]) -> int:
+    """Feed the last amp's signals back to the first until the last halts.
+
+    Returns the last amp's final output.
+    """
+    last_output = signals[-1] if signals else None
+    while not amps[-1].has_halted():
+        progressed = False
+        for amp in amps:
+            amp.feed(signals)
+            amp.run()
+            signals = list(amp.drain())
+            progressed |= bool(signals)
+        if signals:
+            last_output = signals[-1]
+        if not progressed:
+            raise RuntimeError("Feedback loop is deadlocked.")
+    if last_output is None:
+        raise RuntimeError("Feedback loop produced no output.")
+    return last_output
 
 
 def main(program: List[int]) -> Tuple[int, int]:
@@ -144,6 +191,35 @@ def test_max_of_feedback_loop(program: List[int], expected_result: int) -> None:
     assert max_of_feedback_loop(program) == expected_result
 
 
+def test_wider_phase_ranges() -> None:
+    # Outputs its input signal times ten plus its phase.
+    program = [3, 15, 3, 16, 1002, 16, 10, 16, 1, 16, 15, 15, 4, 15, 99, 0, 0]
+    assert max_of_single_amp_run(program, range(7)) == 6543210
+    assert max_of_single_amp_run(program, range(6), processes=2) == 543210
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_feedback_search_matches_every_permutation(processes: int) -> None:
+    program = [
+        # fmt: off
+        3, 52, 1001, 52, -5, 52, 3, 53, 1, 52, 56, 54, 1007, 54, 5, 55,
+        1005, 55, 26, 1001, 54, -5, 54, 1105, 1, 12, 1, 53, 54, 53,
+        1008, 54, 0, 55, 1001, 55, 1, 55, 2, 53, 55, 53, 4, 53, 1001,
+        56, -1, 56, 1005, 56, 6, 99, 0, 0, 0, 0, 10
+        # fmt: on
+    ]
+    phase_range = range(5, 10)
+
+    def run_loop(phases: Tuple[int, ...]) -> int:
+        amps = [IntCode(program) for _ in phases]
+        for amp, phase in zip(amps, phases):
+            amp.pass_input(phase)
+        return close_loop(amps, [0])
+
+    expected = max(map(run_loop, permutations(phase_range)))
+    assert max_of_feedback_loop(program, phase_range, processes) == expected
+
+
 if __name__ == "__main__":
     program = parse_program(aoc.load_puzzle_input(2019, DAY))
     part_one_solution, part_two_solution = main(program)
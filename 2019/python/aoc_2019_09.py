@@ -1,13 +1,15 @@
 """Day 9: Sensor Boost"""
-from typing import List, Tuple
+
+from typing import Tuple
 
 import aoc
-from intcode import IntCode, parse_program
+from intcode import IntCode, PagedMemory
+from intcode_image import load_program
 
 DAY = 9
 
 
-def main(program: List[int]) -> Tuple[int, int]:
+def main(program: PagedMemory) -> Tuple[int, int]:
     boost_test = IntCode(program)
     boost_test.pass_input(1)
     boost_test.run_until_halt()
@@ -15,7 +17,7 @@ def main(program: List[int]) -> Tuple[int, int]:
         print(f"Failed BOOST test for instruction: {boost_test.read_output()}")
     boost_keycode = boost_test.read_output()
 
-    boosted_sensors = IntCode(program)
+    boosted_sensors = IntCode(program, engine="compiled")
     boosted_sensors.pass_input(2)
     boosted_sensors.run_until_halt()
     distress_signal_coords = boosted_sensors.read_output()
@@ -24,7 +26,7 @@ def main(program: List[int]) -> Tuple[int, int]:
 
 
 if __name__ == "__main__":
-    program = parse_program(aoc.load_puzzle_input(2019, DAY))
+    program = load_program(aoc.load_puzzle_input(2019, DAY))
     part_one_solution, part_two_solution = main(program)
     print(
         aoc.format_solution(
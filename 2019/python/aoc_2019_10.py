@@ -1,15 +1,34 @@
 """Day 10: Monitoring Station"""
+
 from collections import defaultdict, deque
 from functools import partial
+from itertools import chain
 from math import atan2, gcd, sqrt
-from typing import DefaultDict, Deque, Iterable, Iterator, List, NamedTuple, Set, Tuple
+from typing import (
+    DefaultDict,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Set,
+    Tuple,
+)
 
+import numpy as np
 import pytest
 
 import aoc
 
 DAY = 10
 
+# Bounds the size of the arrays of pairs of asteroids worked on at once.
+_MAX_CHUNK_PAIRS = 1 << 21
+# The direction table grows with the area of the field, not with the number
+# of asteroids, so sparse fields use gcds on each chunk instead.
+_MAX_TABLE_ENTRIES = 1 << 24
+
 
 class Location(NamedTuple):
     across: int
@@ -60,14 +79,72 @@ def basic_direction(source: Location, dest: Location) -> Direction:
     return reduce_direction(relative_distance(source, dest))
 
 
+def visible_asteroid_counts(
+    locations: np.ndarray,
+    max_chunk_pairs: int = _MAX_CHUNK_PAIRS,
+    max_table_entries: int = _MAX_TABLE_ENTRIES,
+) -> np.ndarray:
+    """Count the asteroids visible from each of the asteroids.
+
+    The asteroids are given as rows of (across, down), and the number
+    visible from each is the number of distinct directions to the others.
+    Offsets between asteroids are packed into single integers, indexing a
+    table of the reduced direction of every offset within the field, so
+    finding the directions needs no gcds. If that table would have more
+    than max_table_entries entries, the offsets are reduced with gcds
+    instead. Rows are worked on in chunks so that no more than
+    max_chunk_pairs pairs of asteroids are held at once.
+    """
+    counts = np.zeros(len(locations), dtype=np.int64)
+    if not len(locations):
+        return counts
+    across_span, down_span = (int(span) for span in np.ptp(locations, axis=0))
+    stride = 2 * down_span + 1
+    # Packing the offset between two asteroids gives the difference between
+    # their packed locations, moved to index the table from its middle.
+    packed = locations[:, 0] * stride + locations[:, 1]
+    centre = across_span * stride + down_span
+    use_table = (2 * across_span + 1) * stride <= max_table_entries
+    if use_table:
+        directions = _direction_table(across_span, down_span)
+    chunk = max(1, max_chunk_pairs // len(locations))
+    for start in range(0, len(locations), chunk):
+        if use_table:
+            sources = packed[start : start + chunk, None]
+            keys = directions[packed[None, :] - sources + centre]
+        else:
+            offsets = locations[None, :, :] - locations[start : start + chunk, None, :]
+            divisor = np.gcd(offsets[..., 0], offsets[..., 1])
+            divisor[divisor == 0] = 1
+            keys = (offsets[..., 0] // divisor) * stride + offsets[..., 1] // divisor
+        keys.sort(axis=1)
+        # Counting the changes between the sorted keys counts one fewer than
+        # the distinct directions, leaving out each asteroid's own (0, 0).
+        counts[start : start + chunk] = (np.diff(keys, axis=1) != 0).sum(axis=1)
+    return counts
+
+
+def _direction_table(across_span: int, down_span: int) -> np.ndarray:
+    """The packed reduced direction of each packed offset within the spans."""
+    stride = 2 * down_span + 1
+    d_across = np.arange(-across_span, across_span + 1)[:, None]
+    d_down = np.arange(-down_span, down_span + 1)[None, :]
+    divisor = np.gcd(d_across, d_down)
+    divisor[divisor == 0] = 1
+    directions = (
+        (d_across // divisor + across_span) * stride + d_down // divisor + down_span
+    ).ravel()
+    if directions.size <= np.iinfo(np.int32).max:
+        # Smaller keys are quicker to sort.
+        directions = directions.astype(np.int32)
+    return directions
+
+
 def find_best_spot_for_monitoring_station(grid: ParsedGrid) -> AsteroidObservation:
-    observations: List[AsteroidObservation] = []
-    for this in grid.asteroids:
-        directions = {
-            basic_direction(this, other) for other in grid.asteroids if other != this
-        }
-        observations.append(AsteroidObservation(this, len(directions)))
-    return max(observations, key=lambda ao: ao.asteroids_visible)
+    asteroids = sorted(grid.asteroids)
+    counts = visible_asteroid_counts(np.array(asteroids, dtype=np.int64))
+    best = int(counts.argmax())
+    return AsteroidObservation(asteroids[best], int(counts[best]))
 
 
 @pytest.mark.parametrize(
@@ -159,6 +236,24 @@ def test_find_best_spot_for_monitoring_station(
     assert find_best_spot_for_monitoring_station(parsed) == expected_observation
 
 
+def test_visible_asteroid_counts_in_chunks() -> None:
+    rng = np.random.default_rng(10)
+    locations = np.unique(rng.integers(-30, 30, size=(300, 2)), axis=0)
+    asteroids = [Location(int(a), int(d)) for a, d in locations]
+    expected = [
+        len({basic_direction(this, other) for other in asteroids if other != this})
+        for this in asteroids
+    ]
+    assert visible_asteroid_counts(locations, max_chunk_pairs=1000).tolist() == (
+        expected
+    )
+    without_table = visible_asteroid_counts(
+        locations, max_chunk_pairs=1000, max_table_entries=100
+    )
+    assert without_table.tolist() == expected
+    assert visible_asteroid_counts(np.empty((0, 2), dtype=np.int64)).size == 0
+
+
 def distance(a: Location, b: Location) -> float:
     return sqrt((b.across - a.across) ** 2 + (b.down - a.down) ** 2)
 
@@ -206,23 +301,83 @@ def destroy_asteroids_in_order(
     clockwise_order_from_above = clockwise_asteroid_queues(laser, asteroids)
     while clockwise_order_from_above:
         for queue in clockwise_order_from_above:
-            try:
-                # Closer asteroids are at the front of the queue,
-                # so popleft rather than just pop.
-                yield queue.popleft()
-            except IndexError:
-                # Queue is exhausted, so remove it.
-                clockwise_order_from_above.remove(queue)
+            # Closer asteroids are at the front of the queue,
+            # so popleft rather than just pop.
+            yield queue.popleft()
+        # Remove exhausted queues after the rotation, rather than during it,
+        # which would skip the queue after each one removed.
+        clockwise_order_from_above = [
+            queue for queue in clockwise_order_from_above if queue
+        ]
+
+
+class LaserSweep:
+    """The order in which the laser vaporises asteroids, by rank.
+
+    Asteroids are grouped by their direction from the laser, with the groups
+    in clockwise order from up and each group in order of distance. The
+    laser vaporises an asteroid on the rotation given by its index within
+    its group, and on each rotation takes one from every group with any
+    left, so the k-th vaporised can be found from the number of groups left
+    on each rotation, without sweeping.
+    """
+
+    laser: Location
+    # Asteroids ordered by group, then distance within their group.
+    _locations: np.ndarray
+    _group_starts: np.ndarray
+    _group_sizes: np.ndarray
+    # The number vaporised before each rotation, and in all.
+    _rotation_starts: np.ndarray
+    # The groups with asteroids left on each rotation queried so far.
+    _groups_left: Dict[int, np.ndarray]
+
+    def __init__(self, laser: Location, asteroids: Iterable[Location]):
+        self.laser = laser
+        others = [asteroid for asteroid in asteroids if asteroid != laser]
+        locations = np.fromiter(
+            chain.from_iterable(others), dtype=np.int64, count=2 * len(others)
+        ).reshape(-1, 2)
+        offsets = locations - np.array(laser)
+        # Distance along the direction, in steps of the reduced direction.
+        steps = np.gcd(offsets[:, 0], offsets[:, 1])
+        directions = offsets // np.maximum(steps, 1)[:, None]
+        # Clockwise from up, as in clockwise_asteroid_queues.
+        angles = -np.arctan2(directions[:, 0], directions[:, 1])
+        order = np.lexsort((steps, directions[:, 1], directions[:, 0], angles))
+        self._locations = locations[order]
+        directions = directions[order]
+
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = (directions[1:] != directions[:-1]).any(axis=1)
+        self._group_starts = np.flatnonzero(new_group)
+        self._group_sizes = np.diff(self._group_starts, append=len(order))
+        # Groups left on each rotation are those larger than its number.
+        smaller_or_equal = np.cumsum(np.bincount(self._group_sizes))
+        groups_left = len(self._group_sizes) - smaller_or_equal[:-1]
+        self._rotation_starts = np.concatenate(([0], np.cumsum(groups_left)))
+        self._groups_left = {}
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def vaporised(self, n: int) -> Location:
+        """The n-th asteroid vaporised, counting from one."""
+        if not 1 <= n <= len(self):
+            raise ValueError(f"Too few asteroids given to find number {n} destroyed.")
+        rotation = int(np.searchsorted(self._rotation_starts, n - 1, side="right")) - 1
+        position = n - 1 - self._rotation_starts[rotation]
+        if rotation not in self._groups_left:
+            self._groups_left[rotation] = np.flatnonzero(self._group_sizes > rotation)
+        group = self._groups_left[rotation][position]
+        across, down = self._locations[self._group_starts[group] + rotation]
+        return Location(int(across), int(down))
 
 
 def find_nth_asteroid_destroyed(
     laser: Location, asteroids: Iterable[Location], n: int = 200
 ) -> Location:
-    destroyed_gen = destroy_asteroids_in_order(laser, asteroids)
-    for number, destroyed_asteroid in enumerate(destroyed_gen, start=1):
-        if number == n:
-            return destroyed_asteroid
-    raise ValueError(f"Too few asteroids given to find number {n} destroyed.")
+    return LaserSweep(laser, asteroids).vaporised(n)
 
 
 def test_asteroid_destruction() -> None:
@@ -270,6 +425,18 @@ def test_asteroid_destruction() -> None:
     assert locations == filtered
 
 
+def test_laser_sweep_matches_destruction_order() -> None:
+    rng = np.random.default_rng(22)
+    field = {Location(int(a), int(d)) for a, d in rng.integers(0, 25, size=(300, 2))}
+    laser = Location(12, 12)
+    asteroids = field - {laser}
+    sweep = LaserSweep(laser, asteroids)
+    expected = list(destroy_asteroids_in_order(laser, asteroids))
+    assert [sweep.vaporised(n) for n in range(1, len(sweep) + 1)] == expected
+    with pytest.raises(ValueError):
+        sweep.vaporised(len(sweep) + 1)
+
+
 def main(grid: ParsedGrid) -> Tuple[int, int]:
     best_spot = find_best_spot_for_monitoring_station(grid)
     asteroid_200 = find_nth_asteroid_destroyed(
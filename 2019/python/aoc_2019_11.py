@@ -1,12 +1,15 @@
 """Day 11: Space Police"""
+
 from __future__ import annotations
 
 from collections import defaultdict
 from enum import Enum
-from typing import DefaultDict, List, NamedTuple, Tuple
+from typing import DefaultDict, NamedTuple, Tuple
 
 import aoc
-from intcode import HaltExecution, IntCode, parse_program
+from intcode import IntCode, PagedMemory
+from intcode_image import load_program
+from intcode_scheduler import Scheduler
 
 DAY = 11
 
@@ -77,34 +80,30 @@ class HullPaintingRobot:
         self.computer = computer
 
     def step(self) -> None:
-        if self.computer.has_halted():
-            return
-
-        # Pass colour of current position as integer
-        self.computer.pass_input(self.grid[self.position].value)
-        while len(self.computer.output_queue) < 2:
-            self.computer.step()
+        """Paint and move as instructed by the computer's outputs."""
+        while len(self.computer.output_queue) >= 2:
+            colour = Colour(self.computer.read_output())
+            self.grid[self.position] = colour
 
-        colour = Colour(self.computer.read_output())
-        self.grid[self.position] = colour
+            turn = Turn(self.computer.read_output())
+            self.direction = self.direction.turn(turn)
+            self.position = self.move(self.position, self.direction)
 
-        turn = Turn(self.computer.read_output())
-        self.direction = self.direction.turn(turn)
-        self.position = self.move(self.position, self.direction)
+    def on_blocked(self, computer: IntCode) -> None:
+        self.step()
+        # Pass colour of current position as integer
+        computer.pass_input(self.grid[self.position].value)
 
     def run_until_halt(self) -> None:
-        try:
-            while True:
-                self.step()
-        except HaltExecution:
-            pass
+        Scheduler([self.computer], on_blocked=self.on_blocked).run()
+        self.step()
 
     @staticmethod
     def move(position: Point, direction: Direction) -> Point:
         return Point(position.x + direction.value.x, position.y + direction.value.y)
 
 
-def paint_hull(program: List[int], grid: Grid) -> Grid:
+def paint_hull(program: PagedMemory, grid: Grid) -> Grid:
     robot = HullPaintingRobot(grid=grid, computer=IntCode(program))
     robot.run_until_halt()
     return robot.grid
@@ -130,7 +129,7 @@ def visualise_painted_hull(grid: Grid) -> str:
     return hull_string
 
 
-def main(program: List[int]) -> Tuple[int, str]:
+def main(program: PagedMemory) -> Tuple[int, str]:
     part_one_grid = paint_hull(program, create_black_grid())
     unique_panels_painted = len(part_one_grid)
 
@@ -141,7 +140,7 @@ def main(program: List[int]) -> Tuple[int, str]:
 
 
 if __name__ == "__main__":
-    program = parse_program(aoc.load_puzzle_input(2019, DAY))
+    program = load_program(aoc.load_puzzle_input(2019, DAY))
     part_one_solution, part_two_solution = main(program)
 
     assert (
@@ -1,80 +1,34 @@
 """Day 12: The N-Body Problem"""
+
 from __future__ import annotations
 
 import re
-from collections import defaultdict
 from functools import reduce
 from itertools import combinations, count
 from math import gcd
-from typing import Callable, DefaultDict, Iterable, List, NamedTuple, Tuple
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, NamedTuple, Tuple
 
+import numpy as np
 import pytest
 
 import aoc
 
 DAY = 12
 
+# Systems with fewer moons than this find their cycles one axis at a time.
+_SMALL_SYSTEM = 16
+
 
 Position = Tuple[int, int, int]
 Velocity = Tuple[int, int, int]
 
 
-def combine_velocities(vs: List[Velocity]) -> Velocity:
-    acc = list(vs[0])
-    for v in vs[1:]:
-        acc[0] += v[0]
-        acc[1] += v[1]
-        acc[2] += v[2]
-    return tuple(acc)  # type: ignore
-
-
 class Moon(NamedTuple):
     moon_id: int
     position: Position
     velocity: Velocity
 
-    @staticmethod
-    def compute_gravity(a: Moon, b: Moon) -> Tuple[Velocity, Velocity]:
-        velocity_deltas = [
-            Moon._single_gravity_delta(a.position[0], b.position[0]),
-            Moon._single_gravity_delta(a.position[1], b.position[1]),
-            Moon._single_gravity_delta(a.position[2], b.position[2]),
-        ]
-        return (
-            (velocity_deltas[0][0], velocity_deltas[1][0], velocity_deltas[2][0]),
-            (velocity_deltas[0][1], velocity_deltas[1][1], velocity_deltas[2][1]),
-        )
-
-    @staticmethod
-    def _single_gravity_delta(a: int, b: int) -> Tuple[int, int]:
-        if a < b:
-            return (1, -1)
-        elif b < a:
-            return (-1, 1)
-        return (0, 0)
-
-    def update_velocity(self, v: Velocity) -> Moon:
-        return Moon(
-            moon_id=self.moon_id,
-            position=self.position,
-            velocity=(
-                self.velocity[0] + v[0],
-                self.velocity[1] + v[1],
-                self.velocity[2] + v[2],
-            ),
-        )
-
-    def apply_velocity(self) -> Moon:
-        return Moon(
-            moon_id=self.moon_id,
-            position=(
-                self.position[0] + self.velocity[0],
-                self.position[1] + self.velocity[1],
-                self.position[2] + self.velocity[2],
-            ),
-            velocity=self.velocity,
-        )
-
     @property
     def potential_energy(self) -> int:
         return sum(map(abs, self.position))  # type: ignore # something odd with abs
@@ -93,23 +47,80 @@ class Moon(NamedTuple):
         return f"pos=<x={px: 3}, y={py: 3}, z={pz: 3}>, vel=<x={vx: 3}, y={vy: 3}, z={vz: 3}>"
 
 
-def simulate_step(moons: List[Moon]) -> List[Moon]:
-    pairings = combinations(moons, 2)
-    gravity_changes: DefaultDict[Moon, List[Velocity]] = defaultdict(list)
-    for moon_a, moon_b in pairings:
-        a_delta, b_delta = Moon.compute_gravity(moon_a, moon_b)
-        gravity_changes[moon_a].append(a_delta)
-        gravity_changes[moon_b].append(b_delta)
+def moon_arrays(moons: List[Moon]) -> Tuple[np.ndarray, np.ndarray]:
+    """The moons' positions and velocities, as arrays of moons by axis."""
+    positions = np.array([moon.position for moon in moons], dtype=np.int64)
+    velocities = np.array([moon.velocity for moon in moons], dtype=np.int64)
+    return positions.reshape(-1, 3), velocities.reshape(-1, 3)
+
+
+def gravity(positions: np.ndarray) -> np.ndarray:
+    """Each moon's change in velocity, for positions of moons by axis.
+
+    Every pair of moons pulls each towards the other by one on each axis
+    on which they differ, so a moon's change is the sum of the signs of
+    its differences from every other moon.
+    """
+    return np.sign(positions[None, :, :] - positions[:, None, :]).sum(axis=1)
+
+
+def rank_gravity(positions: np.ndarray) -> np.ndarray:
+    """Each moon's change in velocity, from the ranks of its coordinates.
+
+    On each axis a moon's change is the number of moons with a greater
+    coordinate less the number with a smaller one, as equal coordinates
+    don't pull. Both counts come from searching the sorted coordinates, so
+    this takes O(n log n) time and O(n) memory rather than the O(n²) of
+    the pairwise sign matrix, for systems of many bodies.
+    """
+    changes = np.empty_like(positions)
+    ordered = np.sort(positions, axis=0)
+    for axis in range(positions.shape[1]):
+        coordinates, column = positions[:, axis], ordered[:, axis]
+        smaller = np.searchsorted(column, coordinates, side="left")
+        not_greater = np.searchsorted(column, coordinates, side="right")
+        changes[:, axis] = (len(column) - not_greater) - smaller
+    return changes
+
+
+def simulate(
+    positions: np.ndarray, velocities: np.ndarray, steps: int, large: bool = False
+) -> None:
+    """Advance the positions and velocities in place by a number of steps.
+
+    Large systems use rank gravity rather than the pairwise sign matrix.
+    """
+    pull = rank_gravity if large else gravity
+    for _ in range(steps):
+        velocities += pull(positions)
+        positions += velocities
+
+
+def system_energy(positions: np.ndarray, velocities: np.ndarray) -> int:
+    potential = np.abs(positions).sum(axis=1)
+    kinetic = np.abs(velocities).sum(axis=1)
+    return int((potential * kinetic).sum())
+
+
+def simulate_n_steps(
+    moons: List[Moon], n: int = 1000, large: bool = False
+) -> List[Moon]:
+    positions, velocities = moon_arrays(moons)
+    simulate(positions, velocities, n, large)
     return [
-        moon.update_velocity(combine_velocities(deltas)).apply_velocity()
-        for moon, deltas in gravity_changes.items()
+        Moon(moon.moon_id, (int(px), int(py), int(pz)), (int(vx), int(vy), int(vz)))
+        for moon, (px, py, pz), (vx, vy, vz) in zip(moons, positions, velocities)
     ]
 
 
-def simulate_n_steps(moons: List[Moon], n: int = 1000) -> List[Moon]:
-    for _ in range(n):
-        moons = simulate_step(moons)
-    return moons
+def generate_moons(count: int, spread: int = 1000, seed: int = 0) -> List[Moon]:
+    """Generate a system of moons at rest, at random positions."""
+    rng = np.random.default_rng(seed)
+    positions = rng.integers(-spread, spread, size=(count, 3), endpoint=True)
+    return [
+        Moon(n, (int(x), int(y), int(z)), (0, 0, 0))
+        for n, (x, y, z) in enumerate(positions)
+    ]
 
 
 def parse_input(input_string: str) -> List[Moon]:
@@ -118,10 +129,11 @@ def parse_input(input_string: str) -> List[Moon]:
     assert all(
         [match is not None for match in matches]
     ), "Could not parse all input lines."
-    positions = [tuple(map(int, m.groups())) for m in matches]  # type: ignore
-    return [
-        Moon(n, pos, (0, 0, 0)) for n, pos in zip(count(), positions)
-    ]  # type: ignore
+    positions = [
+        (int(x), int(y), int(z))
+        for x, y, z in (m.groups() for m in matches if m is not None)
+    ]
+    return [Moon(n, pos, (0, 0, 0)) for n, pos in zip(count(), positions)]
 
 
 @pytest.mark.parametrize(
@@ -184,6 +196,37 @@ def test_calculate_cycle_time(input_data: str, cycle_time: int) -> None:
     assert calculate_cycle_time(moons) == cycle_time
 
 
+def test_cycle_time_in_processes() -> None:
+    moons = parse_input(
+        "<x=-1, y=0, z=2>\n<x=2, y=-10, z=-7>\n<x=4, y=-8, z=8>\n<x=3, y=5, z=-1>"
+    )
+    assert axis_cycle_lengths(*moon_arrays(moons)) == [18, 28, 44]
+    assert array_cycle_lengths(*moon_arrays(moons)) == [18, 28, 44]
+    assert calculate_cycle_time(moons, processes=3) == 2772
+
+
+def test_rank_gravity_matches_pairwise_gravity() -> None:
+    # Few distinct coordinates, so that many of them are tied.
+    positions, _ = moon_arrays(generate_moons(200, spread=5))
+    assert (rank_gravity(positions) == gravity(positions)).all()
+
+
+@pytest.mark.parametrize("large", [False, True])
+def test_large_system_mode(large: bool) -> None:
+    moons = generate_moons(50, spread=20, seed=1)
+    expected = simulate_n_steps(moons, 100)
+    assert simulate_n_steps(moons, 100, large) == expected
+    positions, velocities = moon_arrays(moons)
+    simulate(positions, velocities, 100, large)
+    assert system_energy(positions, velocities) == sum(
+        moon.total_energy for moon in expected
+    )
+    moons = parse_input(
+        "<x=-8, y=-10, z=0>\n<x=5, y=5, z=10>\n<x=2, y=-7, z=3>\n<x=9, y=-8, z=-3>"
+    )
+    assert calculate_cycle_time(moons, large=large) == 4_686_774_924
+
+
 def least_common_multiple(*numbers: int) -> int:
     """Find the least common multiple of several numbers."""
 
@@ -209,32 +252,106 @@ def test_least_common_multiple(numbers: Iterable[int], expected: int) -> None:
     assert least_common_multiple(*numbers) == expected
 
 
-def find_cycle_length(
-    moons: List[Moon], extractor: Callable[[Moon], Tuple[int, int, int]]
-) -> int:
-    initial_state = sorted(map(extractor, moons))
-    for cycle in count(start=1):
-        moons = simulate_step(moons)
-        state = sorted(map(extractor, moons))
-        if state == initial_state:
-            return cycle
+def axis_cycle_lengths(
+    positions: np.ndarray, velocities: np.ndarray, large: bool = False
+) -> List[int]:
+    """Find how many steps each axis takes to return to its initial state.
+
+    The positions and velocities are arrays of moons by axis. Systems of
+    only a few moons are quicker to simulate one axis at a time with plain
+    integers than with arrays, whose per-step overhead dominates.
+    """
+    if not large and len(positions) < _SMALL_SYSTEM:
+        return [
+            scalar_cycle_length(
+                positions[:, axis].tolist(), velocities[:, axis].tolist()
+            )
+            for axis in range(positions.shape[1])
+        ]
+    return array_cycle_lengths(positions, velocities, large)
+
+
+def scalar_cycle_length(positions: List[int], velocities: List[int]) -> int:
+    """Find how many steps a single axis takes to return to its initial state.
+
+    Each pair of moons is compared once, pulling both, rather than every
+    moon being compared with every other.
+    """
+    positions, velocities = list(positions), list(velocities)
+    initial = positions + velocities
+    pairs = list(combinations(range(len(positions)), 2))
+    moons = range(len(positions))
+    for step in count(start=1):
+        for i, j in pairs:
+            if positions[i] < positions[j]:
+                velocities[i] += 1
+                velocities[j] -= 1
+            elif positions[i] > positions[j]:
+                velocities[i] -= 1
+                velocities[j] += 1
+        for i in moons:
+            positions[i] += velocities[i]
+        if positions + velocities == initial:
+            return step
     assert False, "Unreachable"  # Make mypy happy
 
 
-def calculate_cycle_time(moons: List[Moon]) -> int:
-    """Find the system cycle time by taking the LCM of the axis cycle times."""
-    x_cycle = find_cycle_length(
-        moons, lambda m: (m.moon_id, m.position[0], m.velocity[0])
-    )
-    y_cycle = find_cycle_length(
-        moons, lambda m: (m.moon_id, m.position[1], m.velocity[1])
-    )
-    z_cycle = find_cycle_length(
-        moons, lambda m: (m.moon_id, m.position[2], m.velocity[2])
-    )
-    print(x_cycle, y_cycle, z_cycle)
-    lcm = least_common_multiple(x_cycle, y_cycle, z_cycle)
-    return lcm
+def array_cycle_lengths(
+    positions: np.ndarray, velocities: np.ndarray, large: bool = False
+) -> List[int]:
+    """Find how many steps each axis takes to return to its initial state.
+
+    The positions and velocities are arrays of moons by axis. The axes are
+    independent, so they're simulated together, each until it repeats.
+    Each axis is kept as a contiguous row, so that its state can be
+    compared with its initial state as bytes. Large systems use rank
+    gravity rather than the pairwise sign matrix.
+    """
+    positions = np.ascontiguousarray(positions.T)
+    velocities = np.ascontiguousarray(velocities.T)
+    axes, moons = positions.shape
+    initial = [positions[a].tobytes() + velocities[a].tobytes() for a in range(axes)]
+    differences = None if large else np.empty((axes, moons, moons), dtype=np.int64)
+    changes = np.empty((axes, moons), dtype=np.int64)
+    # Views of the positions that broadcast to the differences between moons.
+    others, these = positions[:, None, :], positions[:, :, None]
+    cycles: Dict[int, int] = {}
+    for step in count(start=1):
+        if differences is None:
+            velocities += rank_gravity(positions.T).T
+        else:
+            np.subtract(others, these, out=differences)
+            np.sign(differences, out=differences)
+            differences.sum(axis=2, out=changes)
+            velocities += changes
+        positions += velocities
+        for axis in range(axes):
+            if (
+                axis not in cycles
+                and positions[axis].tobytes() + velocities[axis].tobytes()
+                == initial[axis]
+            ):
+                cycles[axis] = step
+        if len(cycles) == axes:
+            return [cycles[axis] for axis in range(axes)]
+    assert False, "Unreachable"  # Make mypy happy
+
+
+def calculate_cycle_time(
+    moons: List[Moon], processes: int = 1, large: bool = False
+) -> int:
+    """Find the system cycle time by taking the LCM of the axis cycle times.
+
+    The axes can be simulated in separate processes, rather than together.
+    """
+    positions, velocities = moon_arrays(moons)
+    if processes > 1:
+        axes = [(positions[:, [a]], velocities[:, [a]], large) for a in range(3)]
+        with Pool(processes) as pool:
+            cycles = [cycle for (cycle,) in pool.starmap(axis_cycle_lengths, axes)]
+    else:
+        cycles = axis_cycle_lengths(positions, velocities, large)
+    return least_common_multiple(*cycles)
 
 
 def main(moons: List[Moon]) -> Tuple[int, int]:
@@ -5,7 +5,8 @@ from enum import Enum
 from typing import Dict, List, Optional, Tuple
 
 import aoc
-from intcode import HaltExecution, IntCode, parse_program
+from intcode import IntCode, parse_program
+from intcode_scheduler import Scheduler
 
 DAY = 13
 
@@ -43,15 +44,13 @@ class ArcadeCabinet:
         self.computer = IntCode(program)
 
     def play_until_game_over(self) -> None:
-        try:
-            while True:
-                if self.playable:
-                    self.computer.input_queue.clear()  # Ensure input doesn't build up
-                    self.computer.pass_input(self.bot_move(self.state).value)
-                self.computer.step()
-                self.update_state()
-        except HaltExecution:
-            pass
+        Scheduler([self.computer], on_blocked=self.on_blocked).run()
+        self.update_state()
+
+    def on_blocked(self, computer: IntCode) -> None:
+        # Move the joystick based on the screen as it is right now
+        self.update_state()
+        computer.pass_input(self.bot_move(self.state).value)
 
     def update_state(self) -> None:
         while len(self.computer.output_queue) >= 3:
@@ -1,4 +1,5 @@
 """Day 15: Oxygen System"""
+
 from __future__ import annotations
 
 from collections import deque
@@ -10,7 +11,8 @@ import png
 from PIL import Image
 
 import aoc
-from intcode import IntCode, parse_program
+from intcode import IntCode, PagedMemory
+from intcode_image import load_program
 
 DAY = 15
 
@@ -75,8 +77,7 @@ class Droid:
     def move(self, direction: Direction) -> MoveResult:
         self.computer.pass_input(direction.value)
         self.position = Direction.new_position(self.position, direction)
-        while not self.computer.has_output():
-            self.computer.step()
+        self.computer.run(max_outputs=1)
         return MoveResult(self.computer.read_output())
 
     def clone(self) -> Droid:
@@ -106,7 +107,7 @@ def bfs_distance(
     return -1
 
 
-def explore_maze(program: List[int]) -> Dict[Position, Tile]:
+def explore_maze(program: PagedMemory) -> Dict[Position, Tile]:
     visited: Dict[Position, Tile] = {}
     queue: Deque[Droid] = deque()
 
@@ -163,7 +164,7 @@ def oxygen_propagation_times(
             render_maze_frame(maze)
 
 
-def main(program: List[int]) -> Tuple[int, int]:
+def main(program: PagedMemory) -> Tuple[int, int]:
     maze = explore_maze(program)
     system_position = next(p for p, t in maze.items() if t is Tile.Target)
     distance_to_system = bfs_distance(maze, target=system_position)
@@ -213,7 +214,7 @@ def render_maze_frame(maze: Dict[Position, Tile]) -> None:
 
 if __name__ == "__main__":
     part_one_solution, part_two_solution = main(
-        parse_program(aoc.load_puzzle_input(2019, DAY))
+        load_program(aoc.load_puzzle_input(2019, DAY))
     )
 
     assert (
@@ -1,7 +1,10 @@
 """Day 16: Flawed Frequency Transmission"""
+
 from itertools import accumulate, chain, cycle
+from math import isqrt
 from typing import Iterator, List, Tuple
 
+import numpy as np
 import pytest
 
 import aoc
@@ -37,50 +40,65 @@ def test_pattern(place: int, first_eight_digits: List[int]) -> None:
     )
 
 
-def create_pattern_table(num_elements: int) -> List[List[int]]:
-    return [
-        [p for p, _ in zip(pattern(place), range(num_elements))]
-        for place in range(1, num_elements + 1)
-    ]
+def fft(signal: np.ndarray) -> np.ndarray:
+    """Run one phase of the FFT, using prefix sums of the signal.
+
+    The pattern for the kth output digit (counting from one) repeats every
+    4k digits, and is zero but for a block of k ones starting at digit k
+    and a block of k minus ones starting at 3k. So each output digit is a
+    sum of differences of prefix sums at the block ends, n/2k of them for
+    the kth digit, and a phase takes O(n log n) time with no pattern table.
+
+    Rows with short patterns are summed one at a time over strided slices
+    of the prefix sums, and rows with long patterns (which have few blocks)
+    are summed together, block by block, to keep down the number of NumPy
+    calls for long signals.
+    """
+    n = len(signal)
+    # Padded, so that slices of blocks ending past the signal stay in range.
+    prefix = np.zeros(2 * n + 1, dtype=np.int64)
+    np.cumsum(signal, out=prefix[1 : n + 1])
+    prefix[n + 1 :] = prefix[n]
+    totals = np.zeros(n, dtype=np.int64)
+    split = min(n, max(1, isqrt(n) // 2))
+    for k in range(1, split + 1):
+        period = 4 * k
+        totals[k - 1] = (
+            prefix[2 * k - 1 : n + k : period].sum()
+            - prefix[k - 1 : n : period].sum()
+            - prefix[4 * k - 1 : n + k : period].sum()
+            + prefix[3 * k - 1 : n : period].sum()
+        )
+    rows = np.arange(split + 1, n + 1, dtype=np.int64)
+    block = 0
+    while len(rows):
+        period_start = rows - 1 + 4 * block * rows
+        rows, period_start = rows[period_start < n], period_start[period_start < n]
+        ones = np.minimum(period_start + rows, n)
+        minus_ones = np.minimum(period_start + 2 * rows, n)
+        ends = np.minimum(period_start + 3 * rows, n)
+        totals[rows - 1] += (
+            prefix[ones] - prefix[period_start] - prefix[ends] + prefix[minus_ones]
+        )
+        block += 1
+    return np.abs(totals) % 10
 
 
-def test_create_pattern_table() -> None:
+def test_fft_matches_pattern() -> None:
+    rng = np.random.default_rng(16)
+    signal = rng.integers(0, 10, size=300)
     expected = [
-        [1, 0, -1, 0, 1, 0, -1, 0],
-        [0, 1, 1, 0, 0, -1, -1, 0],
-        [0, 0, 1, 1, 1, 0, 0, 0],
-        [0, 0, 0, 1, 1, 1, 1, 0],
-        [0, 0, 0, 0, 1, 1, 1, 1],
-        [0, 0, 0, 0, 0, 1, 1, 1],
-        [0, 0, 0, 0, 0, 0, 1, 1],
-        [0, 0, 0, 0, 0, 0, 0, 1],
+        abs(sum(digit * p for digit, p in zip(signal, pattern(place)))) % 10
+        for place in range(1, len(signal) + 1)
     ]
-    assert create_pattern_table(8) == expected
-
-
-def fft(signal: List[int], pattern_table: List[List[int]]) -> List[int]:
-    output: List[int] = []
-    midpoint = len(signal) // 2
-    for single_pattern in pattern_table[:midpoint]:
-        total = sum(
-            signal_digit * pattern_digit
-            for signal_digit, pattern_digit in zip(signal, single_pattern)
-            if pattern_digit
-        )
-        output.append(abs(total) % 10)
-    # After the pattern row with the index `midpoint`, the elements in the
-    # pattern row from `midpoint` are all 1 and can just be summed.
-    output.extend(
-        abs(sum(signal[index:])) % 10 for index in range(midpoint, len(signal))
-    )
-    return output
+    assert fft(signal).tolist() == expected
 
 
 def repeat_fft(signal: List[int], phases: int) -> List[int]:
-    pattern_table = create_pattern_table(len(signal))
+    digits = np.array(signal, dtype=np.int64)
     for _ in range(phases):
-        signal = fft(signal, pattern_table)
-    return signal
+        digits = fft(digits)
+    return digits.tolist()
 
 
 @pytest.mark.parametrize(
@@ -123,6 +141,13 @@ def test_cheating_fft(signal_string: str, first_eight: str) -> None:
     assert "".join(map(str, result[:8])) == first_eight
 
 
+def test_repeat_fft_on_repeated_signal() -> None:
+    real_signal = list(map(int, "03036732577212944063491565474664")) * 100
+    offset = 2_000
+    expected = cheating_fft(real_signal, offset)
+    assert repeat_fft(real_signal, 100)[offset:] == expected
+
+
 def main(signal: List[int]) -> Tuple[str, str]:
     after_100_phases = repeat_fft(signal, phases=100)
     after_100_first_eight = "".join(map(str, after_100_phases[:8]))
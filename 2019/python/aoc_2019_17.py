@@ -1,6 +1,5 @@
 """Day 17: Set and Forget"""
 
-from itertools import chain
 from typing import Dict, Iterable, List, Optional, Tuple
 
 import aoc
@@ -11,17 +10,12 @@ from more_itertools import chunked
 DAY = 17
 
 
-def create_grid(ascii: Iterable[int]) -> Dict[Tuple[int, int], str]:
-    grid: Dict[Tuple[int, int], str] = {}
-    x = y = 0
-    for tile in map(chr, ascii):
-        if tile == "\n":
-            y += 1
-            x = 0
-            continue
-        grid[(x, y)] = tile
-        x += 1
-    return grid
+def create_grid(ascii: str) -> Dict[Tuple[int, int], str]:
+    return {
+        (x, y): tile
+        for y, line in enumerate(ascii.splitlines())
+        for x, tile in enumerate(line)
+    }
 
 
 def find_intersections(grid: Dict[Tuple[int, int], str]) -> List[Tuple[int, int]]:
@@ -55,16 +49,8 @@ def print_grid(
         print()
 
 
-def parse_ascii_instructions(text: str) -> List[int]:
-    output = []
-    for instruction in text.split():
-        for char in instruction:
-            output.append(ord(char))
-        output.append(44)
-    if output[-1] == 44:
-        output.pop()  # Remove trailing comma
-    output.append(10)
-    return output
+def parse_ascii_instructions(text: str) -> str:
+    return ",".join(text.split()) + "\n"
 
 
 def move_vacuum_robot(program: List[int]) -> int:
@@ -82,17 +68,16 @@ def move_vacuum_robot(program: List[int]) -> int:
     patched = program
     patched[0] = 2
     robot = IntCode(program)
-    for ascii_code in chain(main_program, *instructions.values(), decline_video):
-        robot.pass_input(ascii_code)
+    robot.feed(main_program + "".join(instructions.values()) + decline_video)
     robot.run_until_halt()
-    return robot.output_queue.pop()
+    return robot.drain()[-1]
 
 
 def main(program: List[int]) -> Tuple[int, int]:
     # Part one
     cameras = IntCode(program)
     cameras.run_until_halt()
-    grid = create_grid(cameras.output_queue)
+    grid = create_grid(cameras.drain_text())
     intersections = find_intersections(grid)
     # print_grid(grid, intersections)
     alignment_params = [x * y for x, y in intersections]
@@ -0,0 +1,336 @@
+"""Benchmarks for the IntCode engines.
+
+Runs a fixed corpus of programs on each engine: the 2019 puzzle programs,
+driven with fixed inputs, and synthetic programs that stress loops, memory
+and the relative base. Each workload runs in a fresh process for each
+engine, so that caches shared between machines start cold and the peak RSS
+is the workload's own, and reports its instructions per second, wall time
+(the best of the repeats, with the first run reported separately as it
+includes any compilation), peak RSS and, optionally, the peak memory
+allocated by Python while it runs. Every engine counts only the instructions
+it executes, so instruction counts and rates are comparable between engines.
+
+Results can be written to a JSON file, and compared with a saved baseline,
+in which case the exit status is non-zero if any workload got slower by more
+than the tolerance:
+
+    python bench_intcode.py --output baseline.json
+    python bench_intcode.py --baseline baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tracemalloc
+from itertools import permutations
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import aoc
+from intcode import ENGINES, IntCode, MachineState, parse_program
+
+# Engine name to the instructions executed and the result checked.
+WorkloadRunner = Callable[[str], Tuple[int, Optional[int]]]
+
+
+class Workload(NamedTuple):
+    name: str
+    run: WorkloadRunner
+    expected: Optional[int] = None
+
+
+def sieve_program(limit: int) -> List[int]:
+    """Count the primes below limit with a sieve of Eratosthenes.
+
+    The sieve's flags are at 1000 onwards, indexed by moving the relative
+    base.
+    """
+    i, j, count, test, negated = 100, 101, 102, 103, 104
+    # fmt: off
+    program = [
+        1101, 2, 0, i,            # 0: i = 2
+        1007, i, limit, test,     # 4: while i < limit
+        1006, test, 67,
+        9, i,                     # 11: test = flags[i]
+        1201, 1000, 0, test,
+        1002, i, -1, negated,
+        9, negated,
+        1005, test, 60,           # 23: if not composite
+        1001, count, 1, count,    # 26: count += 1
+        2, i, i, j,               # 30: for j in range(i * i, limit, i)
+        1007, j, limit, test,     # 34
+        1006, test, 60,
+        9, j,                     # 41: flags[j] = 1
+        21101, 1, 0, 1000,
+        1002, j, -1, negated,
+        9, negated,
+        1, j, i, j,               # 53
+        1105, 1, 34,
+        1001, i, 1, i,            # 60: i += 1
+        1105, 1, 4,
+        4, count,                 # 67
+        99,
+    ]
+    # fmt: on
+    return program + [0] * (negated + 1 - len(program))
+
+
+def countdown_program(count: int) -> List[int]:
+    """Count down from count in a tight loop, then output zero."""
+    return [1001, 11, -1, 11, 1005, 11, 0, 4, 11, 99, 0, count]
+
+
+def recursion_program(depth: int) -> List[int]:
+    """Sum 1 to depth recursively, with stack frames at the relative base.
+
+    Each frame holds the return address, the argument and the result.
+    """
+    # fmt: off
+    return [
+        109, 2000,                # 0: stack starts at 2000
+        21101, 0, depth, 1,       # 2: call sum(depth)
+        21101, 0, 13, 0,
+        1105, 1, 16,
+        204, 2,                   # 13: output the result
+        99,
+        1206, 1, 41,              # 16: sum(n): if n == 0, return 0
+        21201, 1, -1, 4,          # 19: call sum(n - 1) in the next frame
+        21101, 0, 32, 3,
+        109, 3,
+        1105, 1, 16,
+        109, -3,                  # 32: return n + sum(n - 1)
+        22201, 1, 5, 2,
+        2106, 0, 0,
+        21101, 0, 0, 2,           # 41
+        2106, 0, 0,
+    ]
+    # fmt: on
+
+
+def _puzzle_program(day: int, patches: Optional[Dict[int, int]] = None) -> List[int]:
+    program = parse_program(aoc.load_puzzle_input(2019, day))
+    for address, value in (patches or {}).items():
+        program[address] = value
+    return program
+
+
+def _driven(
+    program: Callable[[], List[int]],
+    inputs: Sequence[int] = (),
+    blocked_input: Optional[int] = None,
+    max_instructions: int = 3_000_000,
+) -> WorkloadRunner:
+    """Run a program, passing blocked_input whenever it needs more input.
+
+    The result is the program's last output.
+    """
+
+    def run(engine: str) -> Tuple[int, Optional[int]]:
+        machine = IntCode(program(), engine=engine)
+        machine.feed(inputs)
+        last_output = None
+        while machine.instructions_executed < max_instructions:
+            state = machine.run(
+                max_instructions=max_instructions - machine.instructions_executed
+            )
+            outputs = machine.drain()
+            if outputs:
+                last_output = outputs[-1]
+            if state is not MachineState.NEEDS_INPUT:
+                break
+            if blocked_input is None:
+                raise RuntimeError("Workload needs more input than it was given.")
+            machine.pass_input(blocked_input)
+        return machine.instructions_executed, last_output
+
+    return run
+
+
+def _noun_verb_search(engine: str) -> Tuple[int, Optional[int]]:
+    program = _puzzle_program(2)
+    instructions = 0
+    for noun in range(100):
+        for verb in range(100):
+            machine = IntCode(program, engine=engine)
+            machine._memory[1], machine._memory[2] = noun, verb
+            machine.run_until_halt()
+            instructions += machine.instructions_executed
+            if machine._memory[0] == 19690720:
+                return instructions, 100 * noun + verb
+    return instructions, None
+
+
+def _amplifier_search(engine: str) -> Tuple[int, Optional[int]]:
+    program = _puzzle_program(7)
+    instructions = 0
+    best = 0
+    for phases in permutations(range(5)):
+        signal = 0
+        for phase in phases:
+            amp = IntCode(program, engine=engine)
+            amp.feed([phase, signal])
+            amp.run_until_halt()
+            instructions += amp.instructions_executed
+            signal = amp.read_output()
+        best = max(best, signal)
+    return instructions, best
+
+
+WORKLOADS = {
+    workload.name: workload
+    for workload in [
+        Workload("day02-search", _noun_verb_search, 4259),
+        Workload("day05", _driven(lambda: _puzzle_program(5), [5]), 9265694),
+        Workload("day07-search", _amplifier_search, 14902),
+        Workload("day09", _driven(lambda: _puzzle_program(9), [2]), 87721),
+        Workload("day11", _driven(lambda: _puzzle_program(11), blocked_input=0)),
+        Workload(
+            "day13", _driven(lambda: _puzzle_program(13, {0: 2}), blocked_input=0)
+        ),
+        Workload(
+            "day15",
+            _driven(
+                lambda: _puzzle_program(15),
+                blocked_input=1,
+                max_instructions=1_000_000,
+            ),
+        ),
+        Workload("day17", _driven(lambda: _puzzle_program(17)), ord("\n")),
+        Workload("sieve", _driven(lambda: sieve_program(30_000)), 3245),
+        Workload("countdown", _driven(lambda: countdown_program(500_000)), 0),
+        Workload("recursion", _driven(lambda: recursion_program(20_000)), 200_010_000),
+    ]
+}
+
+
+def measure(name: str, engine: str, repeat: int, allocations: bool) -> Dict[str, Any]:
+    """Run a workload in this process, checking its result."""
+    workload = WORKLOADS[name]
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        instructions, result = workload.run(engine)
+        times.append(perf_counter() - start)
+        if workload.expected is not None and result != workload.expected:
+            raise RuntimeError(
+                f"{name} on {engine} gave {result}, expected {workload.expected}."
+            )
+    measurement = {
+        "workload": name,
+        "engine": engine,
+        "instructions": instructions,
+        "seconds": min(times),
+        "first_seconds": times[0],
+        "instructions_per_second": instructions / min(times),
+        # Kilobytes on Linux, but bytes on macOS.
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if allocations:
+        tracemalloc.start()
+        workload.run(engine)
+        measurement["peak_allocated_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return measurement
+
+
+def run_benchmarks(
+    workloads: Sequence[str], engines: Sequence[str], repeat: int, allocations: bool
+) -> List[Dict[str, Any]]:
+    results = []
+    for name in workloads:
+        for engine in engines:
+            command = [sys.executable, __file__, "--worker", name, engine]
+            command += ["--repeat", str(repeat)]
+            if allocations:
+                command.append("--allocations")
+            worker = subprocess.run(command, capture_output=True, text=True)
+            if worker.returncode:
+                raise RuntimeError(f"{name} on {engine} failed:\n{worker.stderr}")
+            result = json.loads(worker.stdout)
+            results.append(result)
+            print(_format_result(result), file=sys.stderr)
+    return results
+
+
+def _format_result(result: Dict[str, Any]) -> str:
+    line = (
+        f"{result['workload']:<14} {result['engine']:<12}"
+        f"{result['instructions']:>11,} instr"
+        f"{result['seconds']:>9.3f}s"
+        f"{result['instructions_per_second'] / 1e6:>8.2f}M/s"
+        f"{result['peak_rss'] / 1024:>8.1f}MiB RSS"
+    )
+    if "peak_allocated_bytes" in result:
+        line += f"{result['peak_allocated_bytes'] / 2**20:>8.1f}MiB allocated"
+    return line
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> bool:
+    """Print the change in throughput from the baseline.
+
+    Returns False if any workload is slower than the baseline by more than
+    the tolerance (as a fraction).
+    """
+    previous = {(r["workload"], r["engine"]): r for r in baseline}
+    acceptable = True
+    for result in results:
+        before = previous.get((result["workload"], result["engine"]))
+        if before is None:
+            continue
+        ratio = result["instructions_per_second"] / before["instructions_per_second"]
+        regressed = ratio < 1 - tolerance
+        acceptable &= not regressed
+        print(
+            f"{result['workload']:<14} {result['engine']:<12}"
+            f"{ratio:>7.2f}x{'  REGRESSED' if regressed else ''}"
+        )
+    return acceptable
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the IntCode engines.")
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS))
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--allocations",
+        action="store_true",
+        help="also measure peak allocations, in a separate (slow) run",
+    )
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, help="compare with saved results")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        name, engine = args.worker
+        print(json.dumps(measure(name, engine, args.repeat, args.allocations)))
+        return 0
+
+    unknown = set(args.workloads) - WORKLOADS.keys() | set(args.engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"Unknown workloads or engines: {', '.join(sorted(unknown))}")
+    results = run_benchmarks(
+        args.workloads, args.engines, args.repeat, args.allocations
+    )
+    if args.output:
+        report = {"python": platform.python_version(), "results": results}
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        if not compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,66 +1,176 @@
 from __future__ import annotations
 
+from array import array
 from collections import deque
-from operator import add, mul
+from enum import Enum
 from typing import (
     Callable,
     Deque,
     Dict,
+    Iterable,
     List,
     NamedTuple,
-    NoReturn,
     Optional,
+    Sequence,
+    Set,
     Tuple,
     Union,
 )
 
 from aoc import split_number_by_places
+from intcode_compiler import CodeMap, CompiledBlock, cached_block
+from intcode_fusion import FusedFunction, fused_function
+from intcode_memory import PAGE_BITS, PAGE_MASK, PAGE_SIZE, PagedMemory
+from intcode_snapshot import PathLike, Snapshot, read_snapshot, write_snapshot
 
 ParameterModeList = List[int]
+ParameterHandler = Callable[["IntCode", int], int]
 
 
 class Instruction(NamedTuple):
     opcode: int
     length: int
     store_result: bool
-    action: Union[
-        Callable[[int, int], int],
-        Callable[[int, int], None],
-        Callable[[int], None],
-        Callable[[], int],
-        Callable[[], NoReturn],
-    ]
+    mnemonic: str
+
+
+INSTRUCTIONS: Dict[int, Instruction] = {
+    1: Instruction(1, 4, True, "add"),
+    2: Instruction(2, 4, True, "mul"),
+    3: Instruction(3, 2, True, "in"),
+    4: Instruction(4, 2, False, "out"),
+    5: Instruction(5, 3, False, "jnz"),  # Jump if true
+    6: Instruction(6, 3, False, "jz"),  # Jump if false
+    7: Instruction(7, 4, True, "lt"),
+    8: Instruction(8, 4, True, "eq"),
+    9: Instruction(9, 2, False, "arb"),  # Adjust relative base
+    99: Instruction(99, 1, False, "halt"),
+}
+
+
+class DecodedInstruction(NamedTuple):
+    """An instruction with its parameter modes resolved to handler functions.
+
+    Decoded instructions depend only on the opcode word, not on the machine
+    executing them, so they can be shared between clones.
+    """
+
+    opcode: int
+    length: int
+    store_result: bool
+    parameter_handlers: Tuple[ParameterHandler, ...]
+    destination_handler: Optional[ParameterHandler]
+
+
+def _load_direct(machine: IntCode, address: int) -> int:
+    return machine._memory.pages[address >> PAGE_BITS][address & PAGE_MASK]
+
+
+def _load_immediate(machine: IntCode, immediate: int) -> int:
+    return immediate
+
+
+def _load_relative(machine: IntCode, offset: int) -> int:
+    address = machine._relative_addressing_base + offset
+    return machine._memory.pages[address >> PAGE_BITS][address & PAGE_MASK]
+
+
+def _destination_direct(machine: IntCode, address: int) -> int:
+    return address
+
+
+def _destination_relative(machine: IntCode, offset: int) -> int:
+    return machine._relative_addressing_base + offset
+
+
+_PARAMETER_HANDLERS: Dict[int, ParameterHandler] = {
+    0: _load_direct,
+    1: _load_immediate,
+    2: _load_relative,
+}
+
+_DESTINATION_HANDLERS: Dict[int, ParameterHandler] = {
+    0: _destination_direct,
+    2: _destination_relative,
+}
+
+# Decodings by full opcode (including parameter modes), shared by all machines.
+_decoded_opcodes: Dict[int, DecodedInstruction] = {}
 
 
 class HaltExecution(Exception):
     pass
 
 
+class AwaitingInput(Exception):
+    pass
+
+
+class MachineState(Enum):
+    """Why a machine stopped running."""
+
+    NEEDS_INPUT = 0
+    OUTPUT_READY = 1
+    HALTED = 2
+    PREEMPTED = 3
+
+
+ENGINES = ("interpreter", "fused", "compiled")
+
+
 class IntCode:
     _PC: int
-    _PC_modified: bool
-    _PC_pending_increment: Optional[int] = None
     _relative_addressing_base: int = 0
-    _memory: List[int]
-    _instructions: Dict[int, Instruction]
-    _param_modes: Dict[int, Callable[[int], int]]
+    _memory: PagedMemory
+    _decoded: Dict[int, DecodedInstruction]
+    # Superinstructions by address, or None where the pair there can't fuse.
+    _fused: Dict[int, Optional[FusedFunction]]
     _has_halted: bool = False
-    input_action: Callable[[int], None]
-    output_action: Callable[[], int]
+    _state: MachineState
+    _outputs_left: int = -1
+    instructions_executed: int = 0
+    input_action: Callable[[], int]
+    output_action: Callable[[int], None]
     input_queue: Deque[int]
     output_queue: Deque[int]
+    # Whether input comes from the input queue, rather than a custom action.
+    _queued_input: bool = True
     _description: str
+    _engine: str
+    _blocks: Dict[int, CompiledBlock]
+    _code: CodeMap
+    # Times the compiled engine has entered each address without a block.
+    _block_entries: Dict[int, int]
+    # Code entered fewer times than this is interpreted rather than compiled,
+    # so code that only runs once (such as a patched program's first block)
+    # isn't worth compiling.
+    compile_threshold: int = 2
+    _modified_code: Set[int]
 
     def __init__(
         self,
-        program: List[int],
-        input_action: Optional[Callable[[int], None]] = None,
-        output_action: Optional[Callable[[], int]] = None,
+        program: Union[List[int], PagedMemory],
+        input_action: Optional[Callable[[], int]] = None,
+        output_action: Optional[Callable[[int], None]] = None,
         description: Optional[str] = None,
+        engine: str = "interpreter",
     ):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}.")
         self._PC = 0
-        self._PC_modified = False
-        self._memory = program[:]
+        if isinstance(program, PagedMemory):
+            # Share the loaded image, copying pages only as they're written.
+            self._memory = program.fork()
+        else:
+            self._memory = PagedMemory(program)
+        self._decoded = {}
+        self._fused = {}
+
+        self._engine = engine
+        self._blocks = {}
+        self._code = {}
+        self._block_entries = {}
+        self._modified_code = set()
 
         self.input_queue = deque()
         self.output_queue = deque()
@@ -71,141 +181,361 @@ class IntCode:
             self._description = f"<IntCode @ {id(self)}"
 
         if input_action is not None:
-            self.input_action = input_action  # type: ignore
+            self.input_action = input_action
+            self._queued_input = False
         else:
-            self.input_action = self.input_queue.popleft  # type: ignore
+            self.input_action = self.input_queue.popleft
 
         if output_action is not None:
-            self.output_action = output_action  # type: ignore
+            self.output_action = output_action
         else:
-            self.output_action = self.output_queue.append  # type: ignore
-
-        self._instructions = {
-            1: Instruction(1, 4, True, add),
-            2: Instruction(2, 4, True, mul),
-            3: Instruction(3, 2, True, self._input),
-            4: Instruction(4, 2, False, self._output),
-            5: Instruction(5, 3, False, self._jump_if_true),
-            6: Instruction(6, 3, False, self._jump_if_false),
-            7: Instruction(7, 4, True, lambda a, b: int(a < b)),
-            8: Instruction(8, 4, True, lambda a, b: int(a == b)),
-            9: Instruction(9, 2, False, self._adjust_relative_base),
-            99: Instruction(99, 1, False, self._halt_execution),
-        }
-
-        self._param_modes = {
-            # Direct addressing
-            0: self._load,
-            # Immediate addressing
-            1: lambda immediate: immediate,
-            # Base + offset (relative) addressing
-            2: lambda offset: self._load(self._relative_addressing_base + offset),
-        }
+            self.output_action = self.output_queue.append
 
     def __repr__(self) -> str:
         return self._description
 
-    def _ensure_memory_capacity(self, index: int) -> None:
-        """Extend memory with zeroes to accommodate given index."""
-        if index < len(self._memory):
-            return
-        new_allocation = [0 for _ in range(index * 2)]
-        new_allocation[0 : len(self._memory)] = self._memory
-        self._memory = new_allocation
-
     def _store(self, value: int, address: int) -> None:
-        self._ensure_memory_capacity(address)
-        self._memory[address] = value
+        number = address >> PAGE_BITS
+        if number in self._memory.owned:
+            self._memory.pages[number][address & PAGE_MASK] = value
+        else:
+            # Copy or allocate the page (or reject a negative address)
+            self._memory[address] = value
+        if address in self._decoded:
+            # Self-modifying code: the cached decoding is stale.
+            del self._decoded[address]
+            self._unfuse(address)
+        if address in self._code:
+            self._code_written(address, self._PC, self._relative_addressing_base)
 
     def _load(self, address: int) -> int:
-        self._ensure_memory_capacity(address)
-        return self._memory[address]
-
-    def _halt_execution(self) -> NoReturn:
-        self._has_halted = True
-        raise HaltExecution()
+        return self._memory.pages[address >> PAGE_BITS][address & PAGE_MASK]
 
     def has_halted(self) -> bool:
         return self._has_halted
 
-    def _jump_if_true(self, first: int, second: int) -> None:
-        if first:
-            self._PC = second
-            self._PC_modified = True
-
-    def _jump_if_false(self, first: int, second: int) -> None:
-        return self._jump_if_true(not first, second)
-
-    def _adjust_relative_base(self, adjustment: int) -> None:
-        self._relative_addressing_base += adjustment
-
     def parse_opcode(self, full_opcode: int) -> Tuple[ParameterModeList, Instruction]:
+        if full_opcode < 0:
+            raise ValueError(f"Invalid opcode {full_opcode}.")
         modes, opcode = divmod(full_opcode, 100)
         # Reverse the mode list as the modes are given in reverse order
         # in the 'full' opcode.
         mode_list = list(reversed(split_number_by_places(modes)))
         if len(mode_list) < 5:
             mode_list += [0 for _ in range(5 - len(mode_list))]
-        return mode_list, self._instructions[opcode]
-
-    def _parse_destination_address(self, raw_address: int, mode: int) -> int:
-        if mode == 0:
-            # Direct addressing
-            return raw_address
-        if mode == 2:
-            # Base + offset addressing
-            return self._relative_addressing_base + raw_address
-        raise ValueError("Unknown destination parameter mode.")
-
-    def load_parameters(
-        self, parameters: List[int], modes: ParameterModeList
-    ) -> List[int]:
-        return [
-            self._param_modes[mode](param) for param, mode in zip(parameters, modes)
-        ]
+        return mode_list, INSTRUCTIONS[opcode]
+
+    def _decode(self, address: int) -> DecodedInstruction:
+        """Decode the instruction at address and cache it by address."""
+        full_opcode = self._load(address)
+        decoded = _decoded_opcodes.get(full_opcode)
+        if decoded is None:
+            decoded = self._decode_opcode(full_opcode)
+            _decoded_opcodes[full_opcode] = decoded
+        self._decoded[address] = decoded
+        return decoded
+
+    def _decode_opcode(self, full_opcode: int) -> DecodedInstruction:
+        modes, instruction = self.parse_opcode(full_opcode)
+        opcode, length, store_result, _ = instruction
+        num_loaded = length - 2 if store_result else length - 1
+        try:
+            return DecodedInstruction(
+                opcode=opcode,
+                length=length,
+                store_result=store_result,
+                parameter_handlers=tuple(
+                    _PARAMETER_HANDLERS[mode] for mode in modes[:num_loaded]
+                ),
+                destination_handler=(
+                    _DESTINATION_HANDLERS[modes[num_loaded]] if store_result else None
+                ),
+            )
+        except KeyError as e:
+            raise ValueError(f"Unknown parameter mode {e.args[0]}.") from e
 
     def step(self) -> None:
-        if self._PC_pending_increment is not None:
-            # Handle early termination of the step function
-            self._PC += self._PC_pending_increment
-
-        opcode = self._memory[self._PC]
-        parameter_modes, instruction = self.parse_opcode(opcode)
-        _, length, store_result, action = instruction
-        args = self._memory[self._PC + 1 : self._PC + length]
-        # Ensure 1-to-1 match between parameters (in args) and modes
-        parameter_modes = parameter_modes[: len(args)]
-
-        self._PC_pending_increment = length
-
-        if store_result:
-            parameters = self.load_parameters(args[:-1], parameter_modes[:-1])
-            destination = self._parse_destination_address(args[-1], parameter_modes[-1])
-            result = action(*parameters)
-            assert isinstance(result, int)
-            self._store(result, destination)
-        else:
-            parameters = self.load_parameters(args, parameter_modes)
-            action(*parameters)
-
-        if not self._PC_modified:
-            self._PC += length
+        """Execute a single instruction.
+
+        Raises HaltExecution on halting, and AwaitingInput if the instruction
+        needs input that hasn't been passed in, in which case it is executed
+        again by the next step.
+        """
+        if self._has_halted:
+            raise HaltExecution()
+        self._outputs_left = -1
+        state = self._run_interpreted(1)
+        if state is MachineState.HALTED:
+            raise HaltExecution()
+        if state is MachineState.NEEDS_INPUT:
+            raise AwaitingInput(f"{self} is waiting for input.")
+
+    def run(
+        self, max_outputs: Optional[int] = None, max_instructions: Optional[int] = None
+    ) -> MachineState:
+        """Run until the machine needs input, has output enough values, or halts.
+
+        A machine waiting for input stops at the input instruction, and
+        carries on from there once input has been passed in. If max_outputs
+        is given, the machine stops after producing that many outputs, and
+        if max_instructions is given it is preempted after executing that
+        many instructions. Compiled machines are only preempted between
+        blocks, so may overrun the limit by up to a block.
+        """
+        if self._has_halted:
+            return MachineState.HALTED
+        if max_outputs is not None and max_outputs < 1:
+            raise ValueError(f"Cannot stop after {max_outputs} outputs.")
+        if max_instructions is not None and max_instructions < 1:
+            raise ValueError(f"Cannot stop after {max_instructions} instructions.")
+        self._outputs_left = -1 if max_outputs is None else max_outputs
+        limit = -1 if max_instructions is None else max_instructions
+        if self._engine == "compiled":
+            return self._run_compiled(limit)
+        if self._engine == "fused":
+            state = self._run_fused(limit)
         else:
-            self._PC_modified = False
-        self._PC_pending_increment = None
+            state = self._run_interpreted(limit)
+        return MachineState.PREEMPTED if state is None else state
 
     def run_until_halt(self) -> None:
+        if self.run() is MachineState.NEEDS_INPUT:
+            raise AwaitingInput(f"{self} is waiting for input.")
+
+    def _run_interpreted(self, instruction_limit: int) -> Optional[MachineState]:
+        """Interpret instructions until the machine stops.
+
+        Returns None if instruction_limit instructions have been executed
+        first; a negative limit means the machine runs until it stops. The
+        program counter and instruction count are saved before calling an
+        I/O action. An input
+        action that raises leaves the machine at its instruction, to read
+        again; an output action that raises leaves it after the instruction,
+        so that the value isn't output again.
+        """
+        pc = self._PC
+        memory = self._memory
+        pages = memory.pages
+        decoded_instructions = self._decoded
+        store = self._store
+        input_queue = self.input_queue
+        limit = instruction_limit
+        state = None
+        while instruction_limit:
+            instruction_limit -= 1
+            try:
+                decoded = decoded_instructions[pc]
+            except KeyError:
+                decoded = self._decode(pc)
+            opcode, length, _, handlers, destination = decoded
+
+            offset = pc & PAGE_MASK
+            operands: Sequence[int]
+            if offset + length <= PAGE_SIZE:
+                operands = pages[pc >> PAGE_BITS][offset + 1 : offset + length]
+            else:
+                operands = memory.words(pc + 1, length - 1)
+
+            if length == 4:
+                first, second, third = operands
+                load_first, load_second = handlers
+                first, second = load_first(self, first), load_second(self, second)
+                if opcode == 1:
+                    result = first + second
+                elif opcode == 2:
+                    result = first * second
+                elif opcode == 7:
+                    result = int(first < second)
+                else:
+                    result = int(first == second)
+                store(result, destination(self, third))  # type: ignore
+            elif length == 3:
+                first, second = operands
+                load_first, load_second = handlers
+                if bool(load_first(self, first)) is (opcode == 5):
+                    pc = load_second(self, second)
+                    continue
+            elif opcode == 9:
+                self._relative_addressing_base += handlers[0](self, operands[0])
+            elif opcode == 4:
+                pc += length
+                self._PC = pc
+                self.instructions_executed += limit - instruction_limit
+                limit = instruction_limit
+                self.output_action(handlers[0](self, operands[0]))
+                self._outputs_left -= 1
+                if not self._outputs_left:
+                    state = MachineState.OUTPUT_READY
+                    break
+                continue
+            elif opcode == 3:
+                self._PC = pc
+                # Only the instructions before this one, which is read again
+                # on resuming if the read raises.
+                self.instructions_executed += limit - instruction_limit - 1
+                limit = instruction_limit + 1
+                if input_queue and self._queued_input:
+                    value = input_queue.popleft()
+                else:
+                    read = self._read_input()
+                    if read is None:
+                        # Not executed after all, so it doesn't count.
+                        instruction_limit += 1
+                        state = MachineState.NEEDS_INPUT
+                        break
+                    value = read
+                store(value, destination(self, operands[0]))  # type: ignore
+            else:
+                self._has_halted = True
+                state = MachineState.HALTED
+                break
+            pc += length
+
+        self._PC = pc
+        self.instructions_executed += limit - instruction_limit
+        return state
+
+    def _run_fused(self, instruction_limit: int) -> Optional[MachineState]:
+        """Interpret instructions, running fusable pairs as superinstructions.
+
+        Instructions that don't start a fusable pair, and pairs that decline
+        to run, are executed one at a time by the interpreter. Returns as
+        `_run_interpreted` does.
+        """
+        pc = self._PC
+        memory = self._memory
+        pages = memory.pages
+        owned = memory.owned
+        decoded_instructions = self._decoded
+        fused_instructions = self._fused
+        fused_executed = 0
+        state = None
+        while instruction_limit:
+            try:
+                fused = fused_instructions[pc]
+            except KeyError:
+                fused = self._fuse(pc)
+            if fused is not None and instruction_limit != 1:
+                next_pc = fused(self, pc, pages, owned, decoded_instructions)
+                if next_pc is not None:
+                    pc = next_pc
+                    instruction_limit -= 2
+                    fused_executed += 2
+                    continue
+            self._PC = pc
+            # Counted before the instruction, in case it calls out and raises.
+            self.instructions_executed += fused_executed
+            fused_executed = 0
+            state = self._run_interpreted(1)
+            if state is not None:
+                break
+            instruction_limit -= 1
+            pc = self._PC
+
+        if state is None:
+            self._PC = pc
+        self.instructions_executed += fused_executed
+        return state
+
+    def _fuse(self, pc: int) -> Optional[FusedFunction]:
+        """Find the superinstruction for the pair at pc, and cache it by pc."""
+        fused = None
         try:
-            while True:
-                self.step()
-        except HaltExecution:
+            first = self._decoded.get(pc) or self._decode(pc)
+            second_pc = pc + first.length
+            second = self._decoded.get(second_pc) or self._decode(second_pc)
+            # Superinstructions read their operands from the first's page.
+            if (pc & PAGE_MASK) + first.length + second.length <= PAGE_SIZE:
+                fused = fused_function(
+                    first, self._load(pc), second, self._load(second_pc)
+                )
+        except (KeyError, ValueError):
+            # Not valid code (yet), so leave it to the interpreter.
             pass
+        self._fused[pc] = fused
+        return fused
+
+    def _unfuse(self, address: int) -> None:
+        """Drop superinstructions that may include the opcode at address."""
+        longest = max(instruction.length for instruction in INSTRUCTIONS.values())
+        for start in range(address - longest, address + 1):
+            self._fused.pop(start, None)
+
+    def _run_compiled(self, instruction_limit: int) -> MachineState:
+        # Compiled stores don't maintain the interpreter's decode cache.
+        self._decoded.clear()
+
+        pc = self._PC
+        rb = self._relative_addressing_base
+        memory = self._memory
+        blocks = self._blocks
+        code = self._code
+        stop_at = None
+        if instruction_limit >= 0:
+            stop_at = self.instructions_executed + instruction_limit
+        while True:
+            if stop_at is not None and self.instructions_executed >= stop_at:
+                self._PC = pc
+                self._relative_addressing_base = rb
+                return MachineState.PREEMPTED
+            try:
+                block = blocks[pc]
+            except KeyError:
+                entries = self._block_entries.get(pc, 0) + 1
+                self._block_entries[pc] = entries
+                adopted = None
+                if entries >= self.compile_threshold:
+                    adopted = self._adopt_block(pc)
+                if adopted is None:
+                    # Cold, self-modified or uncompilable code, so interpret it.
+                    self._PC = pc
+                    self._relative_addressing_base = rb
+                    state = self._run_interpreted(1)
+                    self._decoded.clear()
+                    if state is not None:
+                        return state
+                    pc = self._PC
+                    rb = self._relative_addressing_base
+                    continue
+                block = adopted
+            resume = block.function(self, memory, rb, code)
+            if resume is None:
+                # The block saved the machine state before stopping.
+                return self._state
+            pc, rb = resume
+
+    def _adopt_block(self, start: int) -> Optional[CompiledBlock]:
+        """Fetch the compiled block starting at start, and track its code."""
+        block = cached_block(self, start)
+        if block is None:
+            return None
+        self._blocks[start] = block
+        for address in range(block.start, block.end):
+            self._code[address] = self._code.get(address, ()) + (start,)
+        return block
+
+    def _code_written(self, address: int, next_pc: int, rb: int) -> Tuple[int, int]:
+        """Discard compiled blocks overwritten by a store to address.
+
+        The modified code is interpreted from then on. Returns the state from
+        which compiled code should resume execution.
+        """
+        self._modified_code.add(address)
+        for start in self._code.pop(address, ()):
+            block = self._blocks.pop(start)
+            for covered in range(block.start, block.end):
+                remaining = tuple(s for s in self._code.get(covered, ()) if s != start)
+                if remaining:
+                    self._code[covered] = remaining
+                else:
+                    self._code.pop(covered, None)
+        return next_pc, rb
 
     @classmethod
     def execute_program(cls, input_data: List[int]) -> List[int]:
         computer = cls(input_data)
         computer.run_until_halt()
-        return computer._memory
+        return computer._memory.to_list()
 
     def pass_input(self, value: int) -> None:
         self.input_queue.append(value)
@@ -216,23 +546,69 @@ class IntCode:
     def read_output(self) -> int:
         return self.output_queue.popleft()
 
-    def _input(self) -> int:
-        return self.input_action()  # type: ignore
-
-    def _output(self, value: int) -> None:
-        self.output_action(value)  # type: ignore
+    def feed(self, values: Union[Iterable[int], bytes, str]) -> None:
+        """Pass in many inputs at once, with text passed as ASCII codes."""
+        if isinstance(values, str):
+            values = values.encode("ascii")
+        self.input_queue.extend(values)
+
+    def drain(self) -> array[int]:
+        """Read all the waiting outputs."""
+        outputs = array("q", self.output_queue)
+        self.output_queue.clear()
+        return outputs
+
+    def drain_bytes(self) -> bytes:
+        """Read all the waiting outputs, which must all be byte values.
+
+        The outputs are held as integers in the output queue, so this copies
+        them into new bytes, in a single call rather than value by value.
+        """
+        outputs = bytes(self.output_queue)
+        self.output_queue.clear()
+        return outputs
+
+    def drain_text(self) -> str:
+        """Read all the waiting outputs as ASCII text."""
+        return self.drain_bytes().decode("ascii")
+
+    def _read_input(self) -> Optional[int]:
+        """Take the next input, or None if the input queue is empty."""
+        if not self.input_queue and self._queued_input:
+            return None
+        return self.input_action()
+
+    def _wait_for_input(self, pc: int, rb: int) -> None:
+        self._PC, self._relative_addressing_base = pc, rb
+        self._state = MachineState.NEEDS_INPUT
+
+    def _output_ready(self, pc: int, rb: int) -> None:
+        self._PC, self._relative_addressing_base = pc, rb
+        self._state = MachineState.OUTPUT_READY
+
+    def _halt(self, pc: int, rb: int) -> None:
+        self._PC, self._relative_addressing_base = pc, rb
+        self._state = MachineState.HALTED
+        self._has_halted = True
 
     def clone(self) -> IntCode:
         new = IntCode(
             program=[],
             description=self._description,
+            engine=self._engine,
         )
-        new._memory = self._memory[:]
+        new._memory = self._memory.fork()
+        new._decoded = self._decoded.copy()
+        new._fused = self._fused.copy()
+        new._blocks = self._blocks.copy()
+        new._code = self._code.copy()
+        new._block_entries = self._block_entries.copy()
+        new.compile_threshold = self.compile_threshold
+        new._modified_code = self._modified_code.copy()
         new._PC = self._PC
-        new._PC_modified = self._PC_modified
-        new._PC_pending_increment = self._PC_pending_increment
         new._relative_addressing_base = self._relative_addressing_base
         new._has_halted = self._has_halted
+        new.instructions_executed = self.instructions_executed
         new.input_queue = deque(self.input_queue)
         new.input_action = new.input_queue.popleft
         new.output_queue = deque(self.output_queue)
@@ -240,6 +616,36 @@ class IntCode:
 
         return new
 
+    def save(self, path: PathLike, compress_zero_runs: bool = False) -> None:
+        """Write the machine's state to a snapshot file."""
+        snapshot = Snapshot(
+            memory=self._memory,
+            pc=self._PC,
+            relative_base=self._relative_addressing_base,
+            halted=self._has_halted,
+            input_queue=list(self.input_queue),
+            output_queue=list(self.output_queue),
+            description=self._description,
+            engine=self._engine,
+            instructions_executed=self.instructions_executed,
+        )
+        write_snapshot(path, snapshot, compress_zero_runs)
+
+    @classmethod
+    def load(cls, path: PathLike) -> IntCode:
+        """Create a machine from a snapshot file written by `save`."""
+        snapshot = read_snapshot(path)
+        machine = cls(
+            snapshot.memory, description=snapshot.description, engine=snapshot.engine
+        )
+        machine._PC = snapshot.pc
+        machine._relative_addressing_base = snapshot.relative_base
+        machine._has_halted = snapshot.halted
+        machine.instructions_executed = snapshot.instructions_executed
+        machine.input_queue.extend(snapshot.input_queue)
+        machine.output_queue.extend(snapshot.output_queue)
+        return machine
+
 
 def parse_program(puzzle_input: str) -> List[int]:
     return [int(x) for x in puzzle_input.split(",")]
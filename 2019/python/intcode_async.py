@@ -0,0 +1,64 @@
+"""IntCode machines connected by asyncio queues.
+
+Each machine runs on the event loop as a task, taking its input from one
+`asyncio.Queue` and putting its outputs on another. Machines run at the speed
+of the synchronous VM until they need input that hasn't arrived, and only
+then yield to the event loop, so a network of hundreds of machines runs on a
+single thread.
+
+A network is wired up by connecting machines, after which the output queue
+of each source machine is the input queue of its destination.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Iterable, List, Optional, Union
+
+from intcode import IntCode, MachineState, PagedMemory
+
+
+class AsyncIntCode:
+    machine: IntCode
+    inputs: asyncio.Queue[int]
+    outputs: asyncio.Queue[int]
+
+    def __init__(
+        self,
+        program: Union[List[int], PagedMemory],
+        description: Optional[str] = None,
+        engine: str = "interpreter",
+    ):
+        self.machine = IntCode(program, description=description, engine=engine)
+        self.inputs = asyncio.Queue()
+        self.outputs = asyncio.Queue()
+
+    def __repr__(self) -> str:
+        return repr(self.machine)
+
+    def pass_input(self, value: int) -> None:
+        self.inputs.put_nowait(value)
+
+    async def run(self) -> None:
+        """Run the machine until it halts, waiting for input as needed."""
+        machine = self.machine
+        while True:
+            state = machine.run()
+            while machine.has_output():
+                self.outputs.put_nowait(machine.read_output())
+            if state is MachineState.HALTED:
+                return
+            machine.pass_input(await self.inputs.get())
+            while not self.inputs.empty():
+                # Take any other waiting input without yielding again.
+                machine.pass_input(self.inputs.get_nowait())
+
+
+def connect(source: AsyncIntCode, destination: AsyncIntCode) -> None:
+    """Send the source machine's outputs to the destination machine."""
+    source.outputs = destination.inputs
+
+
+async def run_network(machines: Iterable[AsyncIntCode]) -> None:
+    """Run the machines concurrently until they have all halted."""
+    await asyncio.gather(*(machine.run() for machine in machines))
@@ -0,0 +1,216 @@
+"""Lockstep execution of many IntCode instances with NumPy.
+
+A batch runs copies of one program side by side, each with its own memory
+row, program counter, relative base and inputs, so they can differ in their
+patches or inputs. On each tick the running instances are grouped by their
+program counter and opcode word, and each group executes its instruction as
+a handful of array operations. Programs with little data-dependent control
+flow, like brute-force searches over patches or inputs, stay in a few large
+groups and run far faster than one machine at a time.
+
+Memory rows grow to fit the highest address written. Unlike `IntCode`,
+arithmetic wraps on overflowing 64 bits. An instance that hits an invalid
+instruction or stores to a negative address fails on its own, without
+stopping the rest of the batch.
+"""
+
+from __future__ import annotations
+
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from intcode import INSTRUCTIONS
+
+_MAX_WIDTH = 1 << 20
+
+Inputs = Union[np.ndarray, Sequence[Sequence[int]]]
+
+
+class BatchIntCode:
+    memory: np.ndarray
+    pc: np.ndarray
+    relative_base: np.ndarray
+    halted: np.ndarray
+    failed: np.ndarray
+    inputs: np.ndarray
+    input_count: np.ndarray
+    input_position: np.ndarray
+    outputs: np.ndarray
+    output_count: np.ndarray
+
+    def __init__(
+        self, program: Sequence[int], count: int, inputs: Optional[Inputs] = None
+    ):
+        self.memory = np.tile(np.array(program, dtype=np.int64), (count, 1))
+        self.pc = np.zeros(count, dtype=np.int64)
+        self.relative_base = np.zeros(count, dtype=np.int64)
+        self.halted = np.zeros(count, dtype=bool)
+        self.failed = np.zeros(count, dtype=bool)
+        self.inputs = np.zeros((count, 0), dtype=np.int64)
+        self.input_count = np.zeros(count, dtype=np.int64)
+        self.input_position = np.zeros(count, dtype=np.int64)
+        self.outputs = np.zeros((count, 0), dtype=np.int64)
+        self.output_count = np.zeros(count, dtype=np.int64)
+        if inputs is not None:
+            if len(inputs) != count:
+                raise ValueError(f"Expected inputs for {count} instances.")
+            for column in range(max((len(row) for row in inputs), default=0)):
+                has_input = np.array([len(row) > column for row in inputs])
+                values = [row[column] for row in inputs if len(row) > column]
+                self.pass_input(values, np.flatnonzero(has_input))
+
+    def __len__(self) -> int:
+        return len(self.pc)
+
+    def pass_input(
+        self,
+        values: Union[np.ndarray, Sequence[int]],
+        instances: Union[np.ndarray, Sequence[int], None] = None,
+    ) -> None:
+        """Queue an input for each instance given (by default, all of them)."""
+        if instances is None:
+            instances = np.arange(len(self))
+        end = self.input_count[instances]
+        self.inputs = _fit_columns(self.inputs, int(end.max(initial=0)) + 1)
+        self.inputs[instances, end] = values
+        self.input_count[instances] += 1
+
+    def output_values(self, instance: int) -> List[int]:
+        return self.outputs[instance, : self.output_count[instance]].tolist()
+
+    @property
+    def waiting(self) -> np.ndarray:
+        """Which instances are stopped at an input instruction without input."""
+        running = np.flatnonzero(~(self.halted | self.failed))
+        opcodes = self._read(running, self.pc[running]) % 100
+        waiting = np.zeros(len(self), dtype=bool)
+        waiting[running] = (opcodes == 3) & (
+            self.input_position[running] >= self.input_count[running]
+        )
+        return waiting
+
+    def run(self) -> None:
+        """Run until every instance has halted, failed or is waiting for input."""
+        while True:
+            running = np.flatnonzero(~(self.halted | self.failed))
+            if not running.size:
+                return
+            pcs = self.pc[running]
+            words = self._read(running, pcs)
+            groups, group_of = np.unique(
+                np.stack((pcs, words), axis=1), axis=0, return_inverse=True
+            )
+            progressed = False
+            for group, (pc, word) in enumerate(groups):
+                members = running[group_of.ravel() == group]
+                if self._execute(members, int(pc), int(word)):
+                    progressed = True
+            if not progressed:
+                return
+
+    def _execute(self, members: np.ndarray, pc: int, word: int) -> bool:
+        """Execute the instruction for the members, returning whether any ran."""
+        opcode = word % 100
+        modes = ((word // 100) % 10, (word // 1000) % 10, (word // 10000) % 10)
+        instruction = INSTRUCTIONS.get(opcode)
+        if word < 0 or instruction is None or any(m > 2 for m in modes):
+            self.failed[members] = True
+            return True
+        length = instruction.length
+        raw = self._read_block(members, pc + 1, length - 1)
+
+        def load(index: int) -> np.ndarray:
+            if modes[index] == 1:
+                return raw[:, index]
+            return self._read(members, self._address(members, raw, modes, index))
+
+        next_pc = pc + length
+        if opcode in (1, 2, 7, 8):
+            first, second = load(0), load(1)
+            if opcode == 1:
+                result = first + second
+            elif opcode == 2:
+                result = first * second
+            elif opcode == 7:
+                result = (first < second).astype(np.int64)
+            else:
+                result = (first == second).astype(np.int64)
+            stored = self._write(members, raw, modes, 2, result)
+            self.pc[stored] = next_pc
+        elif opcode == 3:
+            has_input = self.input_position[members] < self.input_count[members]
+            if not has_input.any():
+                return False
+            members, raw = members[has_input], raw[has_input]
+            values = self.inputs[members, self.input_position[members]]
+            self.input_position[members] += 1
+            stored = self._write(members, raw, modes, 0, values)
+            self.pc[stored] = next_pc
+        elif opcode == 4:
+            value = load(0)
+            end = self.output_count[members]
+            self.outputs = _fit_columns(self.outputs, int(end.max()) + 1)
+            self.outputs[members, end] = value
+            self.output_count[members] += 1
+            self.pc[members] = next_pc
+        elif opcode in (5, 6):
+            condition, target = load(0) != 0, load(1)
+            if opcode == 6:
+                condition = ~condition
+            self.pc[members] = np.where(condition, target, next_pc)
+        elif opcode == 9:
+            self.relative_base[members] += load(0)
+            self.pc[members] = next_pc
+        else:
+            self.halted[members] = True
+        return True
+
+    def _address(
+        self, members: np.ndarray, raw: np.ndarray, modes: Tuple[int, ...], index: int
+    ) -> np.ndarray:
+        if modes[index] == 2:
+            return self.relative_base[members] + raw[:, index]
+        return raw[:, index]
+
+    def _read(self, members: np.ndarray, addresses: np.ndarray) -> np.ndarray:
+        """Read one address per member, where unused memory reads as zero."""
+        values = np.zeros(len(members), dtype=np.int64)
+        valid = (addresses >= 0) & (addresses < self.memory.shape[1])
+        values[valid] = self.memory[members[valid], addresses[valid]]
+        return values
+
+    def _read_block(self, members: np.ndarray, start: int, count: int) -> np.ndarray:
+        self.memory = _fit_columns(self.memory, min(start + count, _MAX_WIDTH))
+        return self.memory[members, start : start + count]
+
+    def _write(
+        self,
+        members: np.ndarray,
+        raw: np.ndarray,
+        modes: Tuple[int, ...],
+        index: int,
+        values: np.ndarray,
+    ) -> np.ndarray:
+        """Store values for the members, returning those that could store."""
+        if modes[index] == 1:
+            self.failed[members] = True
+            return members[:0]
+        addresses = self._address(members, raw, modes, index)
+        valid = (addresses >= 0) & (addresses < _MAX_WIDTH)
+        self.failed[members[~valid]] = True
+        members, addresses = members[valid], addresses[valid]
+        if members.size:
+            self.memory = _fit_columns(self.memory, int(addresses.max()) + 1)
+            self.memory[members, addresses] = values[valid]
+        return members
+
+
+def _fit_columns(array: np.ndarray, columns: int) -> np.ndarray:
+    """Widen a 2-D array with zero columns so it has at least this many."""
+    if columns <= array.shape[1]:
+        return array
+    width = max(columns, 2 * array.shape[1])
+    widened = np.zeros((array.shape[0], width), dtype=array.dtype)
+    widened[:, : array.shape[1]] = array
+    return widened
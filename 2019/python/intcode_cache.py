@@ -0,0 +1,181 @@
+"""Memoised execution of IntCode machines.
+
+IntCode machines are deterministic, so running a machine from a given state
+with a given sequence of inputs always produces the same outputs and leaves
+the machine in the same state. The execution cache records these results,
+keyed by the machine state and the inputs, so that repeating a run becomes a
+lookup that restores the resulting state. The key holds the registers and
+inputs themselves, and a BLAKE2 digest of each page of memory, so states only
+share a key if they're the same.
+
+Cached states share memory pages with the machines they came from and with
+the machines restored from them, using copy-on-write forks, so the cache is
+bounded by the number of distinct pages it holds. Runs too big to fit in the
+cache on their own aren't cached. Machines must use their
+input and output queues (not custom I/O actions) to be cached.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections import Counter, OrderedDict
+from typing import Dict, FrozenSet, List, NamedTuple, Sequence, Tuple
+
+from intcode import IntCode, MachineState
+from intcode_memory import PAGE_SIZE, ZERO_PAGE, Page, PagedMemory
+
+# Page numbers and digests of the machine's allocated pages.
+MemoryKey = Tuple[Tuple[int, bytes], ...]
+# Program counter, relative base, halted flag, memory and unread inputs.
+CacheKey = Tuple[int, int, bool, MemoryKey, Tuple[int, ...]]
+
+
+class CachedRun(NamedTuple):
+    state: MachineState
+    outputs: Tuple[int, ...]
+    unread_inputs: Tuple[int, ...]
+    memory: PagedMemory
+    pc: int
+    relative_base: int
+    instructions: int
+    modified_code: FrozenSet[int]
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+
+class ExecutionCache:
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    _runs: OrderedDict[CacheKey, CachedRun]
+    _page_references: Counter[int]
+    _size_bytes: int
+    # Digests of pages shared by forks, which are no longer written in place.
+    _page_digests: Dict[int, Tuple[Page, bytes]]
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._runs = OrderedDict()
+        self._page_references = Counter()
+        self._size_bytes = 0
+        self._page_digests = {}
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            self.hits, self.misses, self.evictions, len(self._runs), self._size_bytes
+        )
+
+    def run(self, machine: IntCode, inputs: Sequence[int] = ()) -> MachineState:
+        """Pass the inputs to the machine and run it, as `run` would.
+
+        The machine runs until it needs more input or halts, unless the
+        result of the same run is cached, in which case the machine is
+        moved straight to the resulting state.
+        """
+        machine.input_queue.extend(inputs)
+        if machine.has_halted():
+            return MachineState.HALTED
+        key = (
+            machine._PC,
+            machine._relative_addressing_base,
+            machine._has_halted,
+            self._memory_key(machine._memory),
+            tuple(machine.input_queue),
+        )
+        cached = self._runs.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._runs.move_to_end(key)
+            self._restore(machine, cached)
+            return cached.state
+
+        self.misses += 1
+        existing_outputs = len(machine.output_queue)
+        instructions = machine.instructions_executed
+        state = machine.run()
+        outputs = list(machine.output_queue)[existing_outputs:]
+        self._add(
+            key,
+            CachedRun(
+                state=state,
+                outputs=tuple(outputs),
+                unread_inputs=tuple(machine.input_queue),
+                memory=machine._memory.fork(),
+                pc=machine._PC,
+                relative_base=machine._relative_addressing_base,
+                instructions=machine.instructions_executed - instructions,
+                modified_code=frozenset(machine._modified_code),
+            ),
+        )
+        return state
+
+    def _memory_key(self, memory: PagedMemory) -> MemoryKey:
+        pages = []
+        for number, page in sorted(memory._allocated()):
+            if number in memory.owned:
+                pages.append((number, _digest(page)))
+                continue
+            known = self._page_digests.get(id(page))
+            if known is None or known[0] is not page:
+                # Keep the page alive so its id isn't reused.
+                known = self._page_digests[id(page)] = (page, _digest(page))
+            pages.append((number, known[1]))
+        return tuple(pages)
+
+    @staticmethod
+    def _restore(machine: IntCode, cached: CachedRun) -> None:
+        machine._memory = cached.memory.fork()
+        machine._PC = cached.pc
+        machine._relative_addressing_base = cached.relative_base
+        machine._has_halted = cached.state is MachineState.HALTED
+        machine.instructions_executed += cached.instructions
+        machine.input_queue.clear()
+        machine.input_queue.extend(cached.unread_inputs)
+        machine.output_queue.extend(cached.outputs)
+        # Code compiled or decoded from the old memory may not match the new.
+        machine._decoded.clear()
+        machine._fused.clear()
+        machine._blocks.clear()
+        machine._code.clear()
+        machine._modified_code = set(cached.modified_code)
+
+    def _add(self, key: CacheKey, run: CachedRun) -> None:
+        run_bytes = 8 * (len(run.outputs) + len(run.unread_inputs))
+        if run_bytes + 8 * PAGE_SIZE * len(self._pages(run)) > self.max_bytes:
+            # Too big to cache even on its own.
+            return
+        self._runs[key] = run
+        self._size_bytes += run_bytes
+        for page in self._pages(run):
+            if not self._page_references[id(page)]:
+                self._size_bytes += 8 * PAGE_SIZE
+            self._page_references[id(page)] += 1
+        while self._size_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        _, run = self._runs.popitem(last=False)
+        self.evictions += 1
+        self._size_bytes -= 8 * (len(run.outputs) + len(run.unread_inputs))
+        for page in self._pages(run):
+            self._page_references[id(page)] -= 1
+            if not self._page_references[id(page)]:
+                del self._page_references[id(page)]
+                self._page_digests.pop(id(page), None)
+                self._size_bytes -= 8 * PAGE_SIZE
+
+    @staticmethod
+    def _pages(run: CachedRun) -> List[Page]:
+        return [page for page in run.memory.pages.values() if page is not ZERO_PAGE]
+
+
+def _digest(page: Page) -> bytes:
+    return hashlib.blake2b(page.tobytes(), digest_size=16).digest()
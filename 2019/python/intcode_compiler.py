@@ -0,0 +1,312 @@
+"""Basic-block compiler for IntCode programs.
+
+Straight-line runs of instructions are translated into Python functions,
+which keep the relative base in a local variable and index memory pages
+directly. Blocks run from their start address to the next unconditional jump or
+halt, leaving early if a conditional jump is taken. A block function returns
+the program counter and relative base to continue from, or None if the machine
+has stopped to wait for input, to hand over its output, or because it halted,
+in which case the block saves the machine state before returning. Blocks add
+the instructions they actually ran to the machine's count as they leave (or
+call out to an I/O action), so a block left early only counts part of itself.
+
+Compiled blocks are cached by their start address and the words they were
+compiled from, so machines running the same code share the compilation work,
+and a machine that has patched its program compiles each patched block once.
+Machines only compile code they've entered at least `compile_threshold` times,
+interpreting it until then, so code that runs once isn't compiled at all.
+"""
+
+from __future__ import annotations
+
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from intcode_memory import PAGE_BITS, PAGE_MASK, PagedMemory
+
+if TYPE_CHECKING:
+    from intcode import IntCode
+
+# Maps addresses covered by compiled code to the start addresses of the blocks
+# that cover them.
+CodeMap = Dict[int, Tuple[int, ...]]
+BlockFunction = Callable[
+    ["IntCode", PagedMemory, int, CodeMap], Optional[Tuple[int, int]]
+]
+
+
+class CompiledBlock(NamedTuple):
+    start: int
+    end: int
+    words: Tuple[int, ...]
+    instructions: int
+    function: BlockFunction
+    source: str
+
+
+class UncompilableInstruction(Exception):
+    pass
+
+
+_MAX_BLOCK_INSTRUCTIONS = 64
+
+_BINARY_OPERATIONS = {
+    1: "{} + {}",
+    2: "{} * {}",
+    7: "int({} < {})",
+    8: "int({} == {})",
+}
+
+_MAX_CACHED_BLOCKS = 10_000
+# Programs patched in many ways can start blocks at the same address.
+_MAX_BLOCKS_PER_START = 16
+
+# Compiled blocks by start address, least recently compiled first.
+_compiled_blocks: Dict[int, List[CompiledBlock]] = {}
+_cached_block_count = 0
+
+
+def _parameter(raw: int, mode: int, bound_pages: Set[int]) -> str:
+    if mode == 0 and raw < 0:
+        raise UncompilableInstruction(f"Negative address {raw}.")
+    if mode == 0:
+        bound_pages.add(raw >> PAGE_BITS)
+        return f"page_{raw >> PAGE_BITS}[{raw & PAGE_MASK}]"
+    if mode == 1:
+        return f"({raw})"
+    if mode == 2:
+        return f"pages[(a := rb + {raw}) >> {PAGE_BITS}][a & {PAGE_MASK}]"
+    raise UncompilableInstruction(f"Unknown parameter mode {mode}.")
+
+
+def _count(instructions: int) -> List[str]:
+    """Add instructions run since the block last counted to the machine's."""
+    return [f"m.instructions_executed += {instructions}"] if instructions else []
+
+
+def _store(
+    value: str,
+    raw: int,
+    mode: int,
+    next_pc: int,
+    bound_pages: Set[int],
+    uncounted: int,
+) -> List[str]:
+    if mode == 0 and raw < 0:
+        raise UncompilableInstruction(f"Negative address {raw}.")
+    if mode == 0:
+        bound_pages.add(raw >> PAGE_BITS)
+        address = f"{raw}"
+        number = f"{raw >> PAGE_BITS}"
+        page = f"page_{raw >> PAGE_BITS}"
+        lines = [f"value = {value}"]
+        offset = f"{raw & PAGE_MASK}"
+    elif mode == 2:
+        address = "address"
+        number = "number"
+        page = "pages[number]"
+        lines = [
+            f"value = {value}",
+            f"address = rb + {raw}",
+            f"number = address >> {PAGE_BITS}",
+        ]
+        offset = f"address & {PAGE_MASK}"
+    else:
+        raise UncompilableInstruction(f"Unknown destination mode {mode}.")
+    code_check = (
+        [f"if {address} in code:"]
+        + [f"    {line}" for line in _count(uncounted)]
+        + [f"    return m._code_written({address}, {next_pc}, rb)"]
+    )
+    return (
+        lines
+        + [
+            f"if {number} not in owned:",
+            # Copying or allocating the page replaces any bound on block entry.
+            f"    mem[{address}] = value",
+        ]
+        + [f"    {line}" for line in code_check]
+        + [f"    {line}" for line in _count(uncounted)]
+        + [f"    return {next_pc}, rb", f"{page}[{offset}] = value"]
+        + code_check
+    )
+
+
+def _synchronise(pc: int, uncounted: int) -> List[str]:
+    """Save machine state before calling out, in case the I/O action raises."""
+    return _count(uncounted) + [f"m._PC = {pc}", "m._relative_addressing_base = rb"]
+
+
+def _translate(
+    opcode: int,
+    modes: List[int],
+    args: List[int],
+    pc: int,
+    bound_pages: Set[int],
+    uncounted: int,
+) -> Tuple[List[str], int]:
+    """Translate an instruction, counting it and any uncounted before it.
+
+    The count is only added to the machine's on leaving the block, or before
+    calling out to the machine. Returns the lines and the number of
+    instructions left uncounted after the instruction if it doesn't exit.
+    """
+    next_pc = pc + 1 + len(args)
+    if opcode in _BINARY_OPERATIONS:
+        first = _parameter(args[0], modes[0], bound_pages)
+        second = _parameter(args[1], modes[1], bound_pages)
+        value = _BINARY_OPERATIONS[opcode].format(first, second)
+        store = _store(value, args[2], modes[2], next_pc, bound_pages, uncounted + 1)
+        return store, uncounted + 1
+    if opcode == 3:
+        store = _store("value", args[0], modes[0], next_pc, bound_pages, 1)
+        return (
+            _synchronise(pc, uncounted)
+            + [
+                "if m.input_queue and m._queued_input:",
+                "    value = m.input_queue.popleft()",
+                "else:",
+                "    value = m._read_input()",
+                "    if value is None:",
+                # Not executed, so not counted.
+                f"        return m._wait_for_input({pc}, rb)",
+            ]
+            + store,
+            1,
+        )
+    if opcode == 4:
+        value = _parameter(args[0], modes[0], bound_pages)
+        return (
+            # Past the instruction, as the interpreter does.
+            _synchronise(next_pc, uncounted + 1)
+            + [
+                f"m.output_action({value})",
+                "m._outputs_left -= 1",
+                "if not m._outputs_left:",
+                f"    return m._output_ready({next_pc}, rb)",
+            ],
+            0,
+        )
+    if opcode in (5, 6):
+        condition = _parameter(args[0], modes[0], bound_pages)
+        target = _parameter(args[1], modes[1], bound_pages)
+        jump = _count(uncounted + 1) + [f"return {target}, rb"]
+        if modes[0] == 1:
+            # Constant condition, so either always or never jump.
+            if bool(args[0]) == (opcode == 5):
+                return jump, 0
+            return [], uncounted + 1
+        test = condition if opcode == 5 else f"not {condition}"
+        return [f"if {test}:"] + [f"    {line}" for line in jump], uncounted + 1
+    if opcode == 9:
+        rb = [f"rb += {_parameter(args[0], modes[0], bound_pages)}"]
+        return rb, uncounted + 1
+    if opcode == 99:
+        return _count(uncounted + 1) + [f"return m._halt({pc}, rb)"], 0
+    raise UncompilableInstruction(f"Unknown opcode {opcode}.")
+
+
+def compile_block(machine: IntCode, start: int) -> Optional[CompiledBlock]:
+    """Compile the block of instructions starting at the given address.
+
+    Returns None if not even the first instruction can be compiled, in which
+    case the caller should fall back to the interpreter.
+    """
+    memory = machine._memory
+    modified = machine._modified_code
+    lines: List[str] = []
+    bound_pages: Set[int] = set()
+    pc = start
+    count = 0
+    uncounted = 0
+    for _ in range(_MAX_BLOCK_INSTRUCTIONS):
+        if pc < 0 or memory[pc] < 0:
+            # Negative words aren't valid opcodes (and may well be data).
+            break
+        try:
+            modes, instruction = machine.parse_opcode(memory[pc])
+        except KeyError:
+            break
+        opcode, length = instruction.opcode, instruction.length
+        if not modified.isdisjoint(range(pc, pc + length)):
+            break
+        try:
+            translated, uncounted = _translate(
+                opcode, modes, memory[pc + 1 : pc + length], pc, bound_pages, uncounted
+            )
+        except UncompilableInstruction:
+            break
+        lines.append(f"# {pc}: {memory[pc:pc + length]}")
+        lines.extend(translated)
+        pc += length
+        count += 1
+        if translated and translated[-1].startswith("return"):
+            # Halt or unconditional jump
+            break
+
+    if pc == start:
+        return None
+    # Unreachable after an unconditional jump or halt, but harmless.
+    lines.extend(_count(uncounted))
+    lines.append(f"return {pc}, rb")
+
+    name = f"block_{start}"
+    source = "\n".join(
+        [
+            f"def {name}(m, mem, rb, code):",
+            "    pages = mem.pages",
+            "    owned = mem.owned",
+        ]
+        + [f"    page_{number} = pages[{number}]" for number in sorted(bound_pages)]
+        + [f"    {line}" for line in lines]
+    )
+    namespace: Dict[str, Any] = {}
+    exec(compile(source, f"<intcode block {start}>", "exec"), namespace)
+    return CompiledBlock(
+        start=start,
+        end=pc,
+        words=tuple(memory[start:pc]),
+        instructions=count,
+        function=namespace[name],
+        source=source,
+    )
+
+
+def cached_block(machine: IntCode, start: int) -> Optional[CompiledBlock]:
+    """Fetch a compiled block from the shared cache, compiling it if needed.
+
+    A cached block is only reused if the machine's memory still holds the
+    words it was compiled from and none of them have been modified while
+    compiled, as the machine may have written to code it hasn't run yet.
+    """
+    global _cached_block_count
+    memory = machine._memory
+    candidates = _compiled_blocks.get(start, [])
+    for block in candidates:
+        if tuple(memory[block.start : block.end]) == block.words and (
+            machine._modified_code.isdisjoint(range(block.start, block.end))
+        ):
+            return block
+    fresh = compile_block(machine, start)
+    if fresh is None:
+        return None
+    if _cached_block_count >= _MAX_CACHED_BLOCKS:
+        _compiled_blocks.clear()
+        _cached_block_count = 0
+        candidates = []
+    # Keep the most recent blocks for the start, and the new block in place of
+    # any compiled from the same words.
+    kept = [block for block in candidates if block.words != fresh.words]
+    kept = kept[-(_MAX_BLOCKS_PER_START - 1) :] + [fresh]
+    _cached_block_count += len(kept) - len(candidates)
+    _compiled_blocks[start] = kept
+    return fresh
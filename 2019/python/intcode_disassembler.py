@@ -0,0 +1,322 @@
+"""Disassembly and control-flow analysis of IntCode programs.
+
+IntCode programs mix code and data, so rather than decoding every word the
+disassembler follows the program's control flow from its entry points,
+decoding only words that can be reached as instructions. Jumps whose target
+is an immediate value are followed. Other jumps (such as returns, which
+jump to an address held in memory) are recorded as indirect. Code reached
+only through them is found by treating constants the code stores to memory
+as possible code addresses, as the puzzle programs store return addresses
+before calling a subroutine, or can be given as an extra entry point.
+A word that isn't a valid instruction but that the code stores to may be an
+opcode patched at runtime, so every instruction it could become is followed.
+
+The decoded instructions are split into basic blocks to build a control-flow
+graph, which can be written out as Graphviz DOT text.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from intcode import INSTRUCTIONS, Instruction
+
+_JUMPS = {5, 6}
+_HALT = 99
+
+
+class Disassembled(NamedTuple):
+    address: int
+    instruction: Instruction
+    modes: Tuple[int, ...]
+    parameters: Tuple[int, ...]
+
+    @property
+    def end(self) -> int:
+        return self.address + self.instruction.length
+
+    @property
+    def jump_target(self) -> Optional[int]:
+        """The address this instruction may jump to, if known."""
+        if self.instruction.opcode in _JUMPS and self.modes[1] == 1:
+            return self.parameters[1]
+        return None
+
+    @property
+    def always_jumps(self) -> bool:
+        return (
+            self.instruction.opcode in _JUMPS
+            and self.modes[0] == 1
+            and bool(self.parameters[0]) == (self.instruction.opcode == 5)
+        )
+
+    @property
+    def never_jumps(self) -> bool:
+        return (
+            self.instruction.opcode in _JUMPS
+            and self.modes[0] == 1
+            and bool(self.parameters[0]) != (self.instruction.opcode == 5)
+        )
+
+    @property
+    def falls_through(self) -> bool:
+        return self.instruction.opcode != _HALT and not self.always_jumps
+
+    @property
+    def constant_result(self) -> Optional[int]:
+        """The value this instruction stores, if all its inputs are immediate."""
+        opcode = self.instruction.opcode
+        if opcode not in (1, 2) or self.modes[:2] != (1, 1):
+            return None
+        first, second = self.parameters[:2]
+        return first + second if opcode == 1 else first * second
+
+    @property
+    def stored_constants(self) -> Tuple[int, ...]:
+        """Constants this instruction stores, or combines into what it stores.
+
+        These are the candidate code addresses in the instruction: the sum
+        or product of two immediate operands, or either immediate operand on
+        its own (as when adding a constant to an address held in memory).
+        """
+        opcode = self.instruction.opcode
+        if opcode not in (1, 2):
+            return ()
+        constants = [
+            parameter
+            for parameter, mode in zip(self.parameters[:2], self.modes[:2])
+            if mode == 1
+        ]
+        result = self.constant_result
+        if result is not None:
+            constants.append(result)
+        return tuple(constants)
+
+    @property
+    def store_address(self) -> Optional[int]:
+        """The address this instruction stores to, if known without running it."""
+        if self.instruction.store_result and self.modes[-1] == 0:
+            return self.parameters[-1]
+        return None
+
+    def __str__(self) -> str:
+        operands = ", ".join(
+            _format_operand(parameter, mode)
+            for parameter, mode in zip(self.parameters, self.modes)
+        )
+        return f"{self.address:>6}  {self.instruction.mnemonic:<4} {operands}".rstrip()
+
+
+def _format_operand(parameter: int, mode: int) -> str:
+    if mode == 0:
+        return f"[{parameter}]"
+    if mode == 2:
+        return f"[rb{parameter:+}]"
+    return f"{parameter}"
+
+
+class BasicBlock(NamedTuple):
+    start: int
+    instructions: List[Disassembled]
+    successors: Tuple[int, ...]
+    # Whether the block ends with a jump to an address only known at runtime.
+    indirect_exit: bool
+
+    @property
+    def end(self) -> int:
+        return self.instructions[-1].end
+
+
+class ControlFlowGraph(NamedTuple):
+    blocks: Dict[int, BasicBlock]
+    # Stores (by instruction address) to addresses holding decoded code.
+    self_modifying_stores: Dict[int, int]
+
+    @property
+    def edges(self) -> List[Tuple[int, int]]:
+        return [
+            (block.start, successor)
+            for block in self.blocks.values()
+            for successor in block.successors
+        ]
+
+
+def decode(
+    program: Sequence[int], address: int, word: Optional[int] = None
+) -> Optional[Disassembled]:
+    """Decode the instruction at address, or None if it isn't valid.
+
+    If word is given, it's decoded in place of the word at address.
+    """
+    if not 0 <= address < len(program):
+        return None
+    if word is None:
+        word = program[address]
+    if word < 0:
+        return None
+    modes_word, opcode = divmod(word, 100)
+    instruction = INSTRUCTIONS.get(opcode)
+    if instruction is None or address + instruction.length > len(program):
+        return None
+    modes = []
+    for _ in range(instruction.length - 1):
+        modes_word, mode = divmod(modes_word, 10)
+        modes.append(mode)
+    if modes_word or any(mode not in (0, 1, 2) for mode in modes):
+        return None
+    if instruction.store_result and modes[-1] == 1:
+        return None
+    parameters = program[address + 1 : address + instruction.length]
+    return Disassembled(address, instruction, tuple(modes), tuple(parameters))
+
+
+def _patched_decodings(program: Sequence[int], address: int) -> List[Disassembled]:
+    """Decode every instruction the word at address could be patched into.
+
+    Programs patch an opcode by adding to it, so the word's parameter modes
+    are kept and only its opcode varies.
+    """
+    if not 0 <= address < len(program) or program[address] < 0:
+        return []
+    modes_word = program[address] // 100 * 100
+    return [
+        decoded
+        for opcode in INSTRUCTIONS
+        if (decoded := decode(program, address, modes_word + opcode)) is not None
+    ]
+
+
+def _followed(decoded: Disassembled) -> List[int]:
+    """The addresses an instruction leads to, other than by falling through."""
+    following = list(decoded.stored_constants)
+    target = decoded.jump_target
+    if target is not None and not decoded.never_jumps:
+        following.append(target)
+    return following
+
+
+def find_code(
+    program: Sequence[int], entries: Iterable[int] = (0,)
+) -> Dict[int, Disassembled]:
+    """Decode every instruction reachable from the entry points.
+
+    Constants the code stores to memory are followed as possible code
+    addresses too, as they may be return addresses or jump targets. A word
+    that's reached but isn't a valid instruction, and that the code stores
+    to, may be patched before it runs, so whatever it could be patched into
+    is followed, though it isn't itself decoded.
+    """
+    code: Dict[int, Disassembled] = {}
+    undecodable: Set[int] = set()
+    patched: Set[int] = set()
+    pending = list(entries)
+    while pending:
+        while pending:
+            address = pending.pop()
+            while address not in code:
+                decoded = decode(program, address)
+                if decoded is None:
+                    undecodable.add(address)
+                    break
+                code[address] = decoded
+                pending.extend(_followed(decoded))
+                if not decoded.falls_through:
+                    break
+                address = decoded.end
+        stored_to = {decoded.store_address for decoded in code.values()}
+        for address in (undecodable & stored_to) - patched:
+            patched.add(address)
+            for decoded in _patched_decodings(program, address):
+                pending.extend(_followed(decoded))
+                if decoded.falls_through:
+                    pending.append(decoded.end)
+    return code
+
+
+def jump_targets(code: Dict[int, Disassembled]) -> Set[int]:
+    return {
+        target
+        for decoded in code.values()
+        if (target := decoded.jump_target) is not None and not decoded.never_jumps
+    }
+
+
+def self_modifying_stores(code: Dict[int, Disassembled]) -> Dict[int, int]:
+    """Find stores to addresses that hold decoded code.
+
+    Stores using relative addressing can't be checked without running the
+    program, so aren't included.
+    """
+    covered = {
+        address
+        for decoded in code.values()
+        for address in range(decoded.address, decoded.end)
+    }
+    return {
+        decoded.address: destination
+        for decoded in code.values()
+        if (destination := decoded.store_address) is not None and destination in covered
+    }
+
+
+def control_flow_graph(
+    program: Sequence[int], entries: Iterable[int] = (0,)
+) -> ControlFlowGraph:
+    entries = list(entries)
+    code = find_code(program, entries)
+    leaders = set(entries) | jump_targets(code)
+    for decoded in code.values():
+        if decoded.instruction.opcode in _JUMPS or not decoded.falls_through:
+            leaders.add(decoded.end)
+
+    blocks: Dict[int, BasicBlock] = {}
+    for start in sorted(leaders & code.keys()):
+        instructions = [code[start]]
+        while (
+            instructions[-1].falls_through
+            and instructions[-1].instruction.opcode not in _JUMPS
+            and instructions[-1].end in code
+            and instructions[-1].end not in leaders
+        ):
+            instructions.append(code[instructions[-1].end])
+        last = instructions[-1]
+        successors = []
+        if last.jump_target in code and not last.never_jumps:
+            successors.append(last.jump_target)
+        if last.falls_through and last.end in code:
+            successors.append(last.end)
+        indirect = (
+            last.instruction.opcode in _JUMPS
+            and last.jump_target is None
+            and not last.never_jumps
+        )
+        blocks[start] = BasicBlock(start, instructions, tuple(successors), indirect)
+    return ControlFlowGraph(blocks, self_modifying_stores(code))
+
+
+def format_listing(program: Sequence[int], entries: Iterable[int] = (0,)) -> str:
+    """Disassemble the program, showing words not reached as code as data."""
+    code = find_code(program, entries)
+    lines = []
+    address = 0
+    while address < len(program):
+        if address in code:
+            lines.append(str(code[address]))
+            address = code[address].end
+        else:
+            lines.append(f"{address:>6}  data {program[address]}")
+            address += 1
+    return "\n".join(lines)
+
+
+def to_dot(graph: ControlFlowGraph, name: str = "intcode") -> str:
+    """Write the control-flow graph as Graphviz DOT text."""
+    lines = [f"digraph {name} {{", "    node [shape=box, fontname=monospace];"]
+    for block in graph.blocks.values():
+        label = "\\l".join(str(decoded).strip() for decoded in block.instructions)
+        style = ", style=dashed" if block.indirect_exit else ""
+        lines.append(f'    b{block.start} [label="{label}\\l"{style}];')
+    for source, destination in graph.edges:
+        lines.append(f"    b{source} -> b{destination};")
+    lines.append("}")
+    return "\n".join(lines)
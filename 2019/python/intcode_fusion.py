@@ -0,0 +1,153 @@
+"""Superinstructions for the IntCode interpreter.
+
+Profiling the puzzle programs shows that most instructions come in a few
+common pairs: a comparison followed by a conditional jump on its result,
+a relative base adjustment followed by an instruction using it, and
+arithmetic (such as a loop counter increment) followed by another
+instruction or a jump. The fused engine executes such pairs as a single
+superinstruction, a Python function generated for the pair's opcode words,
+saving the interpreter's dispatch for the second instruction.
+
+Superinstructions depend only on the opcode words, with their operands read
+from memory each time they run, so they're shared between machines and stay
+correct when a program writes to their operands. Writes to the opcode words
+themselves are caught by the machine, which drops the superinstruction and
+fuses the new code when it next runs. A superinstruction declines to run
+(returning None) if its first instruction would overwrite the second's
+opcode, so the interpreter can execute the pair one instruction at a time
+instead.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
+
+from intcode_memory import PAGE_BITS, PAGE_MASK
+
+if TYPE_CHECKING:
+    from intcode import DecodedInstruction, IntCode
+
+# Called with the machine, the program counter, the memory's pages and owned
+# page numbers, and the machine's decoded instructions. Returns the program
+# counter after the pair, or None if the pair can't be run as one. (Jumps can
+# go to negative addresses, so no program counter can serve to decline.)
+FusedFunction = Callable[
+    ["IntCode", int, Dict[int, Any], Set[int], Dict], Optional[int]
+]
+
+FUSABLE_FIRST = {1, 2, 7, 8, 9}
+FUSABLE_SECOND = {1, 2, 5, 6, 7, 8, 9}
+
+_BINARY_OPERATIONS = {
+    1: "{} + {}",
+    2: "{} * {}",
+    7: "int({} < {})",
+    8: "int({} == {})",
+}
+
+_fused_functions: Dict[Tuple[int, int], FusedFunction] = {}
+
+
+def _modes(word: int) -> List[int]:
+    return [(word // 100) % 10, (word // 1000) % 10, (word // 10000) % 10]
+
+
+def _load(operand: str, mode: int) -> str:
+    if mode == 1:
+        return operand
+    if mode == 2:
+        address = f"(a := m._relative_addressing_base + {operand})"
+        return f"pages[{address} >> {PAGE_BITS}][a & {PAGE_MASK}]"
+    return f"pages[{operand} >> {PAGE_BITS}][{operand} & {PAGE_MASK}]"
+
+
+def _destination(operand: str, mode: int) -> str:
+    if mode == 2:
+        return f"m._relative_addressing_base + {operand}"
+    return operand
+
+
+def _operands(prefix: str, offset: int, count: int) -> List[str]:
+    """Read the operands of the instruction at pc + offset into variables."""
+    names = ", ".join(f"{prefix}{i}" for i in range(count))
+    words = ", ".join(f"page[o + {offset + 1 + i}]" for i in range(count))
+    return [f"{names} = {words}"]
+
+
+def _store(value: str) -> List[str]:
+    return [
+        f"value = {value}",
+        f"if d >> {PAGE_BITS} in owned and d not in decoded:",
+        f"    pages[d >> {PAGE_BITS}][d & {PAGE_MASK}] = value",
+        "else:",
+        # Copy or allocate the page, and catch self-modifying code.
+        "    m._store(value, d)",
+    ]
+
+
+def _first(word: int, second_at: int) -> List[str]:
+    opcode, modes = word % 100, _modes(word)
+    lines = [f"page = pages[pc >> {PAGE_BITS}]", f"o = pc & {PAGE_MASK}"]
+    if opcode == 9:
+        lines += _operands("x", 0, 1)
+        lines.append(f"m._relative_addressing_base += {_load('x0', modes[0])}")
+        return lines
+    lines += _operands("x", 0, 3)
+    lines += [
+        f"d = {_destination('x2', modes[2])}",
+        f"if d == pc + {second_at}:",
+        "    return None",
+    ]
+    value = _BINARY_OPERATIONS[opcode].format(
+        _load("x0", modes[0]), _load("x1", modes[1])
+    )
+    return lines + _store(value)
+
+
+def _second(word: int, offset: int, length: int) -> List[str]:
+    opcode, modes = word % 100, _modes(word)
+    # The first instruction may have replaced the page or written operands.
+    lines = [f"page = pages[pc >> {PAGE_BITS}]"]
+    next_pc = f"pc + {offset + length}"
+    if opcode == 9:
+        lines += _operands("y", offset, 1)
+        lines.append(f"m._relative_addressing_base += {_load('y0', modes[0])}")
+    elif opcode in (5, 6):
+        lines += _operands("y", offset, 2)
+        condition = _load("y0", modes[0])
+        test = condition if opcode == 5 else f"not {condition}"
+        lines += [f"if {test}:", f"    return {_load('y1', modes[1])}"]
+    else:
+        lines += _operands("y", offset, 3)
+        lines.append(f"d = {_destination('y2', modes[2])}")
+        lines += _store(
+            _BINARY_OPERATIONS[opcode].format(
+                _load("y0", modes[0]), _load("y1", modes[1])
+            )
+        )
+    return lines + [f"return {next_pc}"]
+
+
+def fused_function(
+    first: DecodedInstruction,
+    first_word: int,
+    second: DecodedInstruction,
+    second_word: int,
+) -> Optional[FusedFunction]:
+    """Fetch the superinstruction for a pair of instructions, if they can fuse."""
+    if first.opcode not in FUSABLE_FIRST or second.opcode not in FUSABLE_SECOND:
+        return None
+    key = (first_word, second_word)
+    function = _fused_functions.get(key)
+    if function is None:
+        lines = _first(first_word, first.length) + _second(
+            second_word, first.length, second.length
+        )
+        source = "\n".join(
+            ["def fused(m, pc, pages, owned, decoded):"]
+            + [f"    {line}" for line in lines]
+        )
+        namespace: Dict[str, Any] = {}
+        exec(compile(source, f"<intcode superinstruction {key}>", "exec"), namespace)
+        function = _fused_functions[key] = namespace["fused"]
+    return function
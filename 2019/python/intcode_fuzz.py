@@ -0,0 +1,348 @@
+"""Differential fuzzing of the IntCode engines.
+
+Random programs are run on a reference interpreter, and on each engine
+through `IntCode.run`, and the outcomes compared: how the run ended
+(halting, waiting for input, or the type of exception raised), the final
+memory, the outputs and the unread inputs, and for runs that stopped
+cleanly the program counter, the relative base and the number of
+instructions executed. Programs the reference doesn't finish within an
+instruction limit are skipped, as the engines can't be stopped at exactly
+the same point.
+
+The reference shares no code with the engines: it decodes every instruction
+afresh each time it runs it, and keeps memory in a dict, so the engines'
+decode caches, paging and copy-on-write are all checked against it.
+
+The programs use every opcode and parameter mode, store into their own code,
+move the relative base and touch far addresses. A program on which an engine
+disagrees with the reference is shrunk, by truncating it and simplifying its
+words and inputs while the engine still disagrees, to give a small
+counterexample.
+
+    python intcode_fuzz.py --seed 1 --iterations 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from intcode import ENGINES, INSTRUCTIONS, IntCode, MachineState
+from intcode_memory import PAGE_SIZE
+
+FAR_ADDRESS = 1_000_000
+
+# The reference's own instruction lengths, by opcode, and the opcodes whose
+# last parameter is where they store their result.
+_LENGTHS = {1: 4, 2: 4, 3: 2, 4: 2, 5: 3, 6: 3, 7: 4, 8: 4, 9: 2, 99: 1}
+_STORING = {1, 2, 3, 7, 8}
+# Memory words are signed 64-bit integers.
+_WORD_RANGE = range(-(2**63), 2**63)
+
+
+class Outcome(NamedTuple):
+    status: str
+    memory: Tuple[Tuple[int, int], ...]
+    outputs: Tuple[int, ...]
+    unread_inputs: Tuple[int, ...]
+    # Only compared when the run stopped cleanly.
+    registers: Optional[Tuple[int, int]]
+    instructions: Optional[int]
+
+
+# Runs a program with inputs, returning its outcome or None if it didn't
+# finish within the instruction limit.
+Runner = Callable[[List[int], List[int], int], Optional[Outcome]]
+
+
+class Mismatch(NamedTuple):
+    engine: str
+    program: List[int]
+    inputs: List[int]
+    expected: Outcome
+    actual: Optional[Outcome]
+
+    def describe(self) -> str:
+        return "\n".join(
+            [
+                f"{self.engine} disagrees with the reference interpreter on",
+                f"  program: {self.program}",
+                f"  inputs:  {self.inputs}",
+                f"  expected: {self.expected}",
+                f"  actual:   {self.actual}",
+            ]
+        )
+
+
+def _outcome(machine: IntCode, status: str, clean: bool, instructions: int) -> Outcome:
+    memory = machine._memory
+    words = tuple(
+        ((number * PAGE_SIZE) + offset, word)
+        for number, page in sorted(memory._allocated())
+        for offset, word in enumerate(page)
+        if word
+    )
+    return Outcome(
+        status,
+        words,
+        tuple(machine.output_queue),
+        tuple(machine.input_queue),
+        (machine._PC, machine._relative_addressing_base) if clean else None,
+        instructions if clean else None,
+    )
+
+
+def run_reference(
+    program: List[int], inputs: List[int], max_instructions: int
+) -> Optional[Outcome]:
+    """Run a program on the reference interpreter.
+
+    Negative addresses read as zero, as nothing can be stored there.
+    """
+    memory = dict(enumerate(program))
+    unread = deque(inputs)
+    outputs: List[int] = []
+    pc = rb = executed = 0
+
+    def outcome(status: str, clean: bool, instructions: int) -> Outcome:
+        return Outcome(
+            status,
+            tuple(sorted((a, word) for a, word in memory.items() if word)),
+            tuple(outputs),
+            tuple(unread),
+            (pc, rb) if clean else None,
+            instructions if clean else None,
+        )
+
+    def address(parameter: int, mode: int) -> int:
+        raw = memory.get(pc + 1 + parameter, 0)
+        return raw if mode == 0 else rb + raw
+
+    def load(parameter: int, mode: int) -> int:
+        if mode == 1:
+            return memory.get(pc + 1 + parameter, 0)
+        return memory.get(address(parameter, mode), 0)
+
+    def store(parameter: int, mode: int, value: int) -> None:
+        destination = address(parameter, mode)
+        if destination < 0:
+            raise IndexError(f"Cannot store to negative address {destination}.")
+        if value not in _WORD_RANGE:
+            raise OverflowError(f"{value} doesn't fit in a word.")
+        memory[destination] = value
+
+    try:
+        while executed < max_instructions:
+            word = memory.get(pc, 0)
+            if word < 0:
+                raise ValueError(f"Invalid opcode {word}.")
+            opcode = word % 100
+            length = _LENGTHS[opcode]
+            modes = [word // 10 ** (i + 2) % 10 for i in range(length - 1)]
+            for i, mode in enumerate(modes):
+                storing = opcode in _STORING and i == len(modes) - 1
+                if mode not in ((0, 2) if storing else (0, 1, 2)):
+                    raise ValueError(f"Unknown parameter mode {mode}.")
+            next_pc = pc + length
+            if opcode == 99:
+                # The halt counts as executed, as it does when the machine runs.
+                return outcome("halted", True, executed + 1)
+            if opcode == 3:
+                if not unread:
+                    return outcome("needs input", True, executed)
+                store(0, modes[0], unread.popleft())
+            elif opcode == 4:
+                outputs.append(load(0, modes[0]))
+            elif opcode == 9:
+                rb += load(0, modes[0])
+            elif opcode in (5, 6):
+                if (load(0, modes[0]) != 0) == (opcode == 5):
+                    next_pc = load(1, modes[1])
+            else:
+                first, second = load(0, modes[0]), load(1, modes[1])
+                if opcode == 1:
+                    result = first + second
+                elif opcode == 2:
+                    result = first * second
+                elif opcode == 7:
+                    result = int(first < second)
+                else:
+                    result = int(first == second)
+                store(2, modes[2], result)
+            pc = next_pc
+            executed += 1
+    except Exception as e:
+        return outcome(f"raised {type(e).__name__}", False, executed)
+    return None
+
+
+def engine_runner(engine: str) -> Runner:
+    def run(
+        program: List[int], inputs: List[int], max_instructions: int
+    ) -> Optional[Outcome]:
+        machine = IntCode(program, engine=engine)
+        # Compile code on first entry, as few random programs loop.
+        machine.compile_threshold = 1
+        machine.feed(inputs)
+        try:
+            state = machine.run(max_instructions=max_instructions)
+        except Exception as e:
+            status = f"raised {type(e).__name__}"
+            return _outcome(machine, status, False, machine.instructions_executed)
+        if state is MachineState.HALTED:
+            return _outcome(machine, "halted", True, machine.instructions_executed)
+        if state is MachineState.NEEDS_INPUT:
+            status = "needs input"
+            return _outcome(machine, status, True, machine.instructions_executed)
+        return None
+
+    return run
+
+
+def find_mismatch(
+    program: List[int],
+    inputs: List[int],
+    runners: Dict[str, Runner],
+    max_instructions: int = 2_000,
+) -> Optional[Mismatch]:
+    expected = run_reference(program, inputs, max_instructions)
+    if expected is None:
+        return None
+    for engine, runner in runners.items():
+        actual = runner(program, inputs, max_instructions)
+        if actual != expected:
+            return Mismatch(engine, program, inputs, expected, actual)
+    return None
+
+
+def _operand(
+    rng: random.Random, mode: int, code: Sequence[int], data: range, store: bool
+) -> int:
+    roll = rng.random()
+    if mode == 1:
+        if roll < 0.3:
+            return rng.choice(code)
+        if roll < 0.35:
+            return rng.choice([-1, 1]) * rng.randrange(2**40)
+        return rng.randrange(-5, 20)
+    if roll < (0.15 if store else 0.05):
+        # Self-modifying code
+        return rng.randrange(code[-1] + 1)
+    if roll < 0.2:
+        return FAR_ADDRESS + rng.randrange(2 * PAGE_SIZE)
+    if mode == 2:
+        # Near the data, give or take relative base adjustments.
+        return data.start + rng.randrange(-5, len(data) + 5)
+    return rng.choice(data)
+
+
+def generate_program(
+    rng: random.Random, instructions: int = 20, data_words: int = 10
+) -> Tuple[List[int], List[int]]:
+    """Generate a random valid program, with some inputs for it."""
+    opcodes = rng.choices(
+        list(INSTRUCTIONS), weights=[4, 3, 2, 2, 2, 2, 2, 2, 3, 1], k=instructions
+    )
+    opcodes.append(99)
+    code = []
+    address = 0
+    for opcode in opcodes:
+        code.append(address)
+        address += INSTRUCTIONS[opcode].length
+    data = range(address, address + data_words)
+
+    program = []
+    for opcode in opcodes:
+        instruction = INSTRUCTIONS[opcode]
+        operands = instruction.length - 1
+        modes = [rng.choice([0, 1, 2]) for _ in range(operands)]
+        if instruction.store_result:
+            modes[-1] = rng.choice([0, 2])
+        if opcode in (5, 6) and rng.random() < 0.7:
+            # Mostly jump to the start of an instruction.
+            modes[1] = 1
+        word = opcode + sum(mode * 10 ** (i + 2) for i, mode in enumerate(modes))
+        program.append(word)
+        for i, mode in enumerate(modes):
+            store = instruction.store_result and i == operands - 1
+            program.append(_operand(rng, mode, code, data, store))
+    program += [rng.randrange(-5, 20) for _ in data]
+    inputs = [rng.randrange(-5, 20) for _ in range(rng.randrange(4))]
+    return program, inputs
+
+
+def shrink(mismatch: Mismatch, runners: Dict[str, Runner]) -> Mismatch:
+    """Simplify a mismatching program and inputs while the engine disagrees."""
+    runner = {mismatch.engine: runners[mismatch.engine]}
+
+    def attempt(program: List[int], inputs: List[int]) -> Optional[Mismatch]:
+        if not program or (program, inputs) == (mismatch.program, mismatch.inputs):
+            return None
+        return find_mismatch(program, inputs, runner)
+
+    improved = True
+    while improved:
+        improved = False
+        program, inputs = mismatch.program, mismatch.inputs
+        candidates = [(program[:n], inputs) for n in range(1, len(program))]
+        candidates += [
+            (program[:i] + program[i + 1 :], inputs) for i in range(len(program))
+        ]
+        candidates += [
+            (program, inputs[:i] + inputs[i + 1 :]) for i in range(len(inputs))
+        ]
+        for i, word in enumerate(program):
+            # Only ever shrink words, so shrinking ends.
+            for simpler in (0, 1, 99, word // 2):
+                if abs(simpler) < abs(word):
+                    candidates.append(
+                        (program[:i] + [simpler] + program[i + 1 :], inputs)
+                    )
+        for candidate_program, candidate_inputs in candidates:
+            smaller = attempt(candidate_program, candidate_inputs)
+            if smaller is not None:
+                mismatch = smaller
+                improved = True
+                break
+    return mismatch
+
+
+def fuzz(
+    seed: int,
+    iterations: int,
+    engines: Sequence[str] = ENGINES,
+    runners: Optional[Dict[str, Runner]] = None,
+) -> Optional[Mismatch]:
+    """Check the engines against the reference on random programs.
+
+    Returns the first mismatch found, shrunk, or None if they all agree.
+    """
+    if runners is None:
+        runners = {engine: engine_runner(engine) for engine in engines}
+    rng = random.Random(seed)
+    for _ in range(iterations):
+        program, inputs = generate_program(rng)
+        mismatch = find_mismatch(program, inputs, runners)
+        if mismatch is not None:
+            return shrink(mismatch, runners)
+    return None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Fuzz the IntCode engines.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=1_000)
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    args = parser.parse_args(argv)
+    mismatch = fuzz(args.seed, args.iterations, args.engines)
+    if mismatch is not None:
+        print(mismatch.describe())
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""Cache of parsed IntCode program images.
+
+Parsing a program's text means splitting it and converting every word, each
+time it's loaded. The image cache instead keeps the parsed words in a file of
+raw signed 64-bit integers, named after a digest of the text, and loads them
+by mapping the file and copying it page by page into memory. Images loaded
+in this process are also kept, so loading the same text again only costs
+hashing it, and machines created from the image share its pages.
+
+The cache directory is bounded in size, evicting the least recently used
+images (by modification time, which is updated when an image is loaded).
+The directory is given by the INTCODE_IMAGE_CACHE environment variable,
+defaulting to `intcode` in the user's cache directory, and setting the
+variable to `off` turns the cache off, so that programs are simply parsed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Union
+
+from intcode import parse_program
+from intcode_memory import PAGE_SIZE, ZERO_PAGE, PagedMemory
+
+# Images are only readable on machines with the same byte order.
+MAGIC = b"INTIMG" + sys.byteorder[0].encode() + b"\x01"
+_WORD_BYTES = array("q").itemsize
+_MAX_LOADED_IMAGES = 32
+
+PathLike = Union[str, Path]
+
+
+def default_directory() -> Optional[Path]:
+    """The cache directory from the environment, or None if it's off."""
+    setting = os.environ.get("INTCODE_IMAGE_CACHE")
+    if setting == "off":
+        return None
+    if setting:
+        return Path(setting)
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "intcode"
+
+
+class ImageCache:
+    directory: Optional[Path]
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    # Images loaded in this process, by digest, least recently used first.
+    _loaded: OrderedDict[str, PagedMemory]
+
+    def __init__(
+        self,
+        directory: Optional[PathLike] = None,
+        max_bytes: int = 64 * 1024 * 1024,
+        enabled: bool = True,
+    ):
+        if directory is None and enabled:
+            directory = default_directory()
+        self.directory = Path(directory) if enabled and directory else None
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._loaded = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def load(self, text: str) -> PagedMemory:
+        """The program image for the text, parsing it only if it's not cached.
+
+        The image is shared, so pass it to IntCode (which forks it) rather
+        than writing to it.
+        """
+        if not self.enabled:
+            return PagedMemory(parse_program(text))
+        digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        image = self._loaded.get(digest)
+        if image is not None:
+            self._loaded.move_to_end(digest)
+            self.hits += 1
+            return image
+        image = self._read(digest)
+        if image is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            program = parse_program(text)
+            image = PagedMemory(program)
+            self._write(digest, program)
+        self._loaded[digest] = image
+        if len(self._loaded) > _MAX_LOADED_IMAGES:
+            self._loaded.popitem(last=False)
+        return image
+
+    def _path(self, digest: str) -> Path:
+        assert self.directory is not None
+        return self.directory / f"{digest}.img"
+
+    def _read(self, digest: str) -> Optional[PagedMemory]:
+        path = self._path(digest)
+        try:
+            with path.open("rb") as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapped:
+                if mapped[: len(MAGIC)] != MAGIC:
+                    return None
+                words = (len(mapped) - len(MAGIC)) // _WORD_BYTES
+                pages: List[array[int]] = []
+                page_bytes = PAGE_SIZE * _WORD_BYTES
+                for start in range(len(MAGIC), len(mapped), page_bytes):
+                    page = array("q")
+                    page.frombytes(mapped[start : start + page_bytes])
+                    pages.append(page)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Missing, unreadable or truncated, so parse the text instead.
+            return None
+        image = PagedMemory()
+        if pages:
+            pages[-1].extend(ZERO_PAGE[len(pages[-1]) :])
+        for number, page in enumerate(pages):
+            image.pages[number] = page
+            image.owned.add(number)
+        image._loaded_length = words
+        return image
+
+    def _write(self, digest: str, program: List[int]) -> None:
+        assert self.directory is not None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so readers never see a partial image.
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        except OSError:
+            # The cache is only an optimisation, so carry on without it.
+            return
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(MAGIC)
+                array("q", program).tofile(file)
+            os.replace(temporary, self._path(digest))
+        except (OSError, OverflowError):
+            Path(temporary).unlink(missing_ok=True)
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used images until within max_bytes."""
+        assert self.directory is not None
+        images = []
+        for path in self.directory.glob("*.img"):
+            try:
+                status = path.stat()
+            except OSError:
+                continue
+            images.append((status.st_mtime_ns, status.st_size, path))
+        size = sum(size for _, size, _ in images)
+        for _, image_size, path in sorted(images):
+            if size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= image_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._loaded.clear()
+        if self.directory is not None:
+            for path in self.directory.glob("*.img"):
+                path.unlink(missing_ok=True)
+
+
+_default_cache: Optional[ImageCache] = None
+
+
+def load_program(text: str) -> PagedMemory:
+    """Load a program's image through the default cache."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ImageCache()
+    return _default_cache.load(text)
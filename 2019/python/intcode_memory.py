@@ -0,0 +1,140 @@
+"""Sparse paged memory for IntCode machines.
+
+Memory is split into fixed-size pages of signed 64-bit words, which are only
+allocated when first written. Reading from a page that has never been written
+gives zero, so memory use depends on the pages a program actually touches
+rather than on the highest address it uses.
+
+Forked memories share their pages, and a page is only copied when one of
+the memories sharing it first writes to it. Each memory tracks the pages it
+owns outright, which are the only ones it may write in place. Pages that
+aren't owned may also be read-only views of words held elsewhere, such as a
+mapped snapshot file.
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections import defaultdict
+from typing import DefaultDict, List, Sequence, Set, Tuple, Union, overload
+
+PAGE_BITS = 10
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+# Stands in for every unallocated page. It is never written to.
+ZERO_PAGE = array("q", bytes(8 * PAGE_SIZE))
+
+# Owned pages are always arrays, but shared pages may be read-only views.
+Page = Union["array[int]", memoryview]
+PageTable = DefaultDict[int, Page]
+
+
+def _unallocated_page() -> Page:
+    return ZERO_PAGE
+
+
+class PagedMemory:
+    """Word-addressed memory made of lazily-allocated `array('q')` pages.
+
+    The page table maps page numbers to pages, and reading an unallocated
+    page from it gives the shared zero page. Callers indexing the page table
+    directly may only write to pages whose numbers are in `owned`, and must
+    otherwise store through the memory so the page is copied or allocated.
+
+    Values must fit in a signed 64-bit integer; storing anything larger
+    raises OverflowError.
+    """
+
+    pages: PageTable
+    owned: Set[int]
+    _loaded_length: int
+
+    def __init__(self, program: Sequence[int] = ()):
+        self.pages = defaultdict(_unallocated_page)
+        self.owned = set()
+        self._loaded_length = len(program)
+        for start in range(0, len(program), PAGE_SIZE):
+            page = array("q", program[start : start + PAGE_SIZE])
+            if len(page) < PAGE_SIZE:
+                page.extend(ZERO_PAGE[len(page) :])
+            self.pages[start >> PAGE_BITS] = page
+            self.owned.add(start >> PAGE_BITS)
+
+    @overload
+    def __getitem__(self, index: int) -> int: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[int]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[int, List[int]]:
+        if isinstance(index, slice):
+            if index.start is None or index.stop is None or index.stop < 0:
+                index = slice(*index.indices(len(self)))
+            return self._range(index.start, index.stop)[:: index.step]
+        return self.pages[index >> PAGE_BITS][index & PAGE_MASK]
+
+    def _range(self, start: int, stop: int) -> List[int]:
+        if stop <= start:
+            return []
+        words: List[int] = []
+        first_page = start >> PAGE_BITS
+        for number in range(first_page, ((stop - 1) >> PAGE_BITS) + 1):
+            words.extend(self.pages.get(number, ZERO_PAGE))
+        offset = first_page << PAGE_BITS
+        return words[start - offset : stop - offset]
+
+    def __setitem__(self, address: int, value: int) -> None:
+        if address < 0:
+            raise IndexError(f"Cannot store to negative address {address}.")
+        number = address >> PAGE_BITS
+        if number in self.owned:
+            page = self.pages[number]
+        else:
+            # Allocate the page, or copy it if it is shared.
+            page = self.pages[number] = array("q", self.pages[number])
+            self.owned.add(number)
+        page[address & PAGE_MASK] = value
+
+    def __len__(self) -> int:
+        """One past the last non-zero word, or the loaded program's length."""
+        for number, page in sorted(self._allocated(), reverse=True):
+            used_bytes = len(page.tobytes().rstrip(b"\0"))
+            if used_bytes:
+                used = (used_bytes + page.itemsize - 1) // page.itemsize
+                return max(self._loaded_length, (number << PAGE_BITS) + used)
+        return self._loaded_length
+
+    def _allocated(self) -> List[Tuple[int, Page]]:
+        return [(n, page) for n, page in self.pages.items() if page is not ZERO_PAGE]
+
+    def words(self, address: int, count: int) -> Sequence[int]:
+        """Read count consecutive words starting at address."""
+        offset = address & PAGE_MASK
+        if offset + count <= PAGE_SIZE:
+            return self.pages[address >> PAGE_BITS][offset : offset + count]
+        return self._range(address, address + count)
+
+    def fork(self) -> PagedMemory:
+        """Create a copy-on-write copy of this memory.
+
+        The pages are shared until first written by either memory, so the
+        cost of forking depends on the number of pages, not their contents.
+        """
+        new = PagedMemory()
+        new.pages.update(self._allocated())
+        new._loaded_length = self._loaded_length
+        # Neither memory may now write to the shared pages in place. The set
+        # is cleared rather than replaced as compiled code holds on to it.
+        self.owned.clear()
+        return new
+
+    def to_list(self) -> List[int]:
+        return self[:]
+
+    @property
+    def allocated_pages(self) -> int:
+        return len(self._allocated())
+
+    def __repr__(self) -> str:
+        return f"<PagedMemory: {self.allocated_pages} pages of {PAGE_SIZE} words>"
@@ -0,0 +1,215 @@
+"""IntCode machine networks with each machine in its own process.
+
+This mirrors the wiring of `intcode_async`: machines are created, connected
+from source to destination, and run together as a network. Here each machine
+runs in a worker process, so a network of machines that compute a lot
+between their I/O uses all of the available cores.
+
+Values cross between processes in batches: a machine sends everything it
+has output each time it blocks for input, halts, or has built up a full
+batch, rather than sending each value on its own.
+
+Workers report each time they block for input or halt, with how many
+batches they've received and sent so far. When every machine still running
+is blocked, and each has received every batch sent to it, none of them can
+ever run again, so the network is deadlocked.
+"""
+
+from __future__ import annotations
+
+from multiprocessing import Process, Queue
+from multiprocessing.connection import wait
+from queue import Empty
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from intcode import IntCode, MachineState, PagedMemory
+
+_MAX_BATCH = 1024
+
+# A worker's index in the network, whether it's "blocked" or "halted", and the
+# numbers of batches it has received and sent.
+Report = Tuple[int, str, int, int]
+
+
+class NetworkDeadlocked(RuntimeError):
+    pass
+
+
+class ProcessIntCode:
+    """A machine to run in a worker process as part of a network.
+
+    Before running, `inputs` holds the values passed in; afterwards it holds
+    any the machine never read. `outputs` collects whatever the machine
+    output that wasn't connected to another machine.
+    """
+
+    program: Union[List[int], PagedMemory]
+    description: Optional[str]
+    engine: str
+    destination: Optional[ProcessIntCode]
+    inputs: List[int]
+    outputs: List[int]
+    _input_batches: Queue[List[int]]
+    _output_batches: Queue[List[int]]
+
+    def __init__(
+        self,
+        program: Union[List[int], PagedMemory],
+        description: Optional[str] = None,
+        engine: str = "interpreter",
+    ):
+        self.program = program
+        self.description = description
+        self.engine = engine
+        self.destination = None
+        self.inputs = []
+        self.outputs = []
+        self._input_batches = Queue()
+        self._output_batches = Queue()
+
+    def __repr__(self) -> str:
+        return f"<ProcessIntCode: {self.description or id(self)}>"
+
+    def pass_input(self, value: int) -> None:
+        self.inputs.append(value)
+
+    def _collect(self, batches: Queue[List[int]], into: List[int]) -> None:
+        while True:
+            try:
+                into.extend(batches.get_nowait())
+            except Empty:
+                return
+
+
+def _run_machine(
+    program: Union[List[int], PagedMemory],
+    description: Optional[str],
+    engine: str,
+    inputs: Queue[List[int]],
+    outputs: Queue[List[int]],
+    index: int,
+    reports: Queue[Report],
+) -> None:
+    machine = IntCode(program, description=description, engine=engine)
+    received = sent = 0
+    while True:
+        state = machine.run(max_outputs=_MAX_BATCH)
+        if machine.output_queue:
+            outputs.put(list(machine.output_queue))
+            machine.output_queue.clear()
+            sent += 1
+        if state is MachineState.HALTED:
+            reports.put((index, "halted", received, sent))
+            return
+        if state is MachineState.NEEDS_INPUT:
+            reports.put((index, "blocked", received, sent))
+            machine.input_queue.extend(inputs.get())
+            received += 1
+
+
+def connect(source: ProcessIntCode, destination: ProcessIntCode) -> None:
+    """Send the source machine's outputs to the destination machine."""
+    source.destination = destination
+
+
+def run_network(machines: Sequence[ProcessIntCode]) -> None:
+    """Run each machine in its own process until they have all halted.
+
+    Raises NetworkDeadlocked if the machines still running are all blocked
+    waiting for input that will never come.
+    """
+    reports: Queue[Report] = Queue()
+    processes = []
+    # Batches passed to each machine before the network starts.
+    passed_in = []
+    for index, machine in enumerate(machines):
+        passed_in.append(1 if machine.inputs else 0)
+        if machine.inputs:
+            machine._input_batches.put(machine.inputs)
+            machine.inputs = []
+        destination = machine.destination
+        output_batches = (
+            destination._input_batches
+            if destination is not None
+            else machine._output_batches
+        )
+        process = Process(
+            target=_run_machine,
+            args=(
+                machine.program,
+                machine.description,
+                machine.engine,
+                machine._input_batches,
+                output_batches,
+                index,
+                reports,
+            ),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+
+    latest: Dict[int, Report] = {}
+    running = list(zip(machines, processes))
+    exited: List[ProcessIntCode] = []
+    while running:
+        wait([process.sentinel for _, process in running], timeout=0.01)
+        while True:
+            try:
+                report = reports.get_nowait()
+            except Empty:
+                break
+            latest[report[0]] = report
+        still_running = []
+        for machine, process in running:
+            # Keep the pipes flowing so no worker blocks on a full pipe.
+            machine._collect(machine._output_batches, machine.outputs)
+            # Read the exit code once, so a worker exiting meanwhile can't
+            # leave running without being counted as exited.
+            exitcode = process.exitcode
+            if exitcode is None:
+                still_running.append((machine, process))
+                continue
+            if exitcode != 0:
+                _terminate(processes)
+                raise RuntimeError(f"{machine} failed in its worker process.")
+            exited.append(machine)
+        for machine in exited:
+            # Nothing else will read its input now.
+            machine._collect(machine._input_batches, machine.inputs)
+        running = still_running
+        if running and _deadlocked(machines, passed_in, latest, running):
+            _terminate(processes)
+            raise NetworkDeadlocked(
+                f"{len(running)} machines are all blocked waiting for input."
+            )
+
+    for machine in machines:
+        machine._collect(machine._output_batches, machine.outputs)
+        machine._collect(machine._input_batches, machine.inputs)
+
+
+def _deadlocked(
+    machines: Sequence[ProcessIntCode],
+    passed_in: List[int],
+    latest: Dict[int, Report],
+    running: List[Tuple[ProcessIntCode, Process]],
+) -> bool:
+    """Whether every running machine is blocked with no batch on its way."""
+    indexes = {id(machine): index for index, machine in enumerate(machines)}
+    live = [indexes[id(machine)] for machine, _ in running]
+    if any(index not in latest or latest[index][1] != "blocked" for index in live):
+        return False
+    # A machine only sends once it has run, so a blocked machine's count of
+    # batches sent is up to date until it receives another.
+    delivered = list(passed_in)
+    for index, (_, _, _, sent) in latest.items():
+        destination = machines[index].destination
+        if destination is not None:
+            delivered[indexes[id(destination)]] += sent
+    return all(delivered[index] == latest[index][2] for index in live)
+
+
+def _terminate(processes: List[Process]) -> None:
+    for process in processes:
+        process.terminate()
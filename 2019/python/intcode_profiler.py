@@ -0,0 +1,123 @@
+"""Opcode-level profiling and tracing for IntCode machines.
+
+A profiler runs a machine through its own instrumented loop, one instruction
+at a time, recording how often each opcode and each instruction address is
+executed, which addresses are read and written, and the last instructions
+executed. Attaching a profiler to a machine routes its `run` through the
+profiler, so puzzle code driving the machine needs no changes, while
+machines without a profiler run exactly as before.
+"""
+
+from __future__ import annotations
+
+import json
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from intcode import Instruction, IntCode, MachineState, ParameterModeList
+
+
+class TraceEntry(NamedTuple):
+    pc: int
+    words: Tuple[int, ...]
+    relative_base: int
+
+
+class Profiler:
+    opcodes: Counter[int]
+    pc_hits: Counter[int]
+    reads: Counter[int]
+    writes: Counter[int]
+    peak_address: int
+    trace: Deque[TraceEntry]
+    _parsed: Dict[int, Tuple[ParameterModeList, Instruction]]
+
+    def __init__(self, trace_length: int = 100):
+        self.opcodes = Counter()
+        self.pc_hits = Counter()
+        self.reads = Counter()
+        self.writes = Counter()
+        self.peak_address = 0
+        self.trace = deque(maxlen=trace_length)
+        self._parsed = {}
+
+    @property
+    def instructions(self) -> int:
+        return sum(self.opcodes.values())
+
+    def attach(self, machine: IntCode) -> None:
+        """Profile all future runs of the machine (but not of its clones)."""
+        machine.run = lambda *args, **kwargs: self.run(  # type: ignore
+            machine, *args, **kwargs
+        )
+
+    @staticmethod
+    def detach(machine: IntCode) -> None:
+        machine.__dict__.pop("run", None)
+
+    def run(
+        self,
+        machine: IntCode,
+        max_outputs: Optional[int] = None,
+        max_instructions: Optional[int] = None,
+    ) -> MachineState:
+        """Run the machine as `IntCode.run` would, profiling each instruction."""
+        if machine.has_halted():
+            return MachineState.HALTED
+        if max_outputs is not None and max_outputs < 1:
+            raise ValueError(f"Cannot stop after {max_outputs} outputs.")
+        machine._outputs_left = -1 if max_outputs is None else max_outputs
+        executed = 0
+        while max_instructions is None or executed < max_instructions:
+            pc = machine._PC
+            entry, reads, writes = self._inspect(machine, pc)
+            state = machine._run_interpreted(1)
+            if state is MachineState.NEEDS_INPUT:
+                return state
+            executed += 1
+            self.opcodes[entry.words[0] % 100] += 1
+            self.pc_hits[pc] += 1
+            self.reads.update(reads)
+            self.writes.update(writes)
+            self.peak_address = max(self.peak_address, pc, *reads, *writes)
+            self.trace.append(entry)
+            if state is not None:
+                return state
+        return MachineState.PREEMPTED
+
+    def _inspect(
+        self, machine: IntCode, pc: int
+    ) -> Tuple[TraceEntry, List[int], List[int]]:
+        """Find the addresses the instruction at pc will read and write."""
+        rb = machine._relative_addressing_base
+        word = machine._memory[pc]
+        if word not in self._parsed:
+            self._parsed[word] = machine.parse_opcode(word)
+        modes, instruction = self._parsed[word]
+        words = tuple(machine._memory.words(pc, instruction.length))
+        addresses = [
+            raw if mode == 0 else rb + raw
+            for raw, mode in zip(words[1:], modes)
+            if mode != 1
+        ]
+        if instruction.store_result:
+            return TraceEntry(pc, words, rb), addresses[:-1], addresses[-1:]
+        return TraceEntry(pc, words, rb), addresses, []
+
+    def hot_spots(self, count: int = 10) -> List[Tuple[int, int]]:
+        """The most executed instruction addresses, with their hit counts."""
+        return self.pc_hits.most_common(count)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "instructions": self.instructions,
+            "opcodes": {str(op): n for op, n in sorted(self.opcodes.items())},
+            "pc_hits": {str(pc): n for pc, n in sorted(self.pc_hits.items())},
+            "reads": {str(a): n for a, n in sorted(self.reads.items())},
+            "writes": {str(a): n for a, n in sorted(self.writes.items())},
+            "peak_address": self.peak_address,
+            "trace": [entry._asdict() for entry in self.trace],
+        }
+
+    def to_json(self, **kwargs: Any) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
@@ -0,0 +1,135 @@
+"""Cooperative scheduling of several IntCode machines.
+
+The scheduler runs each machine in turn for a quantum of instructions, or
+until it halts or blocks waiting for input. Outputs are routed to the input
+queues of other machines by a routing function, and a machine that blocks
+can be handed input by a callback, which lets Python code drive a machine
+from its outputs. Once no machine can make progress the scheduler stops.
+
+A global instruction budget stops a runaway machine from running forever.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional
+
+from intcode import IntCode, MachineState
+
+# Where to send a machine's output, or None to leave it in its output queue.
+Router = Callable[[IntCode, int], Optional[IntCode]]
+# Called when a machine blocks on input, and may pass it input.
+BlockedHandler = Callable[[IntCode], None]
+
+
+class InstructionBudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class MachineStats:
+    instructions: int = 0
+    time_blocked: float = 0.0
+    blocked_since: Optional[float] = None
+
+    @property
+    def blocked(self) -> bool:
+        return self.blocked_since is not None
+
+
+class Scheduler:
+    machines: List[IntCode]
+    stats: Dict[IntCode, MachineStats]
+    route: Optional[Router]
+    on_blocked: Optional[BlockedHandler]
+    quantum: int
+    instruction_budget: Optional[int]
+    instructions_executed: int
+
+    def __init__(
+        self,
+        machines: Iterable[IntCode] = (),
+        route: Optional[Router] = None,
+        on_blocked: Optional[BlockedHandler] = None,
+        quantum: int = 10_000,
+        instruction_budget: Optional[int] = None,
+    ):
+        if quantum < 1:
+            raise ValueError(f"Quantum must be positive, not {quantum}.")
+        self.machines = []
+        self.stats = {}
+        self.route = route
+        self.on_blocked = on_blocked
+        self.quantum = quantum
+        self.instruction_budget = instruction_budget
+        self.instructions_executed = 0
+        for machine in machines:
+            self.add(machine)
+
+    def add(self, machine: IntCode) -> None:
+        self.machines.append(machine)
+        self.stats[machine] = MachineStats()
+
+    def run(self) -> bool:
+        """Run the machines until none of them can make progress.
+
+        Returns True if every machine has halted, or False if those still
+        running are all blocked waiting for input.
+        """
+        while True:
+            progressed = False
+            for machine in self.machines:
+                if not machine.has_halted() and self._run_slice(machine):
+                    progressed = True
+            if not progressed:
+                return all(machine.has_halted() for machine in self.machines)
+
+    def _run_slice(self, machine: IntCode) -> bool:
+        """Run the machine for up to a quantum.
+
+        Returns whether the machine made progress or can now do so.
+        """
+        stats = self.stats[machine]
+        if stats.blocked_since is not None:
+            if not machine.input_queue:
+                return False
+            stats.time_blocked += perf_counter() - stats.blocked_since
+            stats.blocked_since = None
+
+        quantum = self.quantum
+        if self.instruction_budget is not None:
+            remaining = self.instruction_budget - self.instructions_executed
+            if remaining <= 0:
+                raise InstructionBudgetExceeded(
+                    f"Executed {self.instructions_executed} instructions,"
+                    f" over the budget of {self.instruction_budget}."
+                )
+            quantum = min(quantum, remaining)
+
+        before = machine.instructions_executed
+        state = machine.run(max_instructions=quantum)
+        executed = machine.instructions_executed - before
+        stats.instructions += executed
+        self.instructions_executed += executed
+
+        if self.route is not None:
+            self._route_outputs(machine)
+        if state is MachineState.NEEDS_INPUT:
+            if self.on_blocked is not None:
+                self.on_blocked(machine)
+            if not machine.input_queue:
+                stats.blocked_since = perf_counter()
+        return executed > 0 or not stats.blocked
+
+    def _route_outputs(self, machine: IntCode) -> None:
+        assert self.route is not None
+        kept = []
+        while machine.output_queue:
+            value = machine.read_output()
+            destination = self.route(machine, value)
+            if destination is None:
+                kept.append(value)
+            else:
+                destination.pass_input(value)
+        machine.output_queue.extend(kept)
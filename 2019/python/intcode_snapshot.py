@@ -0,0 +1,202 @@
+"""Binary snapshots of IntCode machine state.
+
+A snapshot holds a machine's memory, registers, halted flag, instruction
+count and I/O queues. Memory is written page by page, skipping pages that were
+never allocated, with each page either stored whole or (if compressing) as its
+runs of non-zero words.
+
+All integers are little-endian and 64-bit. The file starts with a fixed
+header, then the description and engine names, padding to a multiple of eight
+bytes, the input and output queues, and finally the pages.
+
+Snapshots are loaded by mapping the file, and pages stored whole are used in
+place, as read-only views of the mapping that the memory copies when first
+written, like pages shared with a forked memory. Snapshots are written to a
+temporary file that then replaces the old one, so that rewriting a snapshot
+never changes the pages of machines loaded from it.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from pathlib import Path
+from typing import List, NamedTuple, Tuple, Union
+
+from intcode_memory import PAGE_SIZE, ZERO_PAGE, Page, PagedMemory
+
+MAGIC = b"INTCODE\x02"
+# Magic, PC, relative base, halted, zero runs, inputs, outputs, pages, length,
+# instructions executed
+_HEADER = struct.Struct("<8sqq??QQQqQ")
+_COUNT = struct.Struct("<Q")
+_RUN = struct.Struct("<qq")
+
+PathLike = Union[str, Path]
+
+
+class Snapshot(NamedTuple):
+    memory: PagedMemory
+    pc: int
+    relative_base: int
+    halted: bool
+    input_queue: List[int]
+    output_queue: List[int]
+    description: str
+    engine: str
+    instructions_executed: int = 0
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _non_zero_runs(page: Page) -> List[Tuple[int, int]]:
+    runs = []
+    start = None
+    for offset, word in enumerate(page):
+        if word and start is None:
+            start = offset
+        elif not word and start is not None:
+            runs.append((start, offset - start))
+            start = None
+    if start is not None:
+        runs.append((start, PAGE_SIZE - start))
+    return runs
+
+
+def write_snapshot(
+    path: PathLike, snapshot: Snapshot, compress_zero_runs: bool = False
+) -> None:
+    memory = snapshot.memory
+    pages = [(n, page) for n, page in sorted(memory._allocated()) if any(page)]
+    chunks = [
+        _HEADER.pack(
+            MAGIC,
+            snapshot.pc,
+            snapshot.relative_base,
+            snapshot.halted,
+            compress_zero_runs,
+            len(snapshot.input_queue),
+            len(snapshot.output_queue),
+            len(pages),
+            memory._loaded_length,
+            snapshot.instructions_executed,
+        )
+    ]
+    for name in (snapshot.description, snapshot.engine):
+        encoded = name.encode()
+        chunks += [_COUNT.pack(len(encoded)), encoded]
+    # Align the words that follow, so they can be used in place when loaded.
+    chunks.append(bytes(-sum(map(len, chunks)) % 8))
+    chunks += [
+        array("q", snapshot.input_queue).tobytes(),
+        array("q", snapshot.output_queue).tobytes(),
+    ]
+    for number, page in pages:
+        chunks.append(_COUNT.pack(number))
+        if not compress_zero_runs:
+            chunks.append(page.tobytes())
+            continue
+        runs = _non_zero_runs(page)
+        chunks.append(_COUNT.pack(len(runs)))
+        for start, length in runs:
+            chunks.append(_RUN.pack(start, length))
+            chunks.append(page[start : start + length].tobytes())
+    path = Path(path)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent)
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.writelines(chunks)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def read_snapshot(path: PathLike) -> Snapshot:
+    try:
+        with open(path, "rb") as file:
+            # Pages used in place keep the mapping open.
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return _parse(memoryview(mapped))
+    except (struct.error, TypeError, ValueError) as e:
+        raise SnapshotError(f"Malformed snapshot {path}.") from e
+
+
+def _parse(data: memoryview) -> Snapshot:
+    (
+        magic,
+        pc,
+        rb,
+        halted,
+        zero_runs,
+        n_inputs,
+        n_outputs,
+        n_pages,
+        length,
+        instructions,
+    ) = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("Not an IntCode snapshot.")
+    position = _HEADER.size
+
+    names = []
+    for _ in range(2):
+        (size,) = _COUNT.unpack_from(data, position)
+        position += _COUNT.size
+        names.append(bytes(data[position : position + size]).decode())
+        position += size
+    position += -position % 8
+
+    queues = []
+    for count in (n_inputs, n_outputs):
+        queue = array("q")
+        queue.frombytes(data[position : position + 8 * count])
+        queues.append(queue.tolist())
+        position += 8 * count
+
+    memory = PagedMemory()
+    memory._loaded_length = length
+    for _ in range(n_pages):
+        (number,) = _COUNT.unpack_from(data, position)
+        position += _COUNT.size
+        page: Page
+        if not zero_runs:
+            page = data[position : position + 8 * PAGE_SIZE].cast("q")
+            position += 8 * PAGE_SIZE
+        else:
+            page = array("q", ZERO_PAGE)
+            (n_runs,) = _COUNT.unpack_from(data, position)
+            position += _COUNT.size
+            for _ in range(n_runs):
+                start, run_length = _RUN.unpack_from(data, position)
+                position += _RUN.size
+                run = array("q")
+                run.frombytes(data[position : position + 8 * run_length])
+                page[start : start + run_length] = run
+                position += 8 * run_length
+        if len(page) != PAGE_SIZE:
+            raise SnapshotError("Truncated snapshot page.")
+        memory.pages[number] = page
+        if isinstance(page, array):
+            memory.owned.add(number)
+
+    if position != len(data):
+        raise SnapshotError("Snapshot is the wrong length.")
+    description, engine = names
+    input_queue, output_queue = queues
+    return Snapshot(
+        memory,
+        pc,
+        rb,
+        halted,
+        input_queue=input_queue,
+        output_queue=output_queue,
+        description=description,
+        engine=engine,
+        instructions_executed=instructions,
+    )
@@ -0,0 +1,330 @@
+"""Symbolic execution of IntCode programs over affine expressions.
+
+Memory cells and inputs can hold symbols, and arithmetic on them builds
+affine expressions (a constant plus a multiple of each symbol), so running
+the program gives its outputs and final memory as expressions in the
+symbols. Those can then be solved for the symbol values that produce some
+wanted result, rather than searching by running the program for each.
+
+Anything that can't stay affine is made concrete instead, using a concrete
+value for each symbol (zero unless given): multiplying two symbolic values,
+comparisons whose result depends on the symbols, jumps and opcodes, and
+addresses for stores and the relative base. Each time, the expression and
+the concrete value it took are recorded as an assumption, because the rest
+of the run only holds for symbol values that satisfy it. Loading from a
+symbolic address gives a fresh opaque symbol instead, named after the
+address, which is only made concrete (assuming the address) if it's used.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from itertools import product
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from intcode import INSTRUCTIONS, AwaitingInput
+
+
+@dataclass(frozen=True)
+class Affine:
+    constant: int = 0
+    # Pairs of symbol name and (non-zero) coefficient, sorted by name.
+    terms: Tuple[Tuple[str, int], ...] = ()
+
+    @property
+    def is_constant(self) -> bool:
+        return not self.terms
+
+    @property
+    def symbols(self) -> Tuple[str, ...]:
+        return tuple(name for name, _ in self.terms)
+
+    def coefficient(self, name: str) -> int:
+        return dict(self.terms).get(name, 0)
+
+    def __add__(self, other: Value) -> Affine:
+        other = affine(other)
+        coefficients = dict(self.terms)
+        for name, coefficient in other.terms:
+            coefficients[name] = coefficients.get(name, 0) + coefficient
+        return Affine(self.constant + other.constant, _terms(coefficients))
+
+    def __neg__(self) -> Affine:
+        return self.scale(-1)
+
+    def __sub__(self, other: Value) -> Affine:
+        return self + -affine(other)
+
+    def scale(self, factor: int) -> Affine:
+        return Affine(
+            self.constant * factor,
+            _terms({name: coefficient * factor for name, coefficient in self.terms}),
+        )
+
+    def evaluate(self, values: Dict[str, int]) -> int:
+        return self.constant + sum(
+            coefficient * values[name] for name, coefficient in self.terms
+        )
+
+    def substitute(self, values: Dict[str, int]) -> Affine:
+        """Replace the symbols that have values with those values."""
+        known = [(name, c) for name, c in self.terms if name in values]
+        constant = self.constant + sum(c * values[name] for name, c in known)
+        return Affine(constant, tuple(t for t in self.terms if t[0] not in values))
+
+    def __str__(self) -> str:
+        parts = [
+            name if coefficient == 1 else f"{coefficient}*{name}"
+            for name, coefficient in self.terms
+        ]
+        if self.constant or not parts:
+            parts.append(str(self.constant))
+        return " + ".join(parts).replace("+ -", "- ")
+
+
+Value = Union[int, Affine]
+
+
+def _terms(coefficients: Dict[str, int]) -> Tuple[Tuple[str, int], ...]:
+    return tuple(sorted((n, c) for n, c in coefficients.items() if c))
+
+
+def affine(value: Value) -> Affine:
+    return value if isinstance(value, Affine) else Affine(value)
+
+
+def symbol(name: str) -> Affine:
+    return Affine(0, ((name, 1),))
+
+
+class Assumption(NamedTuple):
+    expression: Affine
+    value: int
+
+    def holds(self, values: Dict[str, int]) -> bool:
+        return self.expression.evaluate(values) == self.value
+
+
+class SymbolicResult(NamedTuple):
+    memory: Dict[int, Affine]
+    outputs: List[Affine]
+    assumptions: List[Assumption]
+
+    def memory_at(self, address: int) -> Affine:
+        return self.memory.get(address, Affine())
+
+
+class SymbolicIntCode:
+    memory: Dict[int, Value]
+    inputs: Deque[Value]
+    outputs: List[Value]
+    assumptions: List[Assumption]
+    values: Dict[str, int]
+    # Opaque symbols, with the address and cell they were loaded from.
+    _loads: Dict[str, Tuple[Affine, Value]]
+    _pc: int
+    _relative_base: int
+
+    def __init__(
+        self,
+        program: Iterable[Value],
+        inputs: Iterable[Value] = (),
+        values: Optional[Dict[str, int]] = None,
+    ):
+        self.memory = dict(enumerate(program))
+        self.inputs = deque(inputs)
+        self.outputs = []
+        self.assumptions = []
+        self.values = dict(values or {})
+        self._loads = {}
+        self._pc = 0
+        self._relative_base = 0
+
+    def run(self, max_instructions: Optional[int] = None) -> SymbolicResult:
+        """Run the program until it halts, and return the symbolic results."""
+        executed = 0
+        while max_instructions is None or executed < max_instructions:
+            executed += 1
+            if self._step():
+                return SymbolicResult(
+                    {a: affine(v) for a, v in self.memory.items()},
+                    [affine(v) for v in self.outputs],
+                    self.assumptions,
+                )
+        raise RuntimeError(f"Program didn't halt in {max_instructions} instructions.")
+
+    def _step(self) -> bool:
+        """Execute one instruction, returning whether the program has halted."""
+        pc = self._pc
+        word = self._concretise(self._load(pc))
+        if word < 0:
+            raise ValueError(f"Invalid opcode {word} at {pc}.")
+        modes, opcode = divmod(word, 100)
+        instruction = INSTRUCTIONS.get(opcode)
+        if instruction is None:
+            raise ValueError(f"Unknown opcode {opcode} at {pc}.")
+        raw = [self._load(pc + i) for i in range(1, instruction.length)]
+        mode_list = [(modes // 10**i) % 10 for i in range(len(raw))]
+        self._pc = pc + instruction.length
+
+        def parameter(index: int) -> Value:
+            if mode_list[index] == 1:
+                return raw[index]
+            return self._load(self._address(raw[index], mode_list[index]))
+
+        def store(value: Value) -> None:
+            address = self._address(raw[-1], mode_list[-1])
+            self.memory[self._concretise(address)] = value
+
+        if opcode == 1:
+            store(affine(parameter(0)) + parameter(1))
+        elif opcode == 2:
+            store(self._multiply(parameter(0), parameter(1)))
+        elif opcode in (7, 8):
+            difference = affine(parameter(0)) - parameter(1)
+            if not difference.is_constant:
+                difference = Affine(self._concretise(difference))
+            store(
+                int(difference.constant < 0)
+                if opcode == 7
+                else int(difference.constant == 0)
+            )
+        elif opcode == 3:
+            if not self.inputs:
+                raise AwaitingInput("Symbolic machine is waiting for input.")
+            store(self.inputs.popleft())
+        elif opcode == 4:
+            self.outputs.append(parameter(0))
+        elif opcode in (5, 6):
+            if bool(self._concretise(parameter(0))) is (opcode == 5):
+                self._pc = self._concretise(parameter(1))
+        elif opcode == 9:
+            self._relative_base += self._concretise(parameter(0))
+        else:
+            self._pc = pc
+            return True
+        return False
+
+    def _address(self, raw: Value, mode: int) -> Value:
+        if mode == 0:
+            return raw
+        if mode == 2:
+            return affine(raw) + self._relative_base
+        raise ValueError(f"Unknown parameter mode {mode}.")
+
+    def _load(self, address: Value) -> Value:
+        if isinstance(address, int) or address.is_constant:
+            return self.memory.get(affine(address).constant, 0)
+        name = f"[{address}]"
+        if name not in self._loads:
+            cell = self.memory.get(self._peek(address), 0)
+            self._loads[name] = (address, cell)
+        return symbol(name)
+
+    def _multiply(self, first: Value, second: Value) -> Value:
+        first, second = affine(first), affine(second)
+        if first.is_constant:
+            return second.scale(first.constant)
+        if second.is_constant:
+            return first.scale(second.constant)
+        return first.scale(self._concretise(second))
+
+    def _peek(self, value: Value) -> int:
+        """The concrete value, without making any assumptions."""
+        value = affine(value)
+        return value.constant + sum(
+            coefficient * self._peek_symbol(name) for name, coefficient in value.terms
+        )
+
+    def _peek_symbol(self, name: str) -> int:
+        if name in self.values:
+            return self.values[name]
+        if name in self._loads:
+            return self._peek(self._loads[name][1])
+        return 0
+
+    def _symbol_value(self, name: str) -> int:
+        """The concrete value of a symbol, assuming what it depends on."""
+        if name in self.values:
+            return self.values[name]
+        if name not in self._loads:
+            # Symbols are zero unless given a value.
+            return self.values.setdefault(name, 0)
+        address, cell = self._loads[name]
+        self._concretise(address)
+        value = self.values[name] = self._concretise(cell)
+        return value
+
+    def _concretise(self, value: Value) -> int:
+        if isinstance(value, int):
+            return value
+        if value.is_constant:
+            return value.constant
+        known = {name: self._symbol_value(name) for name in value.symbols}
+        result = value.evaluate(known)
+        # Opaque symbols are fixed by the assumptions made to give their values.
+        expression = value.substitute(
+            {name: known[name] for name in value.symbols if name in self._loads}
+        )
+        if not expression.is_constant:
+            assumption = Assumption(expression, result)
+            if assumption not in self.assumptions:
+                self.assumptions.append(assumption)
+        return result
+
+
+def run_symbolic(
+    program: Iterable[Value],
+    patches: Optional[Dict[int, Value]] = None,
+    inputs: Iterable[Value] = (),
+    values: Optional[Dict[str, int]] = None,
+) -> SymbolicResult:
+    """Run the program with its memory patched, which may add symbols."""
+    machine = SymbolicIntCode(program, inputs, values)
+    machine.memory.update(patches or {})
+    return machine.run()
+
+
+def solve(
+    expression: Affine,
+    target: int,
+    ranges: Dict[str, range],
+    assumptions: Iterable[Assumption] = (),
+) -> Iterator[Dict[str, int]]:
+    """Find the symbol values within ranges that give the expression target.
+
+    The symbol with the largest range is solved for directly, while the
+    others are searched. Solutions must also satisfy the assumptions, as
+    the expression may not hold otherwise.
+    """
+    assumptions = list(assumptions)
+    unknown = set(expression.symbols).union(
+        *(a.expression.symbols for a in assumptions)
+    ) - set(ranges)
+    if unknown:
+        raise ValueError(f"No range given for {', '.join(sorted(unknown))}.")
+    solved = max(expression.symbols, key=lambda name: len(ranges[name]), default=None)
+    searched = [name for name in ranges if name != solved]
+    for searched_values in product(*(ranges[name] for name in searched)):
+        values = dict(zip(searched, searched_values))
+        if solved is not None:
+            remaining = target - expression.substitute(values).constant
+            value, remainder = divmod(remaining, expression.coefficient(solved))
+            if remainder or value not in ranges[solved]:
+                continue
+            values[solved] = value
+        elif expression.evaluate(values) != target:
+            continue
+        if all(assumption.holds(values) for assumption in assumptions):
+            yield values
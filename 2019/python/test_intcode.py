@@ -1,8 +1,34 @@
-from typing import List
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Set
 
 import pytest
 
-from intcode import IntCode
+import aoc
+import intcode_parallel
+from bench_intcode import countdown_program, recursion_program, sieve_program
+from intcode import (
+    ENGINES,
+    AwaitingInput,
+    HaltExecution,
+    IntCode,
+    MachineState,
+    parse_program,
+)
+from intcode_async import AsyncIntCode, connect, run_network
+from intcode_batch import BatchIntCode
+from intcode_cache import ExecutionCache
+from intcode_compiler import CompiledBlock
+from intcode_disassembler import control_flow_graph, find_code, format_listing, to_dot
+from intcode_fuzz import Outcome, engine_runner, fuzz, run_reference
+from intcode_image import MAGIC, ImageCache
+from intcode_memory import PAGE_SIZE, PagedMemory
+from intcode_profiler import Profiler
+from intcode_scheduler import InstructionBudgetExceeded, Scheduler
+from intcode_snapshot import SnapshotError
+from intcode_symbolic import Affine, Assumption, run_symbolic, solve, symbol
 
 
 @pytest.mark.parametrize(
@@ -50,10 +76,11 @@ def test_paramater_modes(
         ([3, 3, 1107, -1, 8, 3, 4, 3, 99], 2, 1),
     ],
 )
+@pytest.mark.parametrize("engine", ENGINES)
 def test_comparisons(
-    program: List[int], program_input: int, expected_output: int
+    program: List[int], program_input: int, expected_output: int, engine: str
 ) -> None:
-    computer = IntCode(program)
+    computer = IntCode(program, engine=engine)
     computer.pass_input(program_input)
     computer.run_until_halt()
     assert computer.read_output() == expected_output
@@ -72,8 +99,11 @@ def test_comparisons(
         ([3, 3, 1105, -1, 9, 1101, 0, 0, 12, 4, 12, 99, 1], 20, 1),
     ],
 )
-def test_jumps(program: List[int], program_input: int, expected_output: int) -> None:
-    computer = IntCode(program)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_jumps(
+    program: List[int], program_input: int, expected_output: int, engine: str
+) -> None:
+    computer = IntCode(program, engine=engine)
     computer.pass_input(program_input)
     computer.run_until_halt()
     assert computer.read_output() == expected_output
@@ -102,7 +132,10 @@ def test_jumps(program: List[int], program_input: int, expected_output: int) ->
         (16, 1001),
     ],
 )
-def test_larger_comparison(program_input: int, expected_output: int) -> None:
+@pytest.mark.parametrize("engine", ENGINES)
+def test_larger_comparison(
+    program_input: int, expected_output: int, engine: str
+) -> None:
     # fmt: off
     program = [
         3, 21, 1008, 21, 8, 20, 1005, 20, 22, 107, 8, 21, 20, 1006, 20, 31, 1106,
@@ -110,28 +143,762 @@ def test_larger_comparison(program_input: int, expected_output: int) -> None:
         1, 46, 1101, 1000, 1, 20, 4, 20, 1105, 1, 46, 98, 99
     ]
     # fmt: on
-    computer = IntCode(program)
+    computer = IntCode(program, engine=engine)
     computer.pass_input(program_input)
     computer.run_until_halt()
     assert computer.read_output() == expected_output
 
 
-def test_offset_addressing_and_large_memory_reproduce_input() -> None:
+@pytest.mark.parametrize("engine", ENGINES)
+def test_offset_addressing_and_large_memory_reproduce_input(engine: str) -> None:
     program = [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99]
-    computer = IntCode(program)
+    computer = IntCode(program, engine=engine)
     computer.run_until_halt()
     assert list(computer.output_queue) == program
 
 
-def test_output_16_digit_number() -> None:
+@pytest.mark.parametrize("engine", ENGINES)
+def test_output_16_digit_number(engine: str) -> None:
     program = [1102, 34915192, 34915192, 7, 4, 7, 99, 0]
-    computer = IntCode(program)
+    computer = IntCode(program, engine=engine)
     computer.run_until_halt()
     assert len(str(computer.read_output())) == 16
 
 
-def test_output_large_number() -> None:
+@pytest.mark.parametrize("engine", ENGINES)
+def test_output_large_number(engine: str) -> None:
     program = [104, 1125899906842624, 99]
-    computer = IntCode(program)
+    computer = IntCode(program, engine=engine)
     computer.run_until_halt()
     assert computer.read_output() == program[1]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_self_modifying_code_is_redecoded(engine: str) -> None:
+    # Outputs 7, overwrites its first instruction with a halt, then jumps back.
+    program = [104, 7, 1101, 0, 99, 0, 1105, 1, 0]
+    computer = IntCode(program, engine=engine)
+    computer.run_until_halt()
+    assert list(computer.output_queue) == [7]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_instruction_overwrites_the_next_opcode(engine: str) -> None:
+    # The add at 0 turns the multiply at 4 into an add, which stores 10 in 12.
+    program = [1101, 1000, 101, 4, 1102, 5, 5, 12, 4, 12, 99, 0, 0]
+    computer = IntCode(program, engine=engine)
+    computer.run_until_halt()
+    assert list(computer.output_queue) == [10]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_overwritten_instruction_pairs_are_refetched(engine: str) -> None:
+    # Outputs 2 + 5, turns the add at 4 into a multiply, then jumps back to
+    # output 2 * 5 and halt.
+    # fmt: off
+    program = [
+        1101, 1, 1, 30, 1001, 30, 5, 31, 4, 31, 1005, 32, 25, 1101, 1, 1001, 4,
+        1101, 0, 1, 32, 1105, 1, 0, 0, 99, 0, 0, 0, 0, 0, 0, 0
+    ]
+    # fmt: on
+    computer = IntCode(program, engine=engine)
+    computer.run_until_halt()
+    assert list(computer.output_queue) == [7, 10]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_jump_to_negative_address_runs_once(engine: str) -> None:
+    # Moves the relative base by one, then jumps to -1, which isn't code.
+    computer = IntCode([109, 1, 1105, 1, -1, 99], engine=engine)
+    with pytest.raises(KeyError):
+        computer.run()
+    assert computer._relative_addressing_base == 1
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_negative_opcodes_are_invalid(engine: str) -> None:
+    computer = IntCode([1105, 1, 3, -5], engine=engine)
+    with pytest.raises(ValueError):
+        computer.run()
+
+
+@pytest.mark.parametrize("limit", range(1, 8))
+def test_fused_engine_is_preempted_exactly(limit: int) -> None:
+    # Counts down from 100 in address 9, then halts.
+    program = [1001, 9, -1, 9, 1005, 9, 0, 99, 0, 100]
+    interpreted = IntCode(program)
+    fused = IntCode(program, engine="fused")
+    for computer in (interpreted, fused):
+        assert computer.run(max_instructions=limit) is MachineState.PREEMPTED
+    assert fused.instructions_executed == interpreted.instructions_executed == limit
+    assert fused._PC == interpreted._PC
+    assert fused._memory.to_list() == interpreted._memory.to_list()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_feed_and_drain(engine: str) -> None:
+    # Echoes its inputs until it reads a zero.
+    program = [3, 9, 4, 9, 1005, 9, 0, 99, 0, 0]
+    computer = IntCode(program, engine=engine)
+    computer.feed("Hi")
+    computer.feed(b"!\n")
+    computer.pass_input(1000)
+    computer.feed([0])
+    computer.run_until_halt()
+    assert computer.drain().tolist() == [72, 105, 33, 10, 1000, 0]
+    assert not computer.has_output()
+
+    computer = IntCode(program, engine=engine)
+    computer.feed("ok\n\0")
+    computer.run_until_halt()
+    assert computer.drain_text() == "ok\n\0"
+    computer = IntCode(program, engine=engine)
+    computer.feed([300, 0])
+    computer.run_until_halt()
+    with pytest.raises(ValueError):
+        computer.drain_bytes()
+
+
+def test_custom_input_action_ignores_queue() -> None:
+    computer = IntCode([3, 5, 4, 5, 99, 0], input_action=lambda: 7)  # type: ignore
+    computer.pass_input(1)
+    computer.run_until_halt()
+    assert list(computer.output_queue) == [7]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize(
+    "program,expected_output",
+    [
+        (sieve_program(100), 25),
+        (countdown_program(10), 0),
+        (recursion_program(50), 1275),
+    ],
+)
+def test_benchmark_programs(
+    program: List[int], expected_output: int, engine: str
+) -> None:
+    computer = IntCode(program, engine=engine)
+    computer.run_until_halt()
+    assert list(computer.output_queue) == [expected_output]
+    interpreted = IntCode(program)
+    interpreted.run_until_halt()
+    assert computer.instructions_executed == interpreted.instructions_executed
+
+
+def test_unknown_engine() -> None:
+    with pytest.raises(ValueError):
+        IntCode([99], engine="quantum")
+
+
+def test_compiled_store_into_running_block_falls_back() -> None:
+    # The first add overwrites the opcode of the output instruction in the
+    # same block, turning `104, 7` (output 7) into `4, 7` (output mem[7]).
+    program = [1101, 0, 4, 4, 104, 7, 99, 42]
+    computer = IntCode(program, engine="compiled")
+    computer.compile_threshold = 1
+    computer.run_until_halt()
+    assert list(computer.output_queue) == [42]
+    assert 4 in computer._modified_code
+
+
+def test_compiled_blocks_are_shared_between_patched_programs() -> None:
+    def block_for(noun: int) -> CompiledBlock:
+        computer = IntCode([1101, noun, 1, 9, 4, 9, 99, 0, 0, 0], engine="compiled")
+        computer.compile_threshold = 1
+        computer.run_until_halt()
+        assert list(computer.output_queue) == [noun + 1]
+        return computer._blocks[0]
+
+    first = block_for(1)
+    assert block_for(1) is first
+    assert block_for(2) is not first
+    assert block_for(1) is first
+
+
+def test_compiled_engine_interprets_cold_code() -> None:
+    computer = IntCode(countdown_program(10), engine="compiled")
+    computer.run_until_halt()
+    assert list(computer.output_queue) == [0]
+    # The loop at 0 is compiled on its second entry, but the jump at 4 is
+    # only entered once, before then.
+    assert set(computer._blocks) == {0}
+
+
+def test_compiled_clone_runs_independently() -> None:
+    program = [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99]
+    computer = IntCode(program, engine="compiled")
+    computer.run_until_halt()
+    clone = IntCode(program, engine="compiled").clone()
+    clone.run_until_halt()
+    assert list(clone.output_queue) == list(computer.output_queue) == program
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_far_memory_is_sparse(engine: str) -> None:
+    program = [1101, 1, 2, 100_000_000, 4, 100_000_000, 204, 200_000_000, 99]
+    computer = IntCode(program, engine=engine)
+    computer.run_until_halt()
+    assert list(computer.output_queue) == [3, 0]
+    assert computer._memory.allocated_pages == 2
+
+
+def test_paged_memory() -> None:
+    memory = PagedMemory([1, 2, 3])
+    assert memory[2] == 3
+    assert memory[10**12] == 0
+    memory[PAGE_SIZE + 1] = 7
+    assert memory.words(PAGE_SIZE - 1, 3) == [0, 0, 7]
+    assert len(memory) == PAGE_SIZE + 2
+    assert memory.allocated_pages == 2
+    with pytest.raises(IndexError):
+        memory[-1] = 1
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_clone_copies_pages_on_write(engine: str) -> None:
+    # Stores its input at address 3000, in a page of its own.
+    program = [3, 3000, 99]
+    computer = IntCode(program, engine=engine)
+    clone = computer.clone()
+    assert clone._memory.pages[0] is computer._memory.pages[0]
+
+    clone.pass_input(42)
+    clone.run_until_halt()
+    assert clone._memory[3000] == 42
+    assert computer._memory[3000] == 0
+    assert clone._memory.pages[0] is computer._memory.pages[0]
+
+    clone._store(1, 0)
+    assert clone._memory.pages[0] is not computer._memory.pages[0]
+    assert computer._memory[0] == 3
+
+
+def test_machines_share_loaded_image() -> None:
+    image = PagedMemory([1101, 1, 2, 0, 99])
+    first, second = IntCode(image), IntCode(image)
+    first.run_until_halt()
+    assert first._memory[0] == 3
+    assert second._memory[0] == image[0] == 1101
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_run_stops_for_input_output_and_halt(engine: str) -> None:
+    # Echoes each input doubled until it reads a zero.
+    program = [3, 15, 1006, 15, 14, 102, 2, 15, 15, 4, 15, 1105, 1, 0, 99, 0]
+    computer = IntCode(program, engine=engine)
+    assert computer.run() is MachineState.NEEDS_INPUT
+    assert computer.run() is MachineState.NEEDS_INPUT
+    computer.pass_input(3)
+    computer.pass_input(4)
+    assert computer.run(max_outputs=1) is MachineState.OUTPUT_READY
+    assert list(computer.output_queue) == [6]
+    assert computer.run() is MachineState.NEEDS_INPUT
+    assert list(computer.output_queue) == [6, 8]
+    computer.pass_input(0)
+    assert computer.run() is MachineState.HALTED
+    assert computer.has_halted()
+    assert computer.run() is MachineState.HALTED
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_run_until_halt_without_input(engine: str) -> None:
+    computer = IntCode([3, 0, 99], engine=engine)
+    with pytest.raises(AwaitingInput):
+        computer.run_until_halt()
+    computer.pass_input(5)
+    computer.run_until_halt()
+    assert computer._memory[0] == 5
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_output_action_raising_does_not_repeat_output(engine: str) -> None:
+    outputs: List[int] = []
+
+    def output_once_then_raise(value: int) -> None:
+        outputs.append(value)
+        if len(outputs) == 1:
+            raise RuntimeError("Output failed.")
+
+    computer = IntCode(
+        [104, 1, 104, 2, 99], engine=engine, output_action=output_once_then_raise
+    )
+    computer.compile_threshold = 1
+    with pytest.raises(RuntimeError):
+        computer.run()
+    assert computer.run() is MachineState.HALTED
+    assert outputs == [1, 2]
+    assert computer.instructions_executed == 3
+
+
+def test_async_ring_of_machines() -> None:
+    # Each machine adds one to its input and passes it on, three times over.
+    program = [3, 16, 101, 1, 16, 16, 4, 16, 1001, 17, -1, 17, 1005, 17, 0, 99, 0, 3]
+    machines = [AsyncIntCode(program) for _ in range(200)]
+    for machine, next_machine in zip(machines, machines[1:] + machines[:1]):
+        connect(machine, next_machine)
+    machines[0].pass_input(0)
+    asyncio.run(run_network(machines))
+    assert machines[0].inputs.get_nowait() == 600
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_run_is_preempted_after_instruction_limit(engine: str) -> None:
+    # Counts down from 100 in address 9, then halts.
+    program = [1001, 9, -1, 9, 1005, 9, 0, 99, 0, 100]
+    computer = IntCode(program, engine=engine)
+    assert computer.run(max_instructions=10) is MachineState.PREEMPTED
+    assert 10 <= computer.instructions_executed < 100
+    assert computer.run() is MachineState.HALTED
+    assert computer._memory[9] == 0
+
+
+def test_scheduler_routes_outputs_between_machines() -> None:
+    # Each machine adds one to its input and outputs it.
+    program = [3, 9, 101, 1, 9, 9, 4, 9, 99, 0]
+    machines = [IntCode(program) for _ in range(3)]
+    downstream = dict(zip(machines, machines[1:]))
+    scheduler = Scheduler(machines, route=lambda m, _: downstream.get(m), quantum=2)
+    assert scheduler.run() is False
+    machines[0].pass_input(10)
+    assert scheduler.run() is True
+    assert machines[-1].read_output() == 13
+    assert all(scheduler.stats[m].instructions == 4 for m in machines)
+    assert scheduler.instructions_executed == 12
+    assert scheduler.stats[machines[-1]].time_blocked > 0
+
+
+def test_scheduler_hands_input_to_blocked_machines() -> None:
+    # Outputs its input until it reads a zero.
+    program = [3, 9, 4, 9, 1005, 9, 0, 99, 0, 0]
+    inputs = [0, 1, 2]
+    scheduler = Scheduler(
+        [IntCode(program)], on_blocked=lambda m: m.pass_input(inputs.pop())
+    )
+    assert scheduler.run() is True
+    assert list(scheduler.machines[0].output_queue) == [2, 1, 0]
+
+
+def test_scheduler_instruction_budget() -> None:
+    scheduler = Scheduler([IntCode([1105, 1, 0])], instruction_budget=1000)
+    with pytest.raises(InstructionBudgetExceeded):
+        scheduler.run()
+    assert scheduler.instructions_executed == 1000
+
+
+def test_process_network() -> None:
+    # The same ring as the asyncio test, plus a machine outside the ring
+    # whose outputs aren't connected anywhere.
+    program = [3, 16, 101, 1, 16, 16, 4, 16, 1001, 17, -1, 17, 1005, 17, 0, 99, 0, 3]
+    machines = [intcode_parallel.ProcessIntCode(program) for _ in range(4)]
+    for machine, next_machine in zip(machines, machines[1:] + machines[:1]):
+        intcode_parallel.connect(machine, next_machine)
+    machines[0].pass_input(0)
+    loner = intcode_parallel.ProcessIntCode([104, 1, 104, 2, 99])
+    intcode_parallel.run_network(machines + [loner])
+    assert machines[0].inputs == [12]
+    assert loner.outputs == [1, 2]
+
+
+def test_process_network_deadlock() -> None:
+    # Each machine waits for two values before passing one on.
+    program = [3, 9, 3, 9, 4, 9, 99, 0, 0, 0]
+    machines = [intcode_parallel.ProcessIntCode(program) for _ in range(2)]
+    intcode_parallel.connect(machines[0], machines[1])
+    intcode_parallel.connect(machines[1], machines[0])
+    machines[0].pass_input(1)
+    with pytest.raises(intcode_parallel.NetworkDeadlocked):
+        intcode_parallel.run_network(machines)
+
+
+def test_process_network_sending_to_halted_machine() -> None:
+    # More output than fits in a pipe, sent to a machine that has halted.
+    sender = intcode_parallel.ProcessIntCode(
+        [104, 7, 1001, 10, -1, 10, 1005, 10, 0, 99, 50_000]
+    )
+    halted = intcode_parallel.ProcessIntCode([99])
+    intcode_parallel.connect(sender, halted)
+    intcode_parallel.run_network([sender, halted])
+    assert halted.inputs == [7] * 50_000
+
+
+def test_profiler_records_execution() -> None:
+    # Counts down from 3 in address 10, then outputs address 1000.
+    program = [1001, 10, -1, 10, 1005, 10, 0, 4, 1000, 99, 3]
+    computer = IntCode(program)
+    profiler = Profiler(trace_length=2)
+    profiler.attach(computer)
+    assert computer.run() is MachineState.HALTED
+    assert profiler.instructions == computer.instructions_executed == 8
+    assert profiler.opcodes == {1: 3, 5: 3, 4: 1, 99: 1}
+    assert profiler.hot_spots(1) == [(0, 3)]
+    assert profiler.reads[10] == 6
+    assert profiler.writes[10] == 3
+    assert profiler.peak_address == 1000
+    assert [entry.pc for entry in profiler.trace] == [7, 9]
+    assert json.loads(profiler.to_json())["opcodes"]["1"] == 3
+
+    Profiler.detach(computer)
+    assert computer.run() is MachineState.HALTED
+
+
+def test_disassembler_control_flow() -> None:
+    # Calls a subroutine at 13 that outputs its argument, after storing the
+    # return address 7, then overwrites its own halt with another halt.
+    program = [21101, 0, 7, 0, 1105, 1, 13, 1101, 0, 99, 11, 99, 0, 204, 1, 2106, 0, 0]
+    listing = format_listing(program).splitlines()
+    assert listing[:2] == ["     0  add  0, 7, [rb+0]", "     4  jnz  1, 13"]
+    assert listing[4] == "    12  data 0"
+    graph = control_flow_graph(program)
+    assert sorted(graph.blocks) == [0, 7, 13]
+    assert graph.edges == [(0, 13)]
+    assert graph.blocks[13].indirect_exit
+    assert graph.self_modifying_stores == {7: 11}
+    assert "b0 -> b13;" in to_dot(graph)
+
+
+@pytest.mark.parametrize(
+    "day,inputs,undecoded",
+    [
+        # Day 5 patches the opcode at 6 with its input before running it.
+        (5, [[1], [5]], {6}),
+        (9, [[1]], set()),
+    ],
+)
+def test_disassembler_finds_puzzle_code(
+    day: int, inputs: List[List[int]], undecoded: Set[int]
+) -> None:
+    program = parse_program(aoc.load_puzzle_input(2019, day))
+    executed = set()
+    for values in inputs:
+        computer = IntCode(program)
+        computer.feed(values)
+        with pytest.raises(HaltExecution):
+            while True:
+                executed.add(computer._PC)
+                computer.step()
+    assert executed - find_code(program).keys() == undecoded
+
+
+@pytest.mark.parametrize("compress_zero_runs", [False, True])
+def test_snapshot_round_trip(tmp_path: Path, compress_zero_runs: bool) -> None:
+    # Stores its first input far away, then waits for a second to echo.
+    program = [3, 5000, 3, 0, 4, 0, 99]
+    computer = IntCode(program, description="Echo", engine="compiled")
+    computer.pass_input(7)
+    assert computer.run() is MachineState.NEEDS_INPUT
+    computer.output_queue.append(-1)
+    path = tmp_path / "echo.snapshot"
+    computer.save(path, compress_zero_runs=compress_zero_runs)
+
+    loaded = IntCode.load(path)
+    assert repr(loaded) == "Echo"
+    assert loaded._engine == "compiled"
+    assert loaded.instructions_executed == computer.instructions_executed == 1
+    assert loaded._memory.to_list() == computer._memory.to_list()
+    # Pages stored whole are used in place, until written.
+    in_place = isinstance(loaded._memory.pages[0], memoryview)
+    assert in_place is not compress_zero_runs
+    # Saving over the snapshot leaves the machines loaded from it alone.
+    IntCode([99]).save(path)
+    loaded.pass_input(42)
+    assert loaded.run() is MachineState.HALTED
+    assert list(loaded.output_queue) == [-1, 42]
+    assert loaded._memory[5000] == 7
+
+
+def test_snapshot_rejects_other_files(tmp_path: Path) -> None:
+    path = tmp_path / "not.snapshot"
+    path.write_bytes(b"not a snapshot at all, just some bytes")
+    with pytest.raises(SnapshotError):
+        IntCode.load(path)
+    IntCode([99]).save(path)
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(SnapshotError):
+        IntCode.load(path)
+
+
+def test_execution_cache_restores_runs() -> None:
+    # Adds up its inputs in address 14 until it reads a zero, then outputs it.
+    program = [3, 13, 1, 13, 14, 14, 1005, 13, 0, 4, 14, 99, 0, 0, 0]
+    cache = ExecutionCache()
+    first, second = IntCode(program), IntCode(program)
+    assert cache.run(first, [3, 4]) is MachineState.NEEDS_INPUT
+    assert cache.run(second, [3, 4]) is MachineState.NEEDS_INPUT
+    assert cache.stats()[:3] == (1, 1, 0)
+    assert second._memory[14] == first._memory[14] == 7
+    assert second.instructions_executed == first.instructions_executed
+
+    assert cache.run(second, [0]) is MachineState.HALTED
+    assert list(second.output_queue) == [7]
+    assert first._memory[14] == 7
+    assert cache.run(first, [5, 0]) is MachineState.HALTED
+    assert list(first.output_queue) == [12]
+
+
+def test_execution_cache_keys_on_exact_state() -> None:
+    # Outputs the word at the relative base plus 5. In CPython, hash(-1) and
+    # hash(-2) are equal, so these states must be told apart by value.
+    program = [204, 5, 99, 30, 40]
+    cache = ExecutionCache()
+    outputs: List[int] = []
+    for relative_base in (-1, -2):
+        computer = IntCode(program)
+        computer._relative_addressing_base = relative_base
+        assert cache.run(computer) is MachineState.HALTED
+        outputs.extend(computer.output_queue)
+    assert outputs == [40, 30]
+    assert cache.stats()[:2] == (0, 2)
+
+
+def test_execution_cache_evicts_least_recently_used() -> None:
+    cache = ExecutionCache(max_bytes=PAGE_SIZE * 8 * 2)
+    for value in range(4):
+        # Each run leaves a distinct page of memory.
+        cache.run(IntCode([3, 5, 99, 0, 0, 0]), [value])
+    hits, misses, evictions, entries, size = cache.stats()
+    assert (hits, misses) == (0, 4)
+    assert evictions == 2 and entries == 2
+    assert size <= cache.max_bytes
+
+
+def test_execution_cache_skips_runs_bigger_than_the_cache() -> None:
+    cache = ExecutionCache(max_bytes=PAGE_SIZE * 8 * 2)
+    cache.run(IntCode([3, 5, 99, 0, 0, 0]), [1])
+    # Leaves three pages of memory, more than the whole cache holds.
+    program = [3, PAGE_SIZE, 3, 2 * PAGE_SIZE, 99]
+    assert cache.run(IntCode(program), [1, 2]) is MachineState.HALTED
+    hits, misses, evictions, entries, size = cache.stats()
+    assert (misses, evictions, entries) == (2, 0, 1)
+    assert size <= cache.max_bytes
+    computer = IntCode(program)
+    assert cache.run(computer, [1, 2]) is MachineState.HALTED
+    assert computer._memory[2 * PAGE_SIZE] == 2
+
+
+def test_batch_matches_single_machines() -> None:
+    # fmt: off
+    program = [
+        3, 21, 1008, 21, 8, 20, 1005, 20, 22, 107, 8, 21, 20, 1006, 20, 31, 1106,
+        0, 36, 98, 0, 0, 1002, 21, 125, 20, 4, 20, 1105, 1, 46, 104, 999, 1105,
+        1, 46, 1101, 1000, 1, 20, 4, 20, 1105, 1, 46, 98, 99
+    ]
+    # fmt: on
+    inputs = list(range(-1, 17))
+    batch = BatchIntCode(program, count=len(inputs), inputs=[[n] for n in inputs])
+    batch.run()
+    assert batch.halted.all()
+    for instance, value in enumerate(inputs):
+        computer = IntCode(program)
+        computer.pass_input(value)
+        computer.run_until_halt()
+        assert batch.output_values(instance) == list(computer.output_queue)
+
+
+def test_batch_relative_addressing_grows_memory() -> None:
+    program = [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99]
+    batch = BatchIntCode(program, count=3)
+    batch.run()
+    assert batch.halted.all()
+    assert all(batch.output_values(i) == program for i in range(3))
+
+
+def test_batch_waits_for_input() -> None:
+    # Adds up its inputs in address 14 until it reads a zero, then outputs it.
+    program = [3, 13, 1, 13, 14, 14, 1005, 13, 0, 4, 14, 99, 0, 0, 0]
+    batch = BatchIntCode(program, count=3, inputs=[[1, 2], [5, 0], []])
+    batch.run()
+    assert batch.waiting.tolist() == [True, False, True]
+    assert batch.halted.tolist() == [False, True, False]
+    batch.pass_input([0, 0], instances=[0, 2])
+    batch.run()
+    assert batch.halted.all()
+    assert [batch.output_values(i) for i in range(3)] == [[3], [5], [0]]
+
+
+def test_batch_failures_are_per_instance() -> None:
+    # Stores 2 at the address read as input, so a negative input fails.
+    program = [3, 5, 1101, 1, 1, 0, 99]
+    batch = BatchIntCode(program, count=2, inputs=[[-3], [20]])
+    batch.run()
+    assert batch.failed.tolist() == [True, False]
+    assert batch.halted.tolist() == [False, True]
+    assert batch.memory[1, 20] == 2
+
+    # Runs its input as the next instruction.
+    batch = BatchIntCode([3, 2, 0], count=2, inputs=[[99], [98]])
+    batch.run()
+    assert batch.halted.tolist() == [True, False]
+    assert batch.failed.tolist() == [False, True]
+
+
+def test_affine_expressions() -> None:
+    x, y = symbol("x"), symbol("y")
+    expression = (x.scale(3) + y + 4) - x
+    assert expression == Affine(4, (("x", 2), ("y", 1)))
+    assert str(expression) == "2*x + y + 4"
+    assert str(y.scale(-1) - 1) == "-1*y - 1"
+    assert expression.evaluate({"x": 5, "y": 1}) == 15
+    assert expression.substitute({"x": 5}) == y + 14
+    assert (expression - expression).is_constant
+
+
+def test_symbolic_execution_is_affine() -> None:
+    # Outputs 3 * input + [22], and stores the input's negation at 20.
+    program = [3, 20, 1002, 20, 3, 21, 1, 21, 22, 21, 4, 21, 1002, 20, -1, 20, 99]
+    result = run_symbolic(program, inputs=[symbol("n")], patches={22: symbol("p")})
+    assert result.outputs == [symbol("n").scale(3) + symbol("p")]
+    assert result.memory_at(20) == symbol("n").scale(-1)
+    assert result.assumptions == []
+    assert list(solve(result.outputs[0], 20, {"n": range(10), "p": range(3)})) == [
+        {"p": 2, "n": 6}
+    ]
+
+
+def test_symbolic_jump_makes_an_assumption() -> None:
+    # Outputs 1 if the input is 5, or 0 otherwise, by jumping.
+    program = [3, 20, 1001, 20, -5, 20, 1005, 20, 12, 104, 1, 99, 104, 0, 99]
+    result = run_symbolic(program, inputs=[symbol("n")], values={"n": 5})
+    assert result.outputs == [Affine(1)]
+    assert result.assumptions == [Assumption(symbol("n") - 5, 0)]
+    assert list(solve(Affine(1), 1, {"n": range(10)}, result.assumptions)) == [{"n": 5}]
+
+
+def test_symbolic_pointer_loads_are_opaque_until_used() -> None:
+    # Adds the words at the patched addresses into 3, then overwrites 3.
+    program = [1, 0, 0, 3, 1101, 2, 2, 3, 4, 3, 99]
+    result = run_symbolic(program, patches={1: symbol("a"), 2: symbol("b")})
+    assert result.outputs == [Affine(4)]
+    assert result.assumptions == []
+
+    # Outputs the word at the patched address.
+    result = run_symbolic([4, 0, 99], patches={1: symbol("a")}, values={"a": 2})
+    assert result.outputs == [symbol("[a]")]
+    assert result.assumptions == []
+    # Jumps if the word at the patched address is non-zero.
+    result = run_symbolic(
+        [1005, 0, 4, 99, 99], patches={1: symbol("a")}, values={"a": 3}
+    )
+    assert result.assumptions == [Assumption(symbol("a"), 3)]
+
+
+def test_symbolic_execution_rejects_negative_opcodes() -> None:
+    # divmod would make -1 opcode 99, halting rather than failing.
+    with pytest.raises(ValueError):
+        run_symbolic([-1])
+    with pytest.raises(ValueError):
+        IntCode([-1]).run()
+
+
+def test_image_cache_round_trip(tmp_path: Path) -> None:
+    text = ",".join(str(n) for n in range(-5, 2 * PAGE_SIZE)) + "\n"
+    image = ImageCache(tmp_path).load(text)
+    assert image.to_list() == parse_program(text)
+
+    cache = ImageCache(tmp_path)
+    loaded = cache.load(text)
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert loaded.to_list() == image.to_list()
+    assert cache.load(text) is loaded
+    machine = IntCode(loaded)
+    machine._store(7, 0)
+    assert loaded[0] == -5
+
+
+def test_image_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    image_bytes = len(MAGIC) + 8 * 100
+    cache = ImageCache(tmp_path, max_bytes=2 * image_bytes)
+    texts = [",".join([str(n)] * 100) for n in range(3)]
+    for seconds, text in enumerate(texts[:2], start=1):
+        before = set(tmp_path.glob("*.img"))
+        cache.load(text)
+        (path,) = set(tmp_path.glob("*.img")) - before
+        # Distinct times, however coarse the file system's timestamps.
+        os.utime(path, (seconds, seconds))
+    cache.load(texts[2])
+    assert cache.evictions == 1
+    assert len(list(tmp_path.glob("*.img"))) == 2
+    fresh = ImageCache(tmp_path)
+    fresh.load(texts[1])
+    fresh.load(texts[0])
+    assert (fresh.hits, fresh.misses) == (1, 1)
+
+
+def test_image_cache_ignores_bad_files(tmp_path: Path) -> None:
+    cache = ImageCache(tmp_path)
+    cache.load("1,0,0,0,99")
+    (path,) = tmp_path.glob("*.img")
+    path.write_bytes(MAGIC + b"\x01\x02")
+    fresh = ImageCache(tmp_path)
+    assert fresh.load("1,0,0,0,99").to_list() == [1, 0, 0, 0, 99]
+    assert fresh.misses == 1
+
+
+def test_image_cache_cleans_up_failed_writes(tmp_path: Path) -> None:
+    cache = ImageCache(tmp_path)
+    # Too large for a 64-bit word.
+    cache._write("0" * 32, [1, 2**63])
+    assert not list(tmp_path.iterdir())
+
+
+def test_image_cache_can_be_turned_off(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache = ImageCache(tmp_path, enabled=False)
+    assert cache.load("1,0,0,0,99").to_list() == [1, 0, 0, 0, 99]
+    assert not list(tmp_path.iterdir())
+    monkeypatch.setenv("INTCODE_IMAGE_CACHE", "off")
+    assert not ImageCache().enabled
+
+
+# Set these to fuzz for longer, or to reproduce a failure.
+FUZZ_SEED = int(os.environ.get("INTCODE_FUZZ_SEED", 2019))
+FUZZ_ITERATIONS = int(os.environ.get("INTCODE_FUZZ_ITERATIONS", 300))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engines_agree_with_reference_on_random_programs(engine: str) -> None:
+    mismatch = fuzz(FUZZ_SEED, FUZZ_ITERATIONS, [engine])
+    assert mismatch is None, mismatch.describe()
+
+
+def test_fuzzer_shrinks_counterexamples() -> None:
+    interpreter = engine_runner("interpreter")
+
+    def off_by_one(
+        program: List[int], inputs: List[int], max_instructions: int
+    ) -> Optional[Outcome]:
+        outcome = interpreter(program, inputs, max_instructions)
+        if outcome is None:
+            return None
+        return outcome._replace(outputs=tuple(x + 1 for x in outcome.outputs))
+
+    mismatch = fuzz(0, 100, runners={"off by one": off_by_one})
+    assert mismatch is not None
+    assert mismatch.engine == "off by one"
+    assert mismatch.program == [4]
+    assert mismatch.expected.outputs == (4,)
+
+
+def test_reference_interpreter() -> None:
+    # Reads an input into 9, outputs it doubled, and halts.
+    program = [3, 9, 1002, 9, 2, 9, 4, 9, 99]
+    outcome = run_reference(program, [21], 100)
+    assert outcome is not None
+    assert (outcome.status, outcome.outputs, outcome.instructions) == (
+        "halted",
+        (42,),
+        4,
+    )
+    assert dict(outcome.memory)[9] == 42
+    waiting = run_reference(program, [], 100)
+    assert waiting is not None and waiting.registers == (0, 0)
+    assert run_reference([1101, 1, 1, -1, 99], [], 100) == Outcome(
+        "raised IndexError",
+        ((0, 1101), (1, 1), (2, 1), (3, -1), (4, 99)),
+        (),
+        (),
+        None,
+        None,
+    )
+    assert run_reference([1105, 1, 0], [], 100) is None